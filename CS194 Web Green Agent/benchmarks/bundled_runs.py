@@ -0,0 +1,71 @@
+import os
+import re
+import sys
+
+# The recorded white-agent runs that ship with the repo, and helpers the
+# benchmark scripts use to find them and to import the green agent.
+
+WEB_GREEN_AGENT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+GREEN_AGENT_DIR = os.path.join(WEB_GREEN_AGENT_DIR, "green agent")
+WHITE_AGENTS_DIR = os.path.join(WEB_GREEN_AGENT_DIR, "white_agents")
+
+REFRIGERATOR_TASK_ID = "b7258ee05d75e6c50673a59914db412e_110325"
+IGN_TASK_ID = "aa4b5cb7114fcc138ade82b4b9716d24"
+
+BUNDLED_RUNS = [
+    {"name": "refrigerator-good", "task_id": REFRIGERATOR_TASK_ID,
+     "agent_dir": "US-appliance refridgerator white agents/static good white agent", "run_folder": "good_run"},
+    {"name": "refrigerator-careless", "task_id": REFRIGERATOR_TASK_ID,
+     "agent_dir": "US-appliance refridgerator white agents/static careless white agent", "run_folder": "careless_run"},
+    {"name": "ign-good", "task_id": IGN_TASK_ID,
+     "agent_dir": "IGN review white agents/static good white agent", "run_folder": "good_run"},
+    {"name": "ign-careless", "task_id": IGN_TASK_ID,
+     "agent_dir": "IGN review white agents/static careless white agent", "run_folder": "careless_run"},
+]
+
+def run_folder_path(run):
+    return os.path.join(WHITE_AGENTS_DIR, run["agent_dir"], run["run_folder"])
+
+def white_agent_script(run):
+    """Path of the Flask script that serves a bundled run."""
+    agent_dir = os.path.join(WHITE_AGENTS_DIR, run["agent_dir"])
+    scripts = sorted(f for f in os.listdir(agent_dir) if f.endswith(".py"))
+    return os.path.join(agent_dir, scripts[0])
+
+def step_number(filename):
+    match = re.search(r"(\d+)", filename)
+    return int(match.group(1)) if match else -1
+
+def load_run_screenshots(run):
+    """Returns [(filename, png_bytes)] for a bundled run, in step order."""
+    folder = run_folder_path(run)
+    files = sorted((f for f in os.listdir(folder) if f.endswith((".png", ".jpg"))), key=step_number)
+    screenshots = []
+    for filename in files:
+        with open(os.path.join(folder, filename), "rb") as f:
+            screenshots.append((filename, f.read()))
+    return screenshots
+
+def import_green_agent():
+    """Imports green_agent_server from the 'green agent' folder."""
+    if GREEN_AGENT_DIR not in sys.path:
+        sys.path.insert(0, GREEN_AGENT_DIR)
+    import green_agent_server
+    return green_agent_server
+
+def load_tasks(server):
+    """
+    The bundled tasks from the local task store if there is one. Otherwise
+    placeholder descriptions are used, which is fine for the stand-in judge.
+    """
+    store = server.TaskStore.open(server.TASKS_FILE_NAME)
+    tasks, source = {}, "task store"
+    for run in BUNDLED_RUNS:
+        task_id = run["task_id"]
+        if store is not None and task_id in store:
+            tasks[task_id] = store[task_id]
+        else:
+            source = "placeholder"
+            tasks[task_id] = {"task_id": task_id, "website": "https://example.com",
+                              "confirmed_task": f"Replay of the bundled {run['name'].split('-')[0]} run"}
+    return tasks, source
@@ -0,0 +1,91 @@
+import sys
+import json
+import time
+import argparse
+
+from bundled_runs import BUNDLED_RUNS, GREEN_AGENT_DIR, load_run_screenshots, import_green_agent
+
+sys.path.insert(0, GREEN_AGENT_DIR)
+from screenshot_preprocess import PreprocessConfig, preprocess_screenshot
+
+# Compares screenshot preprocessing settings on the bundled runs: how many
+# bytes each one sends to the vision model and, with --judge, how often its
+# Step 2 scores agree with the unprocessed screenshots.
+#
+#   python preprocess_benchmark.py [--judge] [--json results.json]
+
+CONFIGS = {
+    "original": PreprocessConfig(),
+    "edge1280-png": PreprocessConfig(max_edge=1280),
+    "edge1280-jpeg80": PreprocessConfig(max_edge=1280, image_format="JPEG", quality=80),
+    "edge1024-webp75": PreprocessConfig(max_edge=1024, image_format="WEBP", quality=75),
+    "jpeg85": PreprocessConfig(image_format="JPEG", quality=85),
+}
+
+def measure_sizes(screenshots, config):
+    start = time.perf_counter()
+    sent = sum(preprocess_screenshot(data, config)[1] for _, data in screenshots)
+    return sent, time.perf_counter() - start
+
+def judge_scores(server, run, screenshots, config):
+    task = server.OM2W_TASKS[run["task_id"]]
+    key_points = server.get_key_points(run["task_id"], task['confirmed_task'])
+    scores = []
+    for _, data in screenshots:
+        _, score = server.llm_call_step_2(task['confirmed_task'], key_points, data,
+                                          log=lambda line: None, preprocess=config)
+        scores.append(score)
+    return scores
+
+def agreement(scores, baseline, threshold):
+    same_score = sum(a == b for a, b in zip(scores, baseline))
+    same_verdict = sum((a >= threshold) == (b >= threshold) for a, b in zip(scores, baseline))
+    return round(same_score / len(baseline), 4), round(same_verdict / len(baseline), 4)
+
+def main():
+    parser = argparse.ArgumentParser(description="Screenshot preprocessing benchmark")
+    parser.add_argument("--judge", action="store_true",
+                        help="Also score every frame with the vision model (needs GOOGLE_API_KEY and the task dataset)")
+    parser.add_argument("--json", help="Write the results to this file")
+    args = parser.parse_args()
+
+    server = None
+    if args.judge:
+        server = import_green_agent()
+        # A fresh in-memory cache so every setting really calls the model
+        server.judge_cache = server.JudgeCache(cache_dir=None)
+        server.load_om2w_tasks()
+
+    results = []
+    for run in BUNDLED_RUNS:
+        screenshots = load_run_screenshots(run)
+        original_bytes = sum(len(data) for _, data in screenshots)
+        baseline = judge_scores(server, run, screenshots, CONFIGS["original"]) if server else None
+        for name, config in CONFIGS.items():
+            sent, seconds = measure_sizes(screenshots, config)
+            row = {
+                "run": run["name"],
+                "config": name,
+                "frames": len(screenshots),
+                "original_bytes": original_bytes,
+                "sent_bytes": sent,
+                "saved_pct": round(100 * (1 - sent / original_bytes), 1),
+                "preprocess_seconds": round(seconds, 3),
+            }
+            if server:
+                scores = baseline if name == "original" else judge_scores(server, run, screenshots, config)
+                row["scores"] = scores
+                row["score_agreement"], row["verdict_agreement"] = agreement(
+                    scores, baseline, server.SCREENSHOT_THRESHOLD)
+            results.append(row)
+            agree = f"  score agree {row['score_agreement']:.0%}  verdict agree {row['verdict_agreement']:.0%}" if server else ""
+            print(f"{run['name']:<22} {name:<16} {sent / 1e6:7.2f} MB of {original_bytes / 1e6:.2f} MB "
+                  f"({row['saved_pct']:5.1f}% saved, {seconds:.2f}s){agree}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Wrote {len(results)} rows to {args.json}")
+
+if __name__ == '__main__':
+    main()
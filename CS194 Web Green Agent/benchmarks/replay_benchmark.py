@@ -0,0 +1,313 @@
+import os
+import sys
+import json
+import time
+import socket
+import logging
+import platform
+import argparse
+import tempfile
+import threading
+import contextlib
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from bundled_runs import (BUNDLED_RUNS, WEB_GREEN_AGENT_DIR, GREEN_AGENT_DIR, WHITE_AGENTS_DIR,
+                          white_agent_script, run_folder_path, import_green_agent, load_tasks)
+
+# End-to-end benchmark of the green agent: replays the bundled refrigerator
+# and IGN runs through /start_assessment against the local stand-in judge
+# and reports per-stage latency, throughput at several concurrency levels
+# and peak RSS. Results are written as JSON named after the current commit,
+# so runs on two commits can be compared with --compare.
+#
+#   python replay_benchmark.py [--concurrency 1,2,4,8] [--rounds 2] [--judge-latency-ms 300]
+#                              [--warm [--result-store]] [--json FILE] [--compare OLD.json]
+#                              [--replay-server [--participants N] [--white-agent-step-ms MS] ...]
+#
+# With --replay-server the runs are served by one replay_white_agent.py
+# process instead of the four static white agents, optionally as several
+# participants per run and with the white agent's latency and bandwidth
+# shaped like a real browsing agent.
+
+STAGES = ["step_1", "white_agent", "screenshot_enqueue", "step_2", "step_3", "total"]
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+# Runs a white agent's Flask app on the given port instead of its fixed one
+WHITE_AGENT_LAUNCHER = (
+    "import sys, importlib.util\n"
+    "spec = importlib.util.spec_from_file_location('white_agent', sys.argv[1])\n"
+    "agent = importlib.util.module_from_spec(spec)\n"
+    "spec.loader.exec_module(agent)\n"
+    "agent.app.run(port=int(sys.argv[2]), threaded=True)\n"
+)
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def wait_for_port(port, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        with contextlib.suppress(OSError), socket.create_connection(("127.0.0.1", port), timeout=1):
+            return
+        time.sleep(0.1)
+    raise RuntimeError(f"Nothing is listening on port {port} after {timeout}s")
+
+def start_white_agents():
+    """Starts one white agent per bundled run. Returns ({run name: [url]}, processes)."""
+    urls, processes = {}, []
+    for run in BUNDLED_RUNS:
+        script = white_agent_script(run)
+        port = free_port()
+        processes.append(subprocess.Popen([sys.executable, "-c", WHITE_AGENT_LAUNCHER, script, str(port)],
+                                          cwd=os.path.dirname(script),
+                                          stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL))
+        urls[run["name"]] = [f"http://127.0.0.1:{port}"]
+    for run_urls in urls.values():
+        wait_for_port(int(run_urls[0].rsplit(":", 1)[1]))
+    return urls, processes
+
+def start_replay_server(participants=1, latency_ms=0, step_ms=0, bandwidth_kbps=0):
+    """
+    Serves every bundled run from one replay white agent, as `participants`
+    participant URLs per run. Returns ({run name: [url]}, [process]).
+    """
+    port = free_port()
+    process = subprocess.Popen([sys.executable, os.path.join(WHITE_AGENTS_DIR, "replay_white_agent.py"),
+                                "--port", str(port), "--latency-ms", str(latency_ms), "--step-ms", str(step_ms),
+                                "--bandwidth-kbps", str(bandwidth_kbps)],
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    wait_for_port(port)
+    listed = requests.get(f"http://127.0.0.1:{port}/runs", timeout=30).json()["runs"]
+    by_folder = {os.path.normcase(os.path.abspath(r["folder"])): r["participant_url"] for r in listed}
+    urls = {}
+    for run in BUNDLED_RUNS:
+        url = by_folder[os.path.normcase(os.path.abspath(run_folder_path(run)))]
+        urls[run["name"]] = [url] if participants <= 1 else [f"{url}/agents/p{n}" for n in range(participants)]
+    return urls, [process]
+
+def start_green_agent(server):
+    from werkzeug.serving import make_server
+    http_server = make_server("127.0.0.1", 0, server.app, threaded=True)
+    threading.Thread(target=http_server.serve_forever, daemon=True).start()
+    return http_server, f"http://127.0.0.1:{http_server.server_port}"
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+def summarize(values):
+    return {"mean": round(sum(values) / len(values), 4) if values else None,
+            "p50": percentile(values, 50), "p95": percentile(values, 95)}
+
+def run_level(server, green_url, white_urls, tasks, concurrency, requests_count, warm, first_replay):
+    """Runs requests_count assessments with `concurrency` clients. Returns the level's results."""
+    jobs = []
+    for n in range(requests_count):
+        run = BUNDLED_RUNS[n % len(BUNDLED_RUNS)]
+        task_id = run["task_id"]
+        if not warm:
+            # A task of its own for every replay, so no judgement or key point is reused
+            replay_id = f"{task_id}-replay-{first_replay + n}"
+            server.OM2W_TASKS[replay_id] = dict(tasks[task_id], task_id=replay_id,
+                confirmed_task=f"{tasks[task_id]['confirmed_task']} (replay {first_replay + n})")
+            task_id = replay_id
+        run_urls = white_urls[run["name"]]
+        jobs.append({"task_id": task_id, "participant_url": run_urls[(n // len(BUNDLED_RUNS)) % len(run_urls)]})
+
+    def assess(job):
+        started = time.perf_counter()
+        response = requests.post(f"{green_url}/start_assessment", json=job, timeout=600)
+        latency = time.perf_counter() - started
+        payload = response.json()
+        return (response.status_code, latency, payload.get("timings", {}),
+                payload.get("critical_path", {}).get("stages", []))
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(assess, jobs))
+    wall = time.perf_counter() - started
+
+    ok = [(latency, timings) for status, latency, timings, _ in results if status == 200]
+    # How often each stage was on an assessment's critical path
+    critical_path = {}
+    for status, _, _, stages in results:
+        for stage in stages if status == 200 else []:
+            critical_path[stage] = critical_path.get(stage, 0) + 1
+    return {
+        "concurrency": concurrency,
+        "assessments": len(jobs),
+        "errors": len(jobs) - len(ok),
+        "wall_seconds": round(wall, 3),
+        "throughput_per_min": round(60 * len(ok) / wall, 2),
+        "latency": summarize([latency for latency, _ in ok]),
+        "stages": {stage: summarize([timings[stage] for _, timings in ok if stage in timings])
+                   for stage in STAGES},
+        "critical_path": critical_path,
+    }
+
+def peak_rss_bytes():
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+def current_commit():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short=12", "HEAD"], cwd=WEB_GREEN_AGENT_DIR,
+                                capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=WEB_GREEN_AGENT_DIR,
+                               capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+    return f"{commit}-dirty" if dirty else commit
+
+def print_level(level):
+    stages = "  ".join(f"{stage} {level['stages'][stage]['mean']}" for stage in STAGES)
+    print(f"concurrency {level['concurrency']:>3}: {level['throughput_per_min']:8.2f} assessments/min  "
+          f"p50 {level['latency']['p50']:.2f}s  p95 {level['latency']['p95']:.2f}s  errors {level['errors']}")
+    print(f"                 mean stage seconds: {stages}")
+    print(f"                 on the critical path: {level.get('critical_path', {})}")
+
+def compare(results, old_path):
+    with open(old_path) as f:
+        old = json.load(f)
+    print(f"\nCompared with {old.get('commit')} ({old_path}):")
+    old_levels = {level["concurrency"]: level for level in old["levels"]}
+
+    def change(new, before):
+        if new is None or not before:
+            return "    n/a"
+        return f"{100 * (new - before) / before:+6.1f}%"
+
+    for level in results["levels"]:
+        before = old_levels.get(level["concurrency"])
+        if before is None:
+            continue
+        # Results saved before a stage was added or renamed show n/a for it
+        stages = "  ".join(f"{stage} {change(level['stages'][stage]['mean'], before['stages'].get(stage, {}).get('mean'))}"
+                           for stage in STAGES)
+        print(f"concurrency {level['concurrency']:>3}: throughput "
+              f"{change(level['throughput_per_min'], before['throughput_per_min'])}  "
+              f"p50 {change(level['latency']['p50'], before['latency']['p50'])}  {stages}")
+    print(f"peak RSS {change(results['peak_rss_bytes'], old.get('peak_rss_bytes'))}")
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end replay benchmark")
+    parser.add_argument("--concurrency", default="1,2,4,8",
+                        help="Comma-separated numbers of concurrent clients (default 1,2,4,8)")
+    parser.add_argument("--rounds", type=int, default=2,
+                        help="Assessments per level = rounds * max(concurrency, number of bundled runs)")
+    parser.add_argument("--judge-latency-ms", type=float, default=300, help="Stand-in judge latency per call")
+    parser.add_argument("--judge-jitter-ms", type=float, default=100, help="Stand-in judge latency jitter")
+    parser.add_argument("--warm", action="store_true",
+                        help="Replay the real task ids so judgement and key point caches are reused")
+    parser.add_argument("--result-store", action="store_true",
+                        help="Keep the result store on, so with --warm repeated trajectories get the stored verdict")
+    parser.add_argument("--json", help="Write the results here (default results/replay-<commit>.json)")
+    parser.add_argument("--compare", help="Earlier results file to compare against")
+    parser.add_argument("--verbose", action="store_true", help="Show the green agent's own output")
+    parser.add_argument("--replay-server", action="store_true",
+                        help="Serve the runs from one replay_white_agent.py instead of the static white agents")
+    parser.add_argument("--participants", type=int, default=1,
+                        help="With --replay-server, participant URLs per run (default 1)")
+    parser.add_argument("--white-agent-latency-ms", type=float, default=0,
+                        help="With --replay-server, delay before the white agent answers")
+    parser.add_argument("--white-agent-step-ms", type=float, default=0,
+                        help="With --replay-server, delay per step of the replayed run")
+    parser.add_argument("--white-agent-bandwidth-kbps", type=float, default=0,
+                        help="With --replay-server, transfer rate cap per white agent response")
+    args = parser.parse_args()
+    levels = [int(c) for c in args.concurrency.split(",")]
+    json_path = os.path.abspath(args.json or os.path.join(RESULTS_DIR, "replay-{commit}.json"))
+    compare_path = os.path.abspath(args.compare) if args.compare else None
+
+    # The green agent reads its settings at import time; run it against the
+    # stand-in judge with all its files in a scratch directory.
+    os.environ["JUDGE_BACKEND"] = "local"
+    os.environ["LOCAL_JUDGE_LATENCY_MS"] = str(args.judge_latency_ms)
+    os.environ["LOCAL_JUDGE_JITTER_MS"] = str(args.judge_jitter_ms)
+    os.environ.setdefault("JUDGE_CACHE_DIR", "")
+    os.environ["RESULT_STORE_PATH"] = "results.db" if args.result_store else ""
+    os.environ["OM2W_TASKS_FILE"] = os.path.abspath(
+        os.environ.get("OM2W_TASKS_FILE", os.path.join(GREEN_AGENT_DIR, "tasks.store")))
+    workdir = tempfile.mkdtemp(prefix="replay_benchmark_")
+    os.chdir(workdir)
+    server = import_green_agent()
+    if not args.verbose:
+        logging.getLogger("werkzeug").setLevel(logging.WARNING)
+    tasks, tasks_source = load_tasks(server)
+    server.OM2W_TASKS = dict(tasks)
+
+    if args.replay_server:
+        white_urls, processes = start_replay_server(args.participants, args.white_agent_latency_ms,
+                                                    args.white_agent_step_ms, args.white_agent_bandwidth_kbps)
+    else:
+        white_urls, processes = start_white_agents()
+    http_server, green_url = start_green_agent(server)
+    print(f"Green agent at {green_url}, white agents: {white_urls}")
+    print(f"Stand-in judge {args.judge_latency_ms}ms +/- {args.judge_jitter_ms}ms, "
+          f"{'warm' if args.warm else 'cold'} caches, tasks from {tasks_source}, scratch dir {workdir}")
+
+    results = {
+        "benchmark": "replay",
+        "commit": current_commit(),
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "settings": {
+            "judge_latency_ms": args.judge_latency_ms,
+            "judge_jitter_ms": args.judge_jitter_ms,
+            "warm": args.warm,
+            "result_store": args.result_store,
+            "rounds": args.rounds,
+            "tasks": tasks_source,
+            "step_2_max_workers": server.STEP_2_MAX_WORKERS,
+            "judge_max_concurrency": server.JUDGE_MAX_CONCURRENCY,
+            "white_agents": "replay server" if args.replay_server else "static",
+            "participants_per_run": args.participants if args.replay_server else 1,
+            "white_agent_shaping": {"latency_ms": args.white_agent_latency_ms, "step_ms": args.white_agent_step_ms,
+                                    "bandwidth_kbps": args.white_agent_bandwidth_kbps} if args.replay_server else None,
+        },
+        "levels": [],
+    }
+    try:
+        replays = 0
+        devnull = open(os.devnull, "w")
+        for concurrency in levels:
+            count = args.rounds * max(concurrency, len(BUNDLED_RUNS))
+            output = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(devnull)
+            with output:
+                level = run_level(server, green_url, white_urls, tasks, concurrency, count, args.warm, replays)
+            replays += count
+            results["levels"].append(level)
+            print_level(level)
+    finally:
+        http_server.shutdown()
+        for process in processes:
+            process.terminate()
+
+    # Peak RSS of this process: the green agent plus the benchmark's clients
+    results["peak_rss_bytes"] = peak_rss_bytes()
+    if results["peak_rss_bytes"]:
+        print(f"Peak RSS: {results['peak_rss_bytes'] / 2 ** 20:.1f} MiB")
+
+    path = json_path.format(commit=results["commit"])
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Wrote results to {path}")
+
+    if compare_path:
+        compare(results, compare_path)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,135 @@
+import os
+import json
+import time
+import base64
+import argparse
+import tempfile
+import threading
+import contextlib
+
+from bundled_runs import BUNDLED_RUNS, GREEN_AGENT_DIR, load_run_screenshots, import_green_agent, load_tasks
+
+# Compares one-screenshot-per-request Step 2 judging with batched judging
+# (STEP_2_BATCH_SIZE) on the bundled runs: vision calls, prompt and response
+# tokens, time, frames that had to fall back to a single-image call, and how
+# often the batched scores agree with the single-image ones.
+#
+#   python step2_batch_benchmark.py [--batch-sizes 2,4,8] [--backend local|gemini] [--json results.json]
+
+class CountingBackend:
+    """Wraps the judge backend and counts Step 2 calls and tokens."""
+    def __init__(self, backend):
+        self.backend = backend
+        self.name = getattr(backend, "name", "judge")
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.calls = 0
+            self.prompt_tokens = 0
+            self.cached_tokens = 0
+            self.response_tokens = 0
+
+    def __getattr__(self, name):
+        # Everything else, e.g. prefix caching, is the wrapped backend's
+        return getattr(self.backend, name)
+
+    def generate(self, step, contents, **options):
+        response = self.backend.generate(step, contents, **options)
+        if step == 2:
+            with self._lock:
+                self.calls += 1
+                self.prompt_tokens += response.prompt_tokens or 0
+                self.cached_tokens += response.cached_tokens or 0
+                self.response_tokens += response.response_tokens or 0
+        return response
+
+def judge_run(server, task, key_points, screenshots, batch_size, max_workers):
+    """Step 2 over one run. Returns ({frame index: score}, counters, seconds)."""
+    scores = {}
+
+    def progress(event, **details):
+        if event == "screenshot_scored":
+            scores[details["index"]] = details["score"]
+
+    counters = server.RunCounters()
+    started = time.perf_counter()
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        server.score_screenshots(task, key_points, screenshots, max_workers=max_workers, progress=progress,
+                                 counters=counters, dedupe_distance=-1, batch_size=batch_size)
+    return scores, counters, time.perf_counter() - started
+
+def agreement(scores, baseline, threshold):
+    same_score = sum(scores.get(i) == score for i, score in baseline.items())
+    same_verdict = sum(((scores.get(i) or 0) >= threshold) == ((score or 0) >= threshold)
+                       for i, score in baseline.items())
+    return round(same_score / len(baseline), 4), round(same_verdict / len(baseline), 4)
+
+def main():
+    parser = argparse.ArgumentParser(description="Batched Step 2 judging benchmark")
+    parser.add_argument("--batch-sizes", default="2,4,8", help="Comma-separated batch sizes (default 2,4,8)")
+    parser.add_argument("--backend", default="local", choices=["local", "gemini"],
+                        help="Judge to use; gemini needs GOOGLE_API_KEY and the task dataset (default local)")
+    parser.add_argument("--judge-latency-ms", type=float, default=300, help="Stand-in judge latency per call")
+    parser.add_argument("--max-workers", type=int, default=4, help="Step 2 requests in flight per run")
+    parser.add_argument("--json", help="Write the results to this file")
+    args = parser.parse_args()
+    batch_sizes = [int(k) for k in args.batch_sizes.split(",")]
+    json_path = os.path.abspath(args.json) if args.json else None
+
+    # The green agent reads its settings at import time; keep its files in a scratch directory
+    os.environ["JUDGE_BACKEND"] = args.backend
+    os.environ["LOCAL_JUDGE_LATENCY_MS"] = str(args.judge_latency_ms)
+    os.environ["JUDGE_CACHE_DIR"] = ""
+    os.environ["OM2W_TASKS_FILE"] = os.path.abspath(
+        os.environ.get("OM2W_TASKS_FILE", os.path.join(GREEN_AGENT_DIR, "tasks.store")))
+    os.chdir(tempfile.mkdtemp(prefix="step2_batch_benchmark_"))
+    server = import_green_agent()
+    tasks, tasks_source = load_tasks(server)
+    backend = CountingBackend(server.judge_backend)
+    server.judge_backend = backend
+    print(f"Judge: {args.backend}, tasks from {tasks_source}, {args.max_workers} requests in flight per run")
+
+    results = []
+    for run in BUNDLED_RUNS:
+        task = tasks[run["task_id"]]["confirmed_task"]
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            key_points = server.get_key_points(run["task_id"], task)
+        screenshots = [base64.b64encode(data).decode("ascii") for _, data in load_run_screenshots(run)]
+        baseline = None
+        for batch_size in [1] + batch_sizes:
+            # A fresh in-memory cache so every mode really calls the judge
+            server.judge_cache = server.JudgeCache(cache_dir=None, max_memory_entries=0)
+            backend.reset()
+            scores, counters, seconds = judge_run(server, task, key_points, screenshots, batch_size,
+                                                  args.max_workers)
+            baseline = baseline or scores
+            row = {
+                "run": run["name"],
+                "batch_size": batch_size,
+                "frames": len(screenshots),
+                "vision_calls": backend.calls,
+                "prompt_tokens": backend.prompt_tokens,
+                "cached_tokens": backend.cached_tokens,
+                "response_tokens": backend.response_tokens,
+                "seconds": round(seconds, 3),
+                "batch_fallbacks": counters.get("step_2_batch_fallbacks"),
+                "scores": [scores.get(i) for i in range(len(screenshots))],
+            }
+            row["score_agreement"], row["verdict_agreement"] = agreement(scores, baseline,
+                                                                         server.SCREENSHOT_THRESHOLD)
+            results.append(row)
+            print(f"{run['name']:<22} batch {batch_size:>2}: {row['vision_calls']:3d} calls  "
+                  f"{row['prompt_tokens']:7d} prompt ({row['cached_tokens']:7d} cached) + "
+                  f"{row['response_tokens']:5d} response tokens  "
+                  f"{seconds:6.2f}s  fallbacks {row['batch_fallbacks']:2d}  "
+                  f"score agree {row['score_agreement']:.0%}  verdict agree {row['verdict_agreement']:.0%}")
+
+    if json_path:
+        with open(json_path, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Wrote {len(results)} rows to {json_path}")
+
+if __name__ == '__main__':
+    main()
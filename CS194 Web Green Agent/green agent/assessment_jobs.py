@@ -0,0 +1,145 @@
+import time
+import uuid
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+# Background execution of assessments. A job is submitted, runs on a worker
+# thread and records progress events as it goes; clients poll its status,
+# stream its events or fetch the result once it is finished.
+
+class QueueFullError(Exception):
+    """Raised when a job is submitted while the queue is already full."""
+
+class AssessmentJob:
+    def __init__(self, job_id, description):
+        self.job_id = job_id
+        self.description = description
+        self.status = "queued"  # queued -> running -> done | error
+        self.stage = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.result = None
+        self.http_status = None
+        self.events = []
+        self._changed = threading.Condition()
+
+    def emit(self, event, **details):
+        """Records a progress event; used as the pipeline's progress callback."""
+        with self._changed:
+            if event == "stage_started":
+                self.stage = details.get("stage")
+            self.events.append({"seq": len(self.events), "time": time.time(), "event": event, **details})
+            self._changed.notify_all()
+
+    def finished(self):
+        return self.status in ("done", "error")
+
+    def events_since(self, since, timeout=None):
+        """
+        Returns events with seq >= since, waiting up to timeout seconds for
+        new ones if there are none yet and the job is still going.
+        """
+        with self._changed:
+            if len(self.events) <= since and not self.finished():
+                self._changed.wait(timeout)
+            return self.events[since:]
+
+    def summary(self):
+        with self._changed:
+            return {
+                "job_id": self.job_id,
+                "status": self.status,
+                "stage": self.stage,
+                "created_at": self.created_at,
+                "started_at": self.started_at,
+                "finished_at": self.finished_at,
+                "events": len(self.events),
+                **self.description,
+            }
+
+    def _set_status(self, status):
+        with self._changed:
+            self.status = status
+            self._changed.notify_all()
+
+class JobManager:
+    def __init__(self, max_workers=4, max_queue_depth=64, max_finished_jobs=1000):
+        self.max_queue_depth = max_queue_depth
+        self.max_finished_jobs = max_finished_jobs
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="assessment")
+        self._jobs = OrderedDict()
+        self._pending = 0  # jobs queued or running
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)  # notified whenever a job finishes
+
+    def submit(self, fn, description, **kwargs):
+        """
+        Queues fn(progress=job.emit, **kwargs), which must return a
+        (payload, http_status) tuple. Raises QueueFullError if too many jobs
+        are already waiting or running.
+        """
+        with self._lock:
+            if self._pending >= self.max_queue_depth:
+                raise QueueFullError(f"Assessment queue is full ({self.max_queue_depth} jobs)")
+            job = AssessmentJob(uuid.uuid4().hex, description)
+            self._jobs[job.job_id] = job
+            self._pending += 1
+            self._prune()
+        self._executor.submit(self._run, job, fn, kwargs)
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def stats(self):
+        with self._lock:
+            statuses = [job.status for job in self._jobs.values()]
+            return {
+                "pending": self._pending,
+                "max_queue_depth": self.max_queue_depth,
+                **{s: statuses.count(s) for s in ("queued", "running", "done", "error")},
+            }
+
+    def shutdown(self, wait=True, timeout=None):
+        """
+        Stops accepting jobs. With wait, waits for queued and running jobs to
+        finish, for at most timeout seconds. Returns False if some were still
+        pending when it gave up.
+        """
+        self._executor.shutdown(wait=False)
+        if not wait:
+            return True
+        deadline = None if timeout is None else time.time() + timeout
+        with self._idle:
+            while self._pending:
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._idle.wait(remaining)
+        return True
+
+    def _run(self, job, fn, kwargs):
+        job.started_at = time.time()
+        job._set_status("running")
+        try:
+            job.result, job.http_status = fn(progress=job.emit, **kwargs)
+            status = "done"
+        except Exception as e:
+            print(f"Assessment job {job.job_id} crashed: {e}")
+            job.result, job.http_status = {"error": f"Assessment crashed: {e}"}, 500
+            status = "error"
+        job.finished_at = time.time()
+        with self._lock:
+            self._pending -= 1
+            self._idle.notify_all()
+        job.emit("job_finished", status=status, http_status=job.http_status)
+        job._set_status(status)
+
+    def _prune(self):
+        """Forgets the oldest finished jobs once there are too many (caller holds self._lock)."""
+        finished = [jid for jid, job in self._jobs.items() if job.finished()]
+        for jid in finished[:max(0, len(finished) - self.max_finished_jobs)]:
+            del self._jobs[jid]
@@ -0,0 +1,97 @@
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+# Helpers for running many assessments at once: a dispatcher that keeps a
+# separate concurrency limit per white agent, and the aggregate report for
+# a finished batch.
+
+def run_scheduled(items, key, run, max_workers, per_key_limit):
+    """
+    Calls run(index, item) for every item, with at most max_workers calls in
+    flight overall and at most per_key_limit for any one key(item). Keys are
+    served round-robin, so one slow participant cannot hold up the others.
+    Returns the results in item order.
+    """
+    queues = OrderedDict()
+    for index, item in enumerate(items):
+        queues.setdefault(key(item), deque()).append(index)
+
+    results = [None] * len(items)
+    active = {k: 0 for k in queues}
+    state = {"in_flight": 0, "remaining": len(items)}
+    changed = threading.Condition()
+
+    def finished(k):
+        with changed:
+            active[k] -= 1
+            state["in_flight"] -= 1
+            state["remaining"] -= 1
+            changed.notify()
+
+    def work(k, index):
+        try:
+            results[index] = run(index, items[index])
+        finally:
+            finished(k)
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="batch") as pool:
+        with changed:
+            while state["remaining"]:
+                dispatched = True
+                while dispatched and state["in_flight"] < max_workers:
+                    dispatched = False
+                    for k, queue in queues.items():
+                        if queue and active[k] < per_key_limit and state["in_flight"] < max_workers:
+                            active[k] += 1
+                            state["in_flight"] += 1
+                            pool.submit(work, k, queue.popleft())
+                            dispatched = True
+                changed.wait()
+    return results
+
+def parse_batch_items(raw_items):
+    """
+    Accepts a list of {"task_id": ..., "participant_url": ...} objects or
+    [task_id, participant_url] pairs and returns them as dicts. Raises
+    ValueError on anything else.
+    """
+    if not isinstance(raw_items, list) or not raw_items:
+        raise ValueError("'items' must be a non-empty list")
+    items = []
+    for i, raw in enumerate(raw_items):
+        if isinstance(raw, dict):
+            items.append(raw)
+        elif isinstance(raw, (list, tuple)) and len(raw) == 2:
+            items.append({"task_id": raw[0], "participant_url": raw[1]})
+        else:
+            raise ValueError(f"Item {i} must be an object or a [task_id, participant_url] pair")
+    return items
+
+def summarize_batch(item_results):
+    """
+    Success rates overall and per participant for a finished batch. Only
+    assessments that reached a verdict count as judged; a white agent that
+    failed to respond (a "failure" with an error status) is an error.
+    """
+    def rates(results):
+        judged = [r for r in results
+                  if r["http_status"] == 200 and r["webjudge_status"] in ("success", "failure")]
+        successes = sum(1 for r in judged if r["webjudge_status"] == "success")
+        return {
+            "items": len(results),
+            "judged": len(judged),
+            "successes": successes,
+            "errors": len(results) - len(judged),
+            "success_rate": round(successes / len(judged), 4) if judged else None,
+        }
+
+    by_participant = {}
+    for r in item_results:
+        if isinstance(r["participant_url"], str):  # anything else was rejected, and is only in the overall count
+            by_participant.setdefault(r["participant_url"], []).append(r)
+
+    return {
+        "overall": rates(item_results),
+        "per_participant": {url: rates(results) for url, results in by_participant.items()},
+    }
@@ -0,0 +1,53 @@
+import io
+import threading
+from PIL import Image
+
+# Perceptual-hash deduplication of trajectory frames. Frames whose dHash is
+# within a small Hamming distance of a frame that has already been scored
+# reuse that frame's Step 2 judgement instead of costing a vision call.
+
+def dhash(image_data, hash_size=16):
+    """
+    Difference hash of an encoded image: shrink to (hash_size + 1) x hash_size
+    greyscale and record whether each pixel is brighter than its right-hand
+    neighbour. Returns a hash_size * hash_size bit integer.
+    """
+    image = Image.open(io.BytesIO(image_data))
+    image.draft("L", (hash_size * 8, hash_size * 8))  # speeds up JPEG decoding, no-op for PNG
+    pixels = image.convert("L").resize((hash_size + 1, hash_size), Image.BILINEAR).tobytes()
+    value = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+def hamming_distance(a, b):
+    return bin(a ^ b).count("1")
+
+class FrameDeduper:
+    """
+    Tracks the frames of one trajectory that are actually being scored. For
+    each new frame, match() returns the earliest scored frame within
+    max_distance, or registers the frame as a new one to score.
+    """
+    def __init__(self, max_distance, hash_size=16):
+        self.max_distance = max_distance
+        self.hash_size = hash_size
+        self._scored = []  # [(index, hash)]
+        self._lock = threading.Lock()
+
+    def match(self, index, image_data=None, frame_hash=None):
+        """
+        Returns (matched_index, distance) or None if the frame must be scored.
+        Pass frame_hash instead of image_data if the frame is already hashed.
+        """
+        if frame_hash is None:
+            frame_hash = dhash(image_data, self.hash_size)
+        with self._lock:
+            for scored_index, scored_hash in self._scored:
+                distance = hamming_distance(frame_hash, scored_hash)
+                if distance <= self.max_distance:
+                    return scored_index, distance
+            self._scored.append((index, frame_hash))
+        return None
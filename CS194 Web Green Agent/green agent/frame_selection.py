@@ -0,0 +1,113 @@
+import os
+import time
+import threading
+from frame_dedupe import hamming_distance
+
+# Budgeted Step 2: when a trajectory has more frames than the assessment
+# may spend vision calls or time on, judge the most telling frames first
+# and stop once the budget is spent or enough key screenshots are found.
+#
+# Frames are ranked by cheap local signals, in this order:
+#   final        - the last few frames, where the outcome usually shows
+#   after_click  - frames taken right after a CLICK in the action history
+#   change       - every other frame, by how much it differs from the
+#                  previous one (dHash Hamming distance)
+# Ties go to the later frame.
+
+PRIORITY_REASONS = ("final", "after_click", "change")
+
+class Step2Budget:
+    def __init__(self, max_vision_calls=0, max_seconds=0, enough_key_screenshots=0, final_frames=2):
+        self.max_vision_calls = max_vision_calls              # 0 = no limit
+        self.max_seconds = max_seconds                        # 0 = no limit
+        self.enough_key_screenshots = enough_key_screenshots  # 0 = judge until the budget is spent
+        self.final_frames = final_frames
+
+    def enabled(self):
+        return bool(self.max_vision_calls or self.max_seconds or self.enough_key_screenshots)
+
+    def summary(self):
+        return {"max_vision_calls": self.max_vision_calls, "max_seconds": self.max_seconds,
+                "enough_key_screenshots": self.enough_key_screenshots, "final_frames": self.final_frames}
+
+    @classmethod
+    def from_env(cls):
+        """
+        Reads STEP_2_MAX_VISION_CALLS, STEP_2_TIME_BUDGET_SECONDS,
+        STEP_2_ENOUGH_KEY_SCREENSHOTS and STEP_2_FINAL_FRAMES. With the first
+        three unset every frame is judged, in order, as it arrives.
+        """
+        return cls(max_vision_calls=int(os.environ.get("STEP_2_MAX_VISION_CALLS", "0")),
+                   max_seconds=float(os.environ.get("STEP_2_TIME_BUDGET_SECONDS", "0")),
+                   enough_key_screenshots=int(os.environ.get("STEP_2_ENOUGH_KEY_SCREENSHOTS", "0")),
+                   final_frames=int(os.environ.get("STEP_2_FINAL_FRAMES", "2")))
+
+def frames_after_clicks(frame_count, action_history):
+    """
+    Indices of frames taken right after a CLICK. Frame i follows action i;
+    if there are more frames than actions, the extra leading frames are
+    taken before the first action.
+    """
+    offset = max(0, frame_count - len(action_history or []))
+    indices = set()
+    for n, action in enumerate(action_history or []):
+        command = action.get("command", "") if isinstance(action, dict) else str(action)
+        if "CLICK" in command.upper() and n + offset < frame_count:
+            indices.add(n + offset)
+    return indices
+
+def rank_frames(hashes, action_history, final_frames=2, hash_size=16):
+    """
+    Orders the frames of a trajectory for a budgeted Step 2, given each
+    frame's dHash (frame_dedupe.dhash; None where it couldn't be computed).
+    Returns [(index, reason, change)] most telling first, where change is
+    the Hamming distance to the previous frame (None if unknown).
+    """
+    changes, previous = [], None
+    for frame_hash in hashes:
+        changes.append(hamming_distance(frame_hash, previous)
+                       if frame_hash is not None and previous is not None else None)
+        previous = frame_hash
+    if changes:
+        changes[0] = hash_size * hash_size  # the first frame is all new
+
+    clicks = frames_after_clicks(len(hashes), action_history)
+    ranked = []
+    for index, change in enumerate(changes):
+        if index >= len(hashes) - final_frames:
+            reason = "final"
+        elif index in clicks:
+            reason = "after_click"
+        else:
+            reason = "change"
+        ranked.append((index, reason, change))
+    ranked.sort(key=lambda r: (PRIORITY_REASONS.index(r[1]), -(r[2] or 0), -r[0]))
+    return ranked
+
+class BudgetTracker:
+    """Spending against a Step2Budget during one assessment's Step 2."""
+    def __init__(self, budget, counters=None):
+        self.budget = budget
+        self.counters = counters
+        self.started = time.perf_counter()
+        self.key_screenshots = 0
+        self._lock = threading.Lock()
+
+    def vision_calls(self):
+        return self.counters.get("step_2_vision_calls") if self.counters is not None else 0
+
+    def record_score(self, score, threshold):
+        if score is not None and score >= threshold:
+            with self._lock:
+                self.key_screenshots += 1
+
+    def stop_reason(self, in_flight=0):
+        """Why no further frame should be judged, or None to carry on."""
+        budget = self.budget
+        if budget.enough_key_screenshots and self.key_screenshots >= budget.enough_key_screenshots:
+            return "enough_key_screenshots"
+        if budget.max_vision_calls and self.vision_calls() + in_flight >= budget.max_vision_calls:
+            return "vision_call_budget"
+        if budget.max_seconds and time.perf_counter() - self.started >= budget.max_seconds:
+            return "time_budget"
+        return None
@@ -1,32 +1,387 @@
 import os
 import re
+import sys
 import json
-import requests
 import base64
 import io
-import google.generativeai as genai
-from flask import Flask, request, jsonify
+import time
+import hashlib
+import argparse
+import queue
+import logging
+import threading
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, as_completed, wait
+from flask import Flask, Response, request, jsonify
 from PIL import Image
-from datasets import load_dataset
+from judge_cache import JudgeCache, make_judgement_key
+from key_point_store import KeyPointStore, key_point_version
+from result_store import ResultStore, judge_version, trajectory_hash
+from assessment_jobs import JobManager, QueueFullError
+from batch_scheduler import run_scheduled, parse_batch_items, summarize_batch
+from trajectory_stream import Trajectory, TrajectoryError, RUN_TASK_ACCEPT
+from screenshot_preprocess import PreprocessConfig, preprocess_screenshot
+from frame_selection import Step2Budget, BudgetTracker, rank_frames
+from frame_dedupe import FrameDeduper, dhash
+from task_store import TaskStore, build_task_store
+from judge_scheduler import JudgeScheduler
+from stage_graph import StageGraph
+from prompt_templates import PromptTemplate, PrefixCache
+from judge_backends import create_judge_backend
+from metrics import MetricsRegistry, BYTES_BUCKETS, COUNT_BUCKETS
+from trace_store import TraceStore, NULL_TRACE, SUMMARY
+from screenshot_archive import ScreenshotArchive
+from screenshot_memory import Screenshot, MemoryBudget, screenshot_data, release_screenshot
+from white_agent_client import WhiteAgentClient, CircuitOpenError
 
 # --- Configuration ---
 app = Flask(__name__)
+
+# Bulky per-assessment detail (raw judge responses, key points, every
+# screenshot's reasoning) is logged at DEBUG, so concurrent assessments
+# don't flood stdout; it is also kept in the assessment's trace.
+# Set GREEN_AGENT_LOG_LEVEL=DEBUG to print it.
+logger = logging.getLogger("green_agent")
+logger.setLevel(os.environ.get("GREEN_AGENT_LOG_LEVEL", "INFO").upper())
+if not logger.handlers:
+    _log_handler = logging.StreamHandler(sys.stdout)
+    _log_handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(_log_handler)
+    logger.propagate = False
 OM2W_TASKS = {}
-TASKS_FILE_NAME = "tasks.json"
-global_run_counter = 0
+# Local memory-mapped copy of the dataset, built on first start (--refresh-tasks rebuilds it)
+TASKS_FILE_NAME = os.environ.get("OM2W_TASKS_FILE", "tasks.store")
+# With OM2W_OFFLINE=1 tasks only ever come from TASKS_FILE_NAME, never from Hugging Face
+OM2W_OFFLINE = os.environ.get("OM2W_OFFLINE", "0") == "1"
 
-# Configure the Gemini API client
-genai.configure(api_key=os.environ.get("GOOGLE_API_KEY"))
-text_model = genai.GenerativeModel('gemini-2.0-flash-lite')
-vision_model = genai.GenerativeModel('gemini-2.0-flash-lite')
+# Judge models: Gemini by default, JUDGE_BACKEND=local for the offline stand-in
+judge_backend = create_judge_backend()
 SCREENSHOT_THRESHOLD = 4 
+# Max number of Step 2 vision calls in flight per assessment (1 = sequential)
+STEP_2_MAX_WORKERS = int(os.environ.get("STEP_2_MAX_WORKERS", "4"))
+# Screenshots judged together in one multi-image Step 2 request (1 = one per request)
+STEP_2_BATCH_SIZE = int(os.environ.get("STEP_2_BATCH_SIZE", "1"))
+
+# Crop/downscale/re-encode screenshots before Step 2 (off unless configured)
+SCREENSHOT_PREPROCESS = PreprocessConfig.from_env()
+
+# Frames whose perceptual hash is within this Hamming distance of an
+# already scored frame reuse its Step 2 judgement. Off (-1) by default, as
+# it changes which frames are judged; 2 only matches identical-looking frames
+FRAME_DEDUPE_MAX_DISTANCE = int(os.environ.get("FRAME_DEDUPE_MAX_DISTANCE", "-1"))
+FRAME_HASH_SIZE = int(os.environ.get("FRAME_HASH_SIZE", "16"))
+
+# Per-assessment Step 2 budget: max vision calls, wall time and how many key
+# screenshots are enough. When set, the most telling frames are judged first
+# and the rest are skipped once the budget runs out (see frame_selection.py)
+STEP_2_BUDGET = Step2Budget.from_env()
+
+# Judge model calls from all assessments share one scheduler: at most
+# JUDGE_MAX_CONCURRENCY in flight, requests and tokens per minute capped to
+# the provider's quota (0 = no cap), 429/5xx retried after the provider's
+# hint, and Step 3 calls served before Step 1 and Step 2 ones
+JUDGE_MAX_CONCURRENCY = int(os.environ.get("JUDGE_MAX_CONCURRENCY", "8"))
+judge_scheduler = JudgeScheduler(
+    max_concurrency=JUDGE_MAX_CONCURRENCY,
+    requests_per_minute=int(os.environ.get("JUDGE_REQUESTS_PER_MINUTE", "0")),
+    tokens_per_minute=int(os.environ.get("JUDGE_TOKENS_PER_MINUTE", "0")),
+    max_retries=int(os.environ.get("JUDGE_MAX_RETRIES", "3")),
+    backoff_base=float(os.environ.get("JUDGE_BACKOFF_BASE_SECONDS", "1")),
+    backoff_max=float(os.environ.get("JUDGE_BACKOFF_MAX_SECONDS", "60")),
+    on_wait=lambda step, seconds: JUDGE_WAIT_SECONDS.observe(seconds, step=step),
+    on_retry=lambda step, status, delay: JUDGE_RETRIES.inc(step=step, status=status),
+)
+
+# Batch assessments: total assessments in flight, and per white agent
+BATCH_MAX_WORKERS = int(os.environ.get("BATCH_MAX_WORKERS", "16"))
+BATCH_PER_PARTICIPANT_CONCURRENCY = int(os.environ.get("BATCH_PER_PARTICIPANT_CONCURRENCY", "2"))
+
+# Rendered Step 2 prompt prefixes (instructions, task and key points), shared
+# by every screenshot of an assessment and, where the backend supports it,
+# held by the provider as cached context so calls only send the image
+prefix_cache = PrefixCache(
+    max_entries=int(os.environ.get("JUDGE_PREFIX_CACHE_ENTRIES", "64")),
+    ttl_seconds=int(os.environ.get("JUDGE_PREFIX_CACHE_TTL_SECONDS", "600")),
+    use_backend_cache=os.environ.get("JUDGE_PREFIX_CACHE", "1") != "0",
+    call=judge_scheduler.call,
+)
+
+# Step 2 judgement cache (set JUDGE_CACHE_DIR to "" to keep it in memory only)
+judge_cache = JudgeCache(
+    cache_dir=os.environ.get("JUDGE_CACHE_DIR", "judge_cache"),
+    max_memory_entries=int(os.environ.get("JUDGE_CACHE_MEMORY_ENTRIES", "1024")),
+    max_disk_bytes=int(os.environ.get("JUDGE_CACHE_MAX_DISK_MB", "64")) * 1024 * 1024,
+)
+
+# Step 1 key points per task_id, filled on demand or with --precompute-key-points
+key_point_store = KeyPointStore(os.environ.get("KEY_POINTS_FILE", "key_points.json"))
+
+# Finished assessments by task, participant and trajectory, for leaderboards;
+# resubmitting a trajectory that was already judged returns the stored
+# verdict without calling the judge (set RESULT_STORE_PATH to "" to disable)
+RESULT_STORE_PATH = os.environ.get("RESULT_STORE_PATH", "results.db")
+result_store = ResultStore(RESULT_STORE_PATH) if RESULT_STORE_PATH else None
+
+# Received screenshots, stored once per distinct image with a manifest per
+# run, written by a background thread and capped in size and run count.
+# A run still being received keeps its images; one left unfinished by a
+# worker that died stops counting after SCREENSHOT_ARCHIVE_ABANDONED_RUN_SECONDS
+screenshot_archive = ScreenshotArchive(
+    os.environ.get("SCREENSHOT_ARCHIVE_DIR", "screenshot_archive"),
+    max_bytes=int(os.environ.get("SCREENSHOT_ARCHIVE_MAX_MB", "1024")) * 1024 * 1024,
+    max_runs=int(os.environ.get("SCREENSHOT_ARCHIVE_MAX_RUNS", "0")),
+    abandoned_run_seconds=float(os.environ.get("SCREENSHOT_ARCHIVE_ABANDONED_RUN_SECONDS", "3600")),
+)
+
+# Screenshots held in memory by all running assessments. Past this budget an
+# assessment stops reading its white agent's response until frames that have
+# been scored and archived are released (0 = no limit)
+screenshot_memory = MemoryBudget(
+    max_bytes=int(os.environ.get("SCREENSHOT_MEMORY_BUDGET_MB", "512")) * 1024 * 1024,
+    max_wait=float(os.environ.get("SCREENSHOT_MEMORY_WAIT_SECONDS", "30")),
+)
+
+# White agent calls: a keep-alive connection pool per participant, retries
+# with jittered backoff on transient errors, and a circuit breaker that stops
+# calling a participant after repeated failures
+white_agent_client = WhiteAgentClient(
+    connect_timeout=float(os.environ.get("WHITE_AGENT_CONNECT_TIMEOUT", "5")),
+    read_timeout=float(os.environ.get("WHITE_AGENT_READ_TIMEOUT", "300")),
+    retries=int(os.environ.get("WHITE_AGENT_RETRIES", "2")),
+    failure_threshold=int(os.environ.get("WHITE_AGENT_BREAKER_FAILURES", "5")),
+    reset_seconds=float(os.environ.get("WHITE_AGENT_BREAKER_RESET_SECONDS", "60")),
+)
+
+# Background executor for /assessments jobs
+assessment_jobs = JobManager(
+    max_workers=int(os.environ.get("ASSESSMENT_WORKERS", "4")),
+    max_queue_depth=int(os.environ.get("ASSESSMENT_QUEUE_DEPTH", "64")),
+)
+
+# Set by drain() when the server is shutting down; new assessments are refused
+draining = threading.Event()
+
+# Prometheus-style metrics served at /metrics
+metrics = MetricsRegistry()
+STAGE_SECONDS = metrics.histogram("green_agent_stage_seconds",
+                                  "Wall-clock seconds per assessment stage.", ["stage"])
+ASSESSMENTS = metrics.counter("green_agent_assessments_total",
+                              "Finished assessments by WebJudge status.", ["status"])
+WHITE_AGENT_BYTES = metrics.histogram("green_agent_white_agent_payload_bytes",
+                                      "Bytes received from the white agent per run.", ["transport"],
+                                      buckets=BYTES_BUCKETS)
+SCREENSHOTS_PER_RUN = metrics.histogram("green_agent_screenshots_per_run",
+                                        "Screenshots in each received trajectory.", buckets=COUNT_BUCKETS)
+VISION_CALLS = metrics.counter("green_agent_step_2_frames_total",
+                               "Step 2 frames by outcome: vision call issued or skipped (cache hit, near duplicate, over budget).",
+                               ["outcome"])
+JUDGE_CALL_SECONDS = metrics.histogram("green_agent_judge_call_seconds",
+                                       "Judge model call latency, excluding the wait for a slot.", ["step"])
+JUDGE_WAIT_SECONDS = metrics.histogram("green_agent_judge_slot_wait_seconds",
+                                       "Time judge calls waited in the judge scheduler's queue.", ["step"])
+JUDGE_RETRIES = metrics.counter("green_agent_judge_retries_total",
+                                "Judge calls retried after a rate limit or server error.", ["step", "status"])
+JUDGE_QUEUE_DEPTH = metrics.gauge("green_agent_judge_queue_depth", "Judge calls waiting in the scheduler.",
+                                  lambda: judge_scheduler.stats()["queued_by_step"], ["step"])
+JUDGE_TOKENS = metrics.counter("green_agent_judge_tokens_total",
+                               "Judge model tokens as reported by the backend.", ["step", "kind"])
+PARSE_FAILURES = metrics.counter("green_agent_parse_failures_total",
+                                 "Judge responses the parser could not read.", ["parser"])
+SCREENSHOT_MEMORY_BYTES = metrics.gauge("green_agent_screenshot_memory_bytes",
+                                        "Bytes of received screenshots held in memory.",
+                                        lambda: screenshot_memory.stats()["in_use_bytes"])
+SCREENSHOT_WRITE_SECONDS = metrics.gauge("green_agent_screenshot_write_seconds",
+                                         "Seconds the screenshot archive's writer spent decoding and writing frames.",
+                                         lambda: screenshot_archive.stats()["write_seconds"])
+CRITICAL_PATH_STAGES = metrics.counter("green_agent_critical_path_stage_total",
+                                       "Assessments whose critical path went through each stage.", ["stage"])
+STORED_RESULTS = metrics.counter("green_agent_stored_results_total",
+                                 "Assessments stored in the result store, or answered from it.", ["outcome"])
+ERRORS = metrics.counter("green_agent_errors_total", "Errors by stage and exception type.", ["stage", "type"])
+
+def record_error(stage, error):
+    ERRORS.inc(stage=stage, type=type(error).__name__)
+
+# Per-assessment traces (spans, raw judge responses, action histories),
+# kept in memory and written to TRACE_DIR in the background; see /traces/<id>
+trace_store = TraceStore(
+    capacity=int(os.environ.get("TRACE_BUFFER_SIZE", "200")),
+    spill_dir=os.environ.get("TRACE_DIR", "traces") or None,
+    sample_rate=float(os.environ.get("TRACE_SAMPLE_RATE", "1")),
+    verbosity=os.environ.get("TRACE_VERBOSITY", "summary"),
+)
+
+# --- WebJudge Prompts ---
+
+# PROMPT 1:"
+PROMPT_STEP_1 = """
+    You are an expert tasked with analyzing a given task to identify the key points explicitly
+    stated in the task description.
+    **Objective**: Carefully analyze the task description and extract the critical elements
+    explicitly mentioned in the task for achieving its goal.
+    **Instructions**:
+    1. Read the task description carefully.
+    2. Identify and extract **key points** directly stated in the task description.
+    - A **key point** is a critical element, condition, or step explicitly mentioned in the task
+    description.
+    - Do not infer or add any unstated elements.
+    - Words such as "best," "highest," "cheapest," "latest," "most recent," "lowest," "closest," "highest-
+    rated," "largest," and "newest" must go through the sort function (e.g., the key point should be
+    "Filter by highest").
+    **Respond with**:
+    - **Key Points**: A numbered list of the explicit key points for completing this task, one per
+    line, without explanations or additional details.
+    Task: (task)
+    """
+
+# PROMPT 2:"
+PROMPT_STEP_2 = """
+    You are an expert evaluator tasked with determining whether an image contains information
+    about the necessary steps to complete a task.
+    **Objective**: Analyze the provided image and decide if it shows essential steps or evidence
+    required for completing the task.
+    Use your reasoning to explain your decision before assigning
+    a score.
+    **Instructions**:
+    1. Provide a detailed description of the image, including its contents, visible elements, text (if
+    any), and any notable features.
+    2. Carefully examine the image and evaluate whether it contains necessary steps or evidence
+    crucial to task completion:
+    - Identify key points that could be relevant to task completion, such as actions, progress
+    indicators, tool usage, applied filters, or step-by-step instructions.
+    - Does the image show actions, progress indicators, or critical information directly related to
+    completing the task?
+    - Is this information indispensable for understanding or ensuring task success?
+    - If the image contains partial but relevant information, consider its usefulness rather than
+    dismissing it outright.
+    3. Provide your response in the following format:
+    - **Reasoning**: [Your explanation]
+    **Score**: [1-5]
+    **Task**: (task)
+    **Key Points for Task Completion**: (key points)
+    The snapshot of the web page is shown in the image.
+    """
+
+# PROMPT 2 (batched): the same judgement for several labelled images at once
+PROMPT_STEP_2_BATCH = """
+    You are an expert evaluator tasked with determining whether each of several images contains
+    information about the necessary steps to complete a task.
+    **Objective**: Analyze each provided image and decide if it shows essential steps or evidence
+    required for completing the task.
+    Use your reasoning to explain your decision before assigning
+    a score to each image.
+    **Instructions**:
+    1. For each image, provide a detailed description of the image, including its contents, visible
+    elements, text (if any), and any notable features.
+    2. Carefully examine each image and evaluate whether it contains necessary steps or evidence
+    crucial to task completion:
+    - Identify key points that could be relevant to task completion, such as actions, progress
+    indicators, tool usage, applied filters, or step-by-step instructions.
+    - Does the image show actions, progress indicators, or critical information directly related to
+    completing the task?
+    - Is this information indispensable for understanding or ensuring task success?
+    - If the image contains partial but relevant information, consider its usefulness rather than
+    dismissing it outright.
+    3. Judge every image on its own; the images are labelled Image 1 to Image (count) in the order
+    they are given. Provide your response in the following format, with one block per image, in order:
+    **Image 1**
+    - **Reasoning**: [Your explanation]
+    **Score**: [1-5]
+    **Image 2**
+    - **Reasoning**: [Your explanation]
+    **Score**: [1-5]
+    (and so on for every image)
+    **Task**: (task)
+    **Key Points for Task Completion**: (key points)
+    The snapshots of the web pages are shown in the images.
+    """
+
+# PROMPT 3:"
+PROMPT_STEP_3 = """
+    You are an expert in evaluating the performance of a web navigation agent.
+    The agent is
+    designed to help a human user navigate a website to complete a task.
+    Given the user's task,
+    the agent's action history, key points for task completion, some potentially important web
+    pages in the agent's trajectory and their reasons, your goal is to determine whether the agent
+    has completed the task and achieved all requirements.
+    Your response must strictly follow the following evaluation criteria!
+    *Important Evaluation Criteria*:
+    1: The filtered results must be displayed correctly. If filters were not properly applied
+    (i.e., missing selection, missing confirmation, or no visible effect in results), the task is not
+    considered successful.
+    2: You must carefully check whether these snapshots and action history meet these key points.
+    Ensure that specific filter conditions, such as "best," "highest," "cheapest," "latest," "most
+    recent," "lowest," "closest," "highest-rated," "largest," and "newest" are correctly applied using
+    the filter function (e.g., sort function).
+    3: Certain key points or requirements should be applied by the filter.
+    Otherwise, a search with
+    all requirements as input will be deemed a failure since it cannot guarantee that all results
+    meet the requirements!
+    4: If the task requires filtering by a specific range of money, years, or the number of beds and
+    bathrooms, the applied filter must exactly match the given requirement.
+    Any deviation results
+    in failure. To ensure the task is successful, the applied filter must precisely match the specified
+    range without being too broad or too narrow.
+    Examples of Failure Cases:
+    - If the requirement is less than \$50, but the applied filter is less than \$25, it is a failure.
+    - If the requirement is \$1500-\$2500, but the applied filter is \$2000-\$2500, it is a failure.
+    - If the requirement is \$25-\$200, but the applied filter is \$0-\$200, it is a failure.
+    - If the required years are 2004-2012, but the applied filter is 2001-2012, it is a failure.
+    - If the required years are before 2015, but the applied filter is 2000-2014, it is a failure.
+    - If the task requires exactly 2 beds, but the filter applied is 2+ beds, it is a failure.
+    5: Some tasks require a submission action or a display of results to be considered successful.
+    6: If the retrieved information is invalid or empty (e.g., No match was found), but the agent
+    has correctly performed the required action, it should still be considered successful.
+    7: If the current page already displays all available items, then applying a filter is not
+    necessary.
+    As long as the agent selects items that meet the requirements (e.g., the cheapest or
+    lowest price), the task is still considered successful.
+    *IMPORTANT*
+    Format your response into two lines as shown below:
+    Thoughts: <your thoughts and reasoning process based on double-checking each key points
+    and the evaluation criteria>
+    Status: "success" or "failure"
+    User Task: (task)
+    Key Points: (key points)
+    Action History: (action history]
+    The potentially important snapshots of the webpage in the agent's trajectory and their reasons:
+    (thoughts)
+    """
+
+# The prompts, split at their placeholders once
+TEMPLATE_STEP_1 = PromptTemplate(PROMPT_STEP_1, {"task": "(task)"})
+TEMPLATE_STEP_2 = PromptTemplate(PROMPT_STEP_2, {"task": "(task)", "key_points": "(key points)"})
+TEMPLATE_STEP_2_BATCH = PromptTemplate(PROMPT_STEP_2_BATCH, {"task": "(task)", "key_points": "(key points)",
+                                                             "count": "(count)"})
+TEMPLATE_STEP_3 = PromptTemplate(PROMPT_STEP_3, {"task": "(task)", "key_points": "(key points)",
+                                                 "action_history": "(action history]", "thoughts": "(thoughts)"})
 
 # --- Helper Functions ---
 
-def load_om2w_tasks():
-    """Loads tasks from the Hugging Face Hub."""
+def load_om2w_tasks(refresh=False):
+    """
+    Loads tasks from the local task store, building the store from the
+    Hugging Face Hub first if it does not exist yet (or refresh is set).
+    """
     global OM2W_TASKS
+    if not refresh:
+        store = TaskStore.open(TASKS_FILE_NAME)
+        if store is not None:
+            OM2W_TASKS = store
+            print(f"Loaded {len(OM2W_TASKS)} tasks from '{TASKS_FILE_NAME}'.")
+            return
+        if OM2W_OFFLINE:
+            print("--- FAILED TO LOAD TASKS ---")
+            print(f"OM2W_OFFLINE is set but there is no task store at '{TASKS_FILE_NAME}'.")
+            print("Run `python green_agent_server.py --refresh-tasks` once while online to build it.")
+            print("---------------------------------")
+            OM2W_TASKS = {}
+            return
+
     try:
+        from datasets import load_dataset
+
         # Load the dataset, specifically the tasks.json file
         # Note: This is a gated dataset. You MUST be logged in to the
         # Hugging Face CLI (`huggingface-cli login`) and have
@@ -35,14 +390,13 @@ def load_om2w_tasks():
         dataset = load_dataset(
             "osunlp/Online-Mind2Web", 
             split="test", 
-            download_mode="force_redownload"
+            download_mode="force_redownload" if refresh else None
         )
         
-        for task in dataset:
-            # We key the tasks by their 'task_id' for easy lookup
-            OM2W_TASKS[task['task_id']] = task 
+        count = build_task_store(TASKS_FILE_NAME, dataset, source="osunlp/Online-Mind2Web:test")
+        OM2W_TASKS = TaskStore(TASKS_FILE_NAME)
         
-        print(f"Successfully loaded {len(OM2W_TASKS)} tasks from Hugging Face.")
+        print(f"Successfully loaded {count} tasks from Hugging Face into '{TASKS_FILE_NAME}'.")
     
     except Exception as e:
         print(f"--- FAILED TO LOAD DATASET ---")
@@ -61,7 +415,7 @@ def parse_key_points(response_text):
     Parses key points from the LLM response, filtering out
     any lines that are just headers.
     """
-    print(f"DEBUG (Key Points Raw Response):\n---\n{response_text}\n---")
+    logger.debug("Key points raw response:\n---\n%s\n---", response_text)
     key_points = []
     lines = response_text.strip().splitlines()
     
@@ -81,13 +435,13 @@ def parse_key_points(response_text):
             
         # Check if the line is just a header
         if stripped_line.lower() in ignore_headers:
-            print(f"DEBUG: Ignoring header line: {stripped_line}")
+            logger.debug("Ignoring header line: %s", stripped_line)
             continue
             
         # If it's not a header and not empty, append it
         key_points.append(stripped_line.lstrip('0123456789.- '))
 
-    print(f"DEBUG (Parsed Key Points): {key_points}")
+    logger.debug("Parsed key points: %s", key_points)
     return key_points
 
 def parse_screenshot_score(response_text):
@@ -125,12 +479,45 @@ def parse_screenshot_score(response_text):
             end_match = re.search(r"Score\D*(\d+)\s*$", response_text, re.IGNORECASE)
             if end_match:
                 score = int(end_match.group(1))
+            else:
+                PARSE_FAILURES.inc(parser="parse_screenshot_score")
 
     except Exception as e:
         print(f"DEBUG (parse_screenshot_score): Failed to parse score. Error: {e}")
+        PARSE_FAILURES.inc(parser="parse_screenshot_score")
         
     return reasoning, score
 
+def parse_batch_screenshot_scores(response_text, count):
+    """
+    Splits a batched Step 2 response into its "Image N" blocks and parses
+    each with parse_screenshot_score. Returns a list of count entries, one
+    per image in order: (reasoning, score), or None when that image's block
+    is missing, repeated or has no 1-5 score. A single image may be answered
+    without a label.
+    """
+    headers = list(re.finditer(r"^[\s*#_>-]*Image\s*(\d+)[\s*#_:.)-]*$", response_text,
+                               re.IGNORECASE | re.MULTILINE))
+    if not headers and count == 1:
+        # A lone image is often answered in the single-image format
+        blocks = {1: [response_text]}
+    else:
+        blocks = {}
+    for n, header in enumerate(headers):
+        end = headers[n + 1].start() if n + 1 < len(headers) else len(response_text)
+        blocks.setdefault(int(header.group(1)), []).append(response_text[header.end():end])
+
+    judgements = []
+    for number in range(1, count + 1):
+        sections = blocks.get(number, [])
+        scores = re.findall(r"Score[^\d]*:\s*(\d+)", sections[0], re.IGNORECASE) if len(sections) == 1 else []
+        if not scores or not 1 <= int(scores[-1]) <= 5:
+            PARSE_FAILURES.inc(parser="parse_batch_screenshot_scores")
+            judgements.append(None)
+            continue
+        judgements.append(parse_screenshot_score(sections[0]))
+    return judgements
+
 def parse_final_status(response_text):
     """
     Parses the 'Status:' line from the LLM's Step 3 response.
@@ -150,6 +537,7 @@ def parse_final_status(response_text):
         return "success"
         
     print("DEBUG (parse_final_status): Could not find status, defaulting to failure.")
+    PARSE_FAILURES.inc(parser="parse_final_status")
     return "failure"
 
 def parse_final_thoughts(response_text):
@@ -169,58 +557,237 @@ def parse_final_thoughts(response_text):
         
     return "No 'Thoughts:' block was found in the LLM response."
 
+# Screenshots Step 2 can judge as they are: a received Screenshot, or raw
+# bytes / a base64 string (anything else, i.e. a PIL image, is encoded first)
+ENCODED_SCREENSHOT_TYPES = (Screenshot, str, bytes)
+
+def screenshot_bytes(screenshot):
+    """Raw image bytes of a screenshot received base64-encoded (JSON) or raw (streamed)."""
+    return screenshot_data(screenshot)
+
 def base64_to_pil(base64_str):
-    image_data = base64.b64decode(base64_str)
+    if isinstance(base64_str, Screenshot):
+        return base64_str.image()
+    image_data = screenshot_bytes(base64_str)
     image = Image.open(io.BytesIO(image_data))
     return image
 
+class RunCounters:
+    """Thread-safe counters collected over one assessment."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = {}
+
+    def add(self, name, amount=1):
+        with self._lock:
+            self._counts[name] = self._counts.get(name, 0) + amount
+
+    def get(self, name):
+        with self._lock:
+            return self._counts.get(name, 0)
+
+def estimate_tokens(contents):
+    """Rough prompt size for the tokens-per-minute limit: 4 characters per token, 258 per image."""
+    parts = contents if isinstance(contents, list) else [contents]
+    return sum(len(p) // 4 if isinstance(p, str) else 258 for p in parts)
+
+def response_tokens(response):
+    if response.prompt_tokens is None:
+        return None
+    return response.prompt_tokens + (response.response_tokens or 0)
+
+def judge_generate(step, contents, prefix=None):
+    """
+    Calls the judge model for a step through the shared judge scheduler (see
+    judge_scheduler.py). prefix is a SharedPrefix from prefix_cache that goes
+    ahead of contents: as the backend's cached context if it has one, else
+    as text.
+    """
+    cached_prefix = prefix.handle if prefix is not None else None
+    if prefix is not None and cached_prefix is None:
+        contents = [prefix.text] + list(contents)
+
+    def call():
+        call_started = time.perf_counter()
+        try:
+            if cached_prefix is not None:
+                return judge_backend.generate(step, contents, cached_prefix=cached_prefix)
+            return judge_backend.generate(step, contents)
+        finally:
+            JUDGE_CALL_SECONDS.observe(time.perf_counter() - call_started, step=step)
+
+    response = judge_scheduler.call(step, call, estimated_tokens=estimate_tokens(contents),
+                                    actual_tokens=response_tokens)
+    if response.prompt_tokens is not None:
+        JUDGE_TOKENS.inc(response.prompt_tokens, step=step, kind="prompt")
+    if response.response_tokens is not None:
+        JUDGE_TOKENS.inc(response.response_tokens, step=step, kind="response")
+    if response.cached_tokens:
+        JUDGE_TOKENS.inc(response.cached_tokens, step=step, kind="cached")
+    return response
+
+def count_step_2_tokens(counters, response):
+    if counters is not None:
+        counters.add("step_2_prompt_tokens", response.prompt_tokens or 0)
+        counters.add("step_2_cached_tokens", response.cached_tokens or 0)
+
 def llm_call_step_1(task_description):
-    prompt = PROMPT_STEP_1.replace("(task)", task_description)
-    response = text_model.generate_content(prompt)
+    prompt = TEMPLATE_STEP_1.render(task=task_description)
+    response = judge_generate(1, prompt)
     key_points = parse_key_points(response.text)
     return key_points
 
-def llm_call_step_2(task_description, key_points, screenshot_image_base64):
+def get_key_points(task_id, task_description):
+    """
+    Step 1 through the key point store. The text model is only called when
+    the task has no key points for the current prompt and model yet.
+    """
+    version = key_point_version(PROMPT_STEP_1, judge_backend.model_name(1))
+    key_points = key_point_store.get(task_id, version, task_description)
+    if key_points is None:
+        key_points = llm_call_step_1(task_description)
+        if key_points:
+            key_point_store.put(task_id, version, task_description, key_points)
+    return key_points
+
+def current_judge_version(step_2_budget=STEP_2_BUDGET):
+    """Version of the verdicts this configuration produces, for the result store."""
+    return judge_version([judge_backend.model_name(step) for step in (1, 2, 3)],
+                         PROMPT_STEP_1, PROMPT_STEP_2, PROMPT_STEP_2_BATCH, PROMPT_STEP_3, SCREENSHOT_THRESHOLD,
+                         SCREENSHOT_PREPROCESS.signature(), STEP_2_BATCH_SIZE, FRAME_DEDUPE_MAX_DISTANCE,
+                         FRAME_HASH_SIZE, step_2_budget.summary())
+
+def precompute_key_points(workers=8):
+    """
+    Fills the key point store for every task in OM2W_TASKS. Tasks that already
+    have up-to-date key points are skipped, so an interrupted run can simply
+    be started again.
+    """
+    version = key_point_version(PROMPT_STEP_1, judge_backend.model_name(1))
+    pending = [(tid, task['confirmed_task']) for tid, task in OM2W_TASKS.items()
+               if key_point_store.get(tid, version, task['confirmed_task']) is None]
+    print(f"Precomputing key points for {len(pending)} of {len(OM2W_TASKS)} tasks ({workers} workers)...")
+
+    def work(task_id, task_description):
+        key_points = llm_call_step_1(task_description)
+        if key_points:
+            key_point_store.put(task_id, version, task_description, key_points)
+        return len(key_points)
+
+    failed = 0
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(work, tid, desc): tid for tid, desc in pending}
+        for done, future in enumerate(as_completed(futures), 1):
+            tid = futures[future]
+            try:
+                count = future.result()
+                print(f"  [{done}/{len(pending)}] {tid}: {count} key points")
+                if not count:
+                    failed += 1
+            except Exception as e:
+                failed += 1
+                print(f"  [{done}/{len(pending)}] {tid}: FAILED ({e})")
+
+    print(f"Key point store now holds {len(key_point_store)} tasks; {failed} failed (re-run to retry).")
+
+def llm_call_step_2(task_description, key_points, screenshot_image_base64, log=print,
+                    counters=None, preprocess=None, trace=NULL_TRACE, index=None):
     """Step 2: Key Screenshot Identification (Multimodal)"""
-    key_points_str = "\n".join(key_points)
-    prompt_text = PROMPT_STEP_2.replace("(task)", task_description)
-    prompt_text = prompt_text.replace("(key points)", key_points_str)
-    
-    pil_image = base64_to_pil(screenshot_image_base64)
-    
-    response = vision_model.generate_content([prompt_text, pil_image])
+    preprocess = preprocess or SCREENSHOT_PREPROCESS
+    image_data = screenshot_bytes(screenshot_image_base64)
+    cache_key = make_judgement_key(image_data, task_description, key_points,
+                                   judge_backend.model_name(2), PROMPT_STEP_2, preprocess.signature())
+
+    def judge():
+        open_image = screenshot_image_base64.image if isinstance(screenshot_image_base64, Screenshot) else None
+        image_content, sent_bytes = preprocess_screenshot(image_data, preprocess, open_image=open_image)
+        if counters is not None:
+            counters.add("step_2_vision_calls")
+            counters.add("screenshot_bytes_original", len(image_data))
+            counters.add("screenshot_bytes_sent", sent_bytes)
+
+        with prefix_cache.use(judge_backend, 2, TEMPLATE_STEP_2, task=task_description,
+                              key_points="\n".join(key_points)) as prefix:
+            response = judge_generate(2, [image_content], prefix=prefix)
+        count_step_2_tokens(counters, response)
+        response_text = response.text
+        trace.record("step_2_raw_response", {"index": index, "response": response_text})
+
+        reasoning, score = parse_screenshot_score(response_text)
+        return {"reasoning": reasoning, "score": score}
+
+    # A score outside 1-5 means the response couldn't be read; don't keep it, ask again next time
+    judgement, cache_hit = judge_cache.get_or_compute(cache_key, judge,
+                                                      cacheable=lambda judgement: 1 <= judgement["score"] <= 5)
+    if cache_hit:
+        log(f"DEBUG (Step 2): Reusing cached judgement {cache_key[:12]}")
+        if counters is not None:
+            counters.add("step_2_cache_hits")
+    return judgement["reasoning"], judgement["score"]
+
+def llm_call_step_2_batch(task_description, key_points, screenshots, counters=None, preprocess=None,
+                          trace=NULL_TRACE, indices=None):
+    """
+    Step 2 for several screenshots in one multimodal request. Returns one
+    entry per screenshot: (reasoning, score), or None if its judgement could
+    not be read from the response. Cached judgements are reused and only the
+    remaining screenshots are sent.
+    """
+    preprocess = preprocess or SCREENSHOT_PREPROCESS
+    indices = indices or list(range(len(screenshots)))
+    images = [screenshot_bytes(s) for s in screenshots]
+    keys = [make_judgement_key(image_data, task_description, key_points, judge_backend.model_name(2),
+                               PROMPT_STEP_2_BATCH, preprocess.signature()) for image_data in images]
+    judgements = [judge_cache.get(key) for key in keys]
+    if counters is not None:
+        counters.add("step_2_cache_hits", sum(j is not None for j in judgements))
+    to_send = [n for n, judgement in enumerate(judgements) if judgement is None]
+    if not to_send:
+        return [(j["reasoning"], j["score"]) for j in judgements]
+
+    contents = []
+    for number, n in enumerate(to_send, 1):
+        open_image = screenshots[n].image if isinstance(screenshots[n], Screenshot) else None
+        image_content, sent_bytes = preprocess_screenshot(images[n], preprocess, open_image=open_image)
+        contents.extend([f"Image {number}:", image_content])
+        if counters is not None:
+            counters.add("screenshot_bytes_original", len(images[n]))
+            counters.add("screenshot_bytes_sent", sent_bytes)
+    if counters is not None:
+        counters.add("step_2_vision_calls")
+        counters.add("step_2_batched_frames", len(to_send))
+
+    with prefix_cache.use(judge_backend, 2, TEMPLATE_STEP_2_BATCH, task=task_description,
+                          key_points="\n".join(key_points), count=len(to_send)) as prefix:
+        response = judge_generate(2, contents, prefix=prefix)
+    count_step_2_tokens(counters, response)
     response_text = response.text
+    trace.record("step_2_raw_response", {"indices": [indices[n] for n in to_send], "response": response_text})
 
-    # DEBUG LOG
-    print(f"DEBUG (Step 2 Raw Response):\n---\n{response_text}\n---")
-    # ---------------------------------
-    
-    reasoning, score = parse_screenshot_score(response_text)
-    return reasoning, score
+    for n, parsed in zip(to_send, parse_batch_screenshot_scores(response_text, len(to_send))):
+        if parsed is not None:
+            judgements[n] = {"reasoning": parsed[0], "score": parsed[1]}
+            judge_cache.put(keys[n], judgements[n])
+    return [(j["reasoning"], j["score"]) if j is not None else None for j in judgements]
 
-def llm_call_step_3(task_description, key_points, action_history, key_screenshots_with_reasons):
+def llm_call_step_3(task_description, key_points, action_history, key_screenshots_with_reasons,
+                    trace=NULL_TRACE):
     key_points_str = "\n".join(key_points)
     action_history_str = "\n".join([str(a) for a in action_history])
     screenshots_str = "\n".join([f"Screenshot: {s['reasoning']}" for s in key_screenshots_with_reasons])
 
-    # DEBUG LOG
-    print("\n--- Sending to WebJudge (Step 3) ---")
-    print(f"Key Points:\n{key_points_str}")
-    print(f"Action History:\n{action_history_str}")
-    print(f"Screenshots Info:\n{screenshots_str}")
-    print("------------------------------------\n")
-    # ----------------------------------
+    trace.record("step_3_inputs", {
+        "key_points": key_points_str,
+        "action_history": action_history_str,
+        "screenshots": screenshots_str,
+    })
     
-    prompt = PROMPT_STEP_3.replace("(task)", task_description)
-    prompt = prompt.replace("(key points)", key_points_str)
-    prompt = prompt.replace("(action history]", action_history_str) 
-    prompt = prompt.replace("(thoughts)", screenshots_str)
+    prompt = TEMPLATE_STEP_3.render(task=task_description, key_points=key_points_str,
+                                    action_history=action_history_str, thoughts=screenshots_str)
     
-    response = text_model.generate_content(prompt)
+    response = judge_generate(3, prompt)
     response_text = response.text
-    
-    # Debug Log for Raw Response
-    print(f"\n--- WebJudge (Step 3) RAW RESPONSE ---:\n{response_text}\n----------------------------------\n")
+    trace.record("step_3_raw_response", response_text)
 
     # Call both parsers to get both pieces of information
     status = parse_final_status(response_text)
@@ -229,25 +796,424 @@ def llm_call_step_3(task_description, key_points, action_history, key_screenshot
     return status, thoughts # Return a tuple with both
     # -----------------------
 
-# --- A2A Endpoint ---
+def score_screenshot(index, screenshot_b64, task_description, key_points, counters=None, trace=NULL_TRACE):
+    """
+    Runs Step 2 on a single screenshot. Log lines are collected instead of
+    printed so concurrent calls can still be logged in screenshot order.
+    Returns (reasoning, score, log_lines); reasoning and score are None if
+    the screenshot could not be encoded or judged. A received Screenshot is
+    released either way.
+    """
+    log_lines = [f"\n--- Analyzing Screenshot {index} ---"]
+    span = trace.start_span("step_2_screenshot", index=index)
 
-@app.route('/start_assessment', methods=['POST'])
-def start_assessment():
+    # This handles the case where the list might contain PIL images
+    if not isinstance(screenshot_b64, ENCODED_SCREENSHOT_TYPES):
+        try:
+            buffered = io.BytesIO()
+            screenshot_b64.save(buffered, format="PNG")
+            img_str = base64.b64encode(buffered.getvalue()).decode('utf-8')
+        except Exception as e:
+            log_lines.append(f"  Error encoding screenshot {index}: {e}")
+            span.end(error=str(e))
+            return None, None, log_lines
+    else:
+        img_str = screenshot_b64
+
+    # Call the Step 2 LLM
+    try:
+        reasoning, score = llm_call_step_2(task_description, key_points, img_str,
+                                           log=log_lines.append, counters=counters, trace=trace, index=index)
+    except Exception as e:
+        log_lines.append(f"  Error judging screenshot {index}: {e}")
+        record_error("step_2", e)
+        span.end(error=str(e))
+        return None, None, log_lines
+    finally:
+        release_screenshot(screenshot_b64, "step_2")
+
+    span.end(score=score)
+    trace.record("step_2_judgement", {"index": index, "reasoning": reasoning, "score": score}, level=SUMMARY)
+    log_judgement(log_lines, index, reasoning, score)
+    return reasoning, score, log_lines
+
+def score_screenshot_batch(frames, task_description, key_points, counters=None, trace=NULL_TRACE):
+    """
+    Runs Step 2 on [(index, screenshot)] with one multi-image request.
+    Frames whose judgement can't be read from the response, or all of them
+    if the request fails, fall back to score_screenshot one at a time.
+    Returns (reasoning, score, log_lines) per frame, in order.
+    """
+    indices = [index for index, _ in frames]
+    span = trace.start_span("step_2_batch", indices=indices)
+    try:
+        judgements = llm_call_step_2_batch(task_description, key_points, [s for _, s in frames],
+                                           counters=counters, trace=trace, indices=indices)
+        span.end(parsed=sum(j is not None for j in judgements))
+    except Exception as e:
+        record_error("step_2", e)
+        span.end(error=str(e))
+        judgements = [None] * len(frames)
+
+    results = []
+    for (index, screenshot), judgement in zip(frames, judgements):
+        if judgement is None:
+            if counters is not None:
+                counters.add("step_2_batch_fallbacks")
+            reasoning, score, log_lines = score_screenshot(index, screenshot, task_description, key_points,
+                                                           counters, trace)
+            log_lines.insert(1, "  No judgement for this screenshot in the batched response, judged on its own")
+        else:
+            reasoning, score = judgement
+            log_lines = [f"\n--- Analyzing Screenshot {index} ---",
+                         f"  Judged in one request with screenshots {indices}"]
+            trace.record("step_2_judgement", {"index": index, "reasoning": reasoning, "score": score},
+                         level=SUMMARY)
+            log_judgement(log_lines, index, reasoning, score)
+        results.append((reasoning, score, log_lines))
+    for _, screenshot in frames:
+        release_screenshot(screenshot, "step_2")
+    return results
+
+def log_judgement(log_lines, index, reasoning, score):
+    # DEBUG LOG
+    log_lines.append(f"Screenshot {index} Reasoning: {reasoning}")
+    log_lines.append(f"Screenshot {index} Score: {score}")
+    if score >= SCREENSHOT_THRESHOLD:
+        log_lines.append(f"  > This screenshot PASSED (Score >= {SCREENSHOT_THRESHOLD})")
+
+def reuse_judgement(index, matched_index, distance, matched_result):
+    """Step 2 result for a near-duplicate of an already scored screenshot."""
+    reasoning, score, _ = matched_result
+    log_lines = [f"\n--- Analyzing Screenshot {index} ---",
+                 f"  Near-duplicate of screenshot {matched_index} (hash distance {distance}), reusing its judgement"]
+    if score is None:
+        log_lines.append(f"  Screenshot {matched_index} could not be judged, so neither can this one")
+        return None, None, log_lines
+    log_judgement(log_lines, index, reasoning, score)
+    return reasoning, score, log_lines
+
+def no_progress(event, **details):
+    """Default progress callback for assessments nobody is watching."""
+
+def score_screenshots(task_description, key_points, screenshots_base64, max_workers=STEP_2_MAX_WORKERS,
+                      progress=no_progress, counters=None, dedupe_distance=FRAME_DEDUPE_MAX_DISTANCE,
+                      trace=NULL_TRACE, batch_size=STEP_2_BATCH_SIZE, budget=None, action_history=None,
+                      skipped=None):
+    """
+    Step 2 over a whole trajectory, with up to max_workers vision calls in
+    flight. Near-duplicate frames (see FRAME_DEDUPE_MAX_DISTANCE) reuse the
+    judgement of the frame they match. With batch_size > 1, consecutive
+    frames are judged batch_size at a time in one request. Results and logs
+    are consumed in screenshot order, so the concurrent path gives exactly
+    the same output as the sequential one. With an enabled budget, see
+    score_screenshots_budgeted.
+    """
+    if budget is not None and budget.enabled():
+        return score_screenshots_budgeted(task_description, key_points, list(screenshots_base64), budget,
+                                          action_history, max_workers, progress, counters, dedupe_distance,
+                                          trace, batch_size, skipped)
+
+    deduper = FrameDeduper(dedupe_distance, FRAME_HASH_SIZE) if dedupe_distance >= 0 else None
+    results = []  # (reasoning, score, log_lines) per screenshot, in order
+
+    def near_duplicate(i, screenshot):
+        if deduper is None or not isinstance(screenshot, ENCODED_SCREENSHOT_TYPES):
+            return None
+        try:
+            return deduper.match(i, screenshot_bytes(screenshot))
+        except Exception as e:
+            print(f"  Could not hash screenshot {i}: {e}")
+            return None
+
+    def reuse(i, screenshot, match):
+        # (future, get_result) for a near-duplicate: no vision call of its own
+        if counters is not None:
+            counters.add("step_2_near_duplicates")
+        trace.record("step_2_near_duplicate", {"index": i, "matched_index": match[0], "distance": match[1]},
+                     level=SUMMARY)
+        release_screenshot(screenshot, "step_2")
+        return None, lambda: reuse_judgement(i, *match, results[match[0]])
+
+    def result_getters(judge):
+        # Yields (future, get_result) per screenshot in order. future is None
+        # when the result needs no vision call of its own.
+        for i, screenshot in enumerate(screenshots_base64):
+            match = near_duplicate(i, screenshot)
+            yield reuse(i, screenshot, match) if match else judge(i, screenshot)
+
+    def decisions(judge, flush, hash_pool):
+        # Yields a Future of (future, get_result) per screenshot in order.
+        # Frames are hashed on hash_pool as they arrive; each is then matched,
+        # in index order, by whichever thread made it the next one ready, and
+        # judge() is called under the lock so batches still fill in order.
+        # flush() sends off a partly filled batch once every frame is decided.
+        lock = threading.Lock()
+        waiting = {}  # index -> (screenshot, hash or None), hashed but not yet decided
+        decided = []
+        position = [0]
+
+        def decide_ready():
+            with lock:
+                while position[0] in waiting:
+                    i = position[0]
+                    position[0] += 1
+                    screenshot, frame_hash = waiting.pop(i)
+                    try:
+                        match = deduper.match(i, frame_hash=frame_hash) if frame_hash is not None else None
+                        decided[i].set_result(reuse(i, screenshot, match) if match else judge(i, screenshot))
+                    except Exception as e:
+                        decided[i].set_exception(e)
+
+        def hashed(i, screenshot):
+            try:
+                frame_hash = dhash(screenshot_bytes(screenshot), FRAME_HASH_SIZE)
+            except Exception as e:
+                print(f"  Could not hash screenshot {i}: {e}")
+                frame_hash = None
+            with lock:
+                waiting[i] = (screenshot, frame_hash)
+            decide_ready()
+
+        for i, screenshot in enumerate(screenshots_base64):
+            decision = Future()
+            with lock:
+                decided.append(decision)
+            if deduper is not None and isinstance(screenshot, ENCODED_SCREENSHOT_TYPES):
+                hash_pool.submit(hashed, i, screenshot)
+            else:
+                with lock:
+                    waiting[i] = (screenshot, None)
+                decide_ready()
+            yield decision
+        wait(decided)
+        with lock:
+            flush()
+
+    def collect(getters):
+        key_screenshots_with_reasons = []
+        for i, get_result in enumerate(getters):
+            reasoning, score, log_lines = get_result()
+            results.append((reasoning, score, log_lines))
+            logger.debug("\n".join(log_lines))
+            passed = score is not None and score >= SCREENSHOT_THRESHOLD
+            if passed:
+                key_screenshots_with_reasons.append({"reasoning": reasoning, "score": score})
+            progress("screenshot_scored", index=i, score=score, passed=passed)
+        return key_screenshots_with_reasons
+
+    if max_workers <= 1 and batch_size <= 1:
+        def judge_now(i, screenshot):
+            result = score_screenshot(i, screenshot, task_description, key_points, counters, trace)
+            return None, lambda: result
+        return collect(get for _, get in result_getters(judge_now))
+
+    def in_order(pool):
+        # Screenshots are submitted as soon as they arrive (the list may be a
+        # stream still being received) and results are yielded in order.
+        def submit(i, screenshot):
+            future = pool.submit(score_screenshot, i, screenshot, task_description, key_points, counters, trace)
+            return future, future.result
+
+        batch = []  # [(index, screenshot, future)] waiting to be sent together
+
+        def submit_batch():
+            frames = list(batch)
+            batch.clear()
+
+            def run():
+                try:
+                    results = score_screenshot_batch([(i, s) for i, s, _ in frames], task_description,
+                                                     key_points, counters, trace)
+                except Exception as e:
+                    for _, _, future in frames:
+                        future.set_exception(e)
+                    return
+                for (_, _, future), result in zip(frames, results):
+                    future.set_result(result)
+            pool.submit(run)
+
+        def add_to_batch(i, screenshot):
+            if not isinstance(screenshot, ENCODED_SCREENSHOT_TYPES):
+                return submit(i, screenshot)
+            future = Future()
+            batch.append((i, screenshot, future))
+            if len(batch) >= batch_size:
+                submit_batch()
+            return future, future.result
+
+        def flush():
+            if batch:
+                submit_batch()
+
+        def settled(decision):
+            return decision.done() and (decision.exception() is not None or decision.result()[0] is None
+                                        or decision.result()[0].done())
+
+        pending = deque()
+        for decision in decisions(add_to_batch if batch_size > 1 else submit, flush, hash_pool):
+            pending.append(decision)
+            while pending and settled(pending[0]):
+                yield pending.popleft().result()[1]
+        while pending:
+            yield pending.popleft().result()[1]
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="step2") as pool, \
+            ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="step2-hash") as hash_pool:
+        return collect(in_order(pool))
+
+def score_screenshots_budgeted(task_description, key_points, screenshots, budget, action_history=None,
+                               max_workers=STEP_2_MAX_WORKERS, progress=no_progress, counters=None,
+                               dedupe_distance=FRAME_DEDUPE_MAX_DISTANCE, trace=NULL_TRACE,
+                               batch_size=STEP_2_BATCH_SIZE, skipped=None):
+    """
+    Step 2 within a budget. Frames are ranked (final frames, frames after a
+    CLICK, then by visual change) and judged best first, with up to
+    max_workers requests in flight. The budget is checked before each
+    request is sent, counting requests still in flight against the vision
+    call cap; once it is spent, or enough frames have passed, the remaining frames are skipped
+    and appended to skipped as {"index", "reason", "priority"}. Results are
+    logged and reported in screenshot order, like score_screenshots.
+    """
+    counters = counters if counters is not None else RunCounters()
+    skipped = skipped if skipped is not None else []
+    encoded = [isinstance(s, ENCODED_SCREENSHOT_TYPES) for s in screenshots]
+
+    def frame_hash(i):
+        if not encoded[i]:
+            return None
+        try:
+            return dhash(screenshot_bytes(screenshots[i]), FRAME_HASH_SIZE)
+        except Exception as e:
+            print(f"  Could not hash screenshot {i}: {e}")
+            return None
+
+    # Each frame is hashed once, in parallel, for both the ranking and the near-duplicate check
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="step2-hash") as hash_pool:
+        hashes = list(hash_pool.map(frame_hash, range(len(screenshots))))
+    ranked = rank_frames(hashes, action_history, budget.final_frames, FRAME_HASH_SIZE)
+    trace.record("step_2_ranking", [{"index": i, "priority": reason, "change": change}
+                                    for i, reason, change in ranked], level=SUMMARY)
+    deduper = FrameDeduper(dedupe_distance, FRAME_HASH_SIZE) if dedupe_distance >= 0 else None
+    tracker = BudgetTracker(budget, counters)
+    results = {}  # index -> (reasoning, score, log_lines)
+    frames_per_call = max(1, batch_size)
+
+    in_flight = {}  # future -> indices of the frames it judges
+    duplicates = []  # (index, (matched index, distance)) waiting for the matched frame's result
+
+    def settle(done):
+        for future in done:
+            chunk = in_flight.pop(future)
+            results.update(zip(chunk, future.result() if frames_per_call > 1 else [future.result()]))
+            for i in chunk:
+                tracker.record_score(results[i][1], SCREENSHOT_THRESHOLD)
+        for entry in [entry for entry in duplicates if entry[1][0] in results]:
+            i, match = entry
+            duplicates.remove(entry)
+            results[i] = reuse_judgement(i, *match, results[match[0]])
+            tracker.record_score(results[i][1], SCREENSHOT_THRESHOLD)
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="step2") as pool:
+        position = 0
+        while True:
+            # Requests in flight may each still cost a vision call
+            stop_reason = tracker.stop_reason(in_flight=len(in_flight)) if position < len(ranked) else None
+            if position >= len(ranked) or stop_reason or len(in_flight) >= max_workers:
+                if not in_flight:
+                    break
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                settle(done)
+                continue
+            chunk = []
+            while position < len(ranked) and len(chunk) < frames_per_call:
+                i, reason, _ = ranked[position]
+                position += 1
+                match = None
+                if deduper is not None and hashes[i] is not None:
+                    match = deduper.match(i, frame_hash=hashes[i])
+                if match:
+                    counters.add("step_2_near_duplicates")
+                    trace.record("step_2_near_duplicate", {"index": i, "matched_index": match[0],
+                                                           "distance": match[1]}, level=SUMMARY)
+                    duplicates.append((i, match))
+                    release_screenshot(screenshots[i], "step_2")
+                else:
+                    chunk.append(i)
+            if not chunk:
+                settle([])
+            elif frames_per_call > 1:
+                in_flight[pool.submit(score_screenshot_batch, [(i, screenshots[i]) for i in chunk],
+                                      task_description, key_points, counters, trace)] = chunk
+            else:
+                in_flight[pool.submit(score_screenshot, chunk[0], screenshots[chunk[0]], task_description,
+                                      key_points, counters, trace)] = chunk
+
+    for i, reason, _ in ranked:
+        if i not in results:
+            skipped.append({"index": i, "reason": stop_reason, "priority": reason})
+            release_screenshot(screenshots[i], "step_2")
+            results[i] = (None, None, [f"\n--- Analyzing Screenshot {i} ---",
+                                       f"  Skipped ({stop_reason}; ranked as '{reason}')"])
+    counters.add("step_2_budget_skipped", len(skipped))
+    skipped.sort(key=lambda entry: entry["index"])
+
+    key_screenshots_with_reasons = []
+    for i in range(len(screenshots)):
+        reasoning, score, log_lines = results[i]
+        logger.debug("\n".join(log_lines))
+        passed = score is not None and score >= SCREENSHOT_THRESHOLD
+        if passed:
+            key_screenshots_with_reasons.append({"reasoning": reasoning, "score": score})
+        progress("screenshot_scored", index=i, score=score, passed=passed)
+    return key_screenshots_with_reasons
+
+def read_assessment_request(data):
+    """
+    Validates a start_assessment request body. Returns (options, None) where
+    options are the keyword arguments for run_assessment, or
+    (None, (error_payload, http_status)).
+    """
     if not OM2W_TASKS:
         load_om2w_tasks()
         if not OM2W_TASKS:
-             return jsonify({"error": "No tasks loaded. Check server logs for Hugging Face auth errors."}), 500
+             return None, ({"error": "No tasks loaded. Check server logs for Hugging Face auth errors."}, 500)
 
-    data = request.json
     task_id = data.get('task_id')
     participant_url = data.get('participant_url')
 
     if not task_id or not participant_url:
-        return jsonify({"error": "Missing 'task_id' or 'participant_url'"}), 400
+        return None, ({"error": "Missing 'task_id' or 'participant_url'"}, 400)
+    if not isinstance(task_id, str) or not isinstance(participant_url, str):
+        return None, ({"error": "'task_id' and 'participant_url' must be strings"}, 400)
+
+    try:
+        step_2_workers = int(data.get('step_2_concurrency', STEP_2_MAX_WORKERS))
+    except (TypeError, ValueError):
+        return None, ({"error": "'step_2_concurrency' must be an integer"}, 400)
+    if step_2_workers < 1:
+        return None, ({"error": "'step_2_concurrency' must be at least 1"}, 400)
         
+    reuse_stored = data.get('reuse_stored', True)
+    if not isinstance(reuse_stored, bool):
+        return None, ({"error": "'reuse_stored' must be true or false"}, 400)
+        
+    if not OM2W_TASKS.get(task_id):
+        return None, ({"error": f"Task ID '{task_id}' not found in loaded dataset."}, 404)
+
+    return {"task_id": task_id, "participant_url": participant_url, "step_2_workers": step_2_workers,
+            "reuse_stored": reuse_stored}, None
+
+def run_assessment(task_id, participant_url, step_2_workers=STEP_2_MAX_WORKERS, progress=no_progress,
+                   step_2_budget=STEP_2_BUDGET, reuse_stored=True):
+    """
+    Runs the three WebJudge steps for one task and white agent. Returns
+    (payload, http_status). progress(event, **details) is called as each
+    stage starts and finishes and as each screenshot is scored. If the
+    white agent returns a trajectory that is already in the result store,
+    its stored verdict is returned instead (unless reuse_stored is False).
+    """
     task = OM2W_TASKS.get(task_id)
-    if not task:
-        return jsonify({"error": f"Task ID '{task_id}' not found in loaded dataset."}), 404
     
     # The task object from HF is a dict, we just need the description
     task_description = task['confirmed_task']
@@ -257,110 +1223,543 @@ def start_assessment():
     print(f"Task ID: {task_id}")
     print(f"Task: {task_description}")
 
-    # STEP 1: KEY POINT IDENTIFICATION
-    print("Step 1: Identifying Key Points...")
-    key_points = llm_call_step_1(task_description)
-    print(f"Key Points: {key_points}")
+    # Don't spend judge calls on a white agent that keeps failing
+    if not white_agent_client.available(participant_url):
+        print(f"White agent at {participant_url} is failing repeatedly, skipping the assessment.")
+        record_error("white_agent", CircuitOpenError())
+        return {"webjudge_status": "failure",
+                "reason": f"White agent at {participant_url} is failing repeatedly; try again later."}, 503
 
-    # Trigger the White Agent
-    try:
-        response = requests.post(f"{participant_url}/run_task", 
-                                 json={
-                                     "task_description": task_description,
-                                     "start_url": start_url
-                                     },
-                                 timeout=300) 
-        trajectory = response.json()
-        action_history = trajectory["action_history"]
-        screenshots_base64 = trajectory["screenshots_base64"]
-
-        # Debug log
-        print("\n--- White Agent Trajectory Received ---")
-        print(json.dumps(action_history, indent=2))
-        print(f"Received {len(screenshots_base64)} screenshots.")
-        print("---------------------------------------\n")
+    trace = trace_store.start("assessment", task_id=task_id, participant_url=participant_url)
+    if trace.trace_id:
+        print(f"Trace: {trace.trace_id}")
+
+    assessment_started = time.perf_counter()
+
+    # The stages run as a graph (see stage_graph.py): Step 1 and the white
+    # agent run at the same time, Step 2 starts as soon as the key points
+    # are ready and judges the screenshots received so far and then the
+    # rest as they arrive, and Step 3 follows once Step 2 is done. When a
+    # stored result may apply, Step 2 also waits for the recall stage.
+    graph = StageGraph("assessment")
+    counters = RunCounters()
+    frames = queue.Queue()  # screenshots read ahead of Step 2, then None (or the error) at the end
+    received = {}  # trajectory and archive run, once the white agent has answered
+    held = []  # every Screenshot received, so Step 2's hold can be dropped whatever happens
+    screenshot_hashes = []  # SHA-256 of each screenshot, for the result store
+    stored = {}  # the stored result, if this trajectory was judged before
+
+    # With a stored result for this task and participant, the whole
+    # trajectory is looked up before Step 2 starts; if it was judged before,
+    # Steps 2 and 3 are skipped. Step 1 still overlaps the white agent, and
+    # its key points come from the key point store after the first run
+    version = current_judge_version(step_2_budget) if result_store is not None else None
+    recall = reuse_stored and result_store is not None and result_store.has_results(task_id, participant_url,
+                                                                                  version)
+
+    def step_1():
+        print("Step 1: Identifying Key Points...")
+        progress("stage_started", stage="step_1")
+        span = trace.start_span("step_1")
+        try:
+            key_points = get_key_points(task_id, task_description)
+        except Exception as e:
+            record_error("step_1", e)
+            span.end(error=str(e))
+            raise
+        span.end(key_points=len(key_points))
+        trace.record("key_points", key_points, level=SUMMARY)
+        logger.debug("Key Points: %s", key_points)
+        progress("stage_finished", stage="step_1", key_points=len(key_points))
+        return key_points
+
+    def white_agent():
+        # Trigger the White Agent
+        progress("stage_started", stage="white_agent")
+        span = trace.start_span("white_agent")
+        try:
+            response = white_agent_client.post(participant_url, "/run_task",
+                                               json={
+                                                   "task_description": task_description,
+                                                   "start_url": start_url
+                                                   },
+                                               headers={"Accept": RUN_TASK_ACCEPT},
+                                               stream=True)
+            trajectory = Trajectory(response)
+        except Exception as e:
+            print(f"Failed to run white agent: {e}")
+            record_error("white_agent", e)
+            progress("stage_failed", stage="white_agent", error=str(e))
+            span.end(error=str(e))
+            frames.put(e)
+            raise
+        print(f"White agent responded ({'streaming' if trajectory.streamed else 'JSON'} trajectory).")
 
         # --- SCREENSHOT LOGGING ---
-        global global_run_counter
-        run_folder = f"_run_{global_run_counter}"
-        os.makedirs(run_folder, exist_ok=True)
-        print(f"Saving {len(screenshots_base64)} screenshots to '{run_folder}'...")
-        
-        for i, b64_string in enumerate(screenshots_base64):
-            try:
-                # Decode the base64 string
-                image_data = base64.b64decode(b64_string)
-                file_path = os.path.join(run_folder, f"step_{i}.png")
-                # Save the image
-                with open(file_path, 'wb') as f:
-                    f.write(image_data)
-            except Exception as e:
-                print(f"  Error saving screenshot {i}: {e}")
-        
-        global_run_counter += 1
+        # Each screenshot is decoded once as it is received (waiting first if
+        # the screenshot memory budget is spent), queued for the archive and
+        # handed on to Step 2; writing happens in the background.
+        archive_run = screenshot_archive.start_run(task_id=task_id, participant_url=participant_url,
+                                                   trace_id=trace.trace_id)
+        received.update(trajectory=trajectory, archive_run=archive_run)
+        print(f"Archiving screenshots as run '{archive_run.run_id}' as they arrive...")
+        try:
+            for i, data in enumerate(trajectory.screenshots()):
+                # Step 2 releases nothing until it has a whole batch (or, with
+                # a budget, the whole trajectory), so only wait beyond that
+                def step_2_has_enough():
+                    return sum(s.held_by("step_2") for s in held) >= STEP_2_BATCH_SIZE
+                try:
+                    screenshot = Screenshot(i, data, screenshot_memory, owner=archive_run.run_id,
+                                            holders=("archive", "step_2"),
+                                            wait=not (step_2_budget.enabled() or recall) and step_2_has_enough)
+                except ValueError as e:
+                    raise TrajectoryError(f"Screenshot {i} is not valid base64: {e}") from e
+                del data
+                held.append(screenshot)
+                if result_store is not None:
+                    screenshot_hashes.append(hashlib.sha256(screenshot.data).hexdigest())
+                counters.add("screenshot_memory_wait_seconds", screenshot.waited)
+                # Only queues the frame; the archive's writer thread times the write itself
+                enqueue_started = time.perf_counter()
+                archive_run.add(i, screenshot)
+                counters.add("screenshot_enqueue_seconds", time.perf_counter() - enqueue_started)
+                frames.put(screenshot)
+                if graph.failed.is_set():
+                    break
+        except TrajectoryError as e:
+            print(f"Failed to run white agent: {e}")
+            record_error("white_agent", e)
+            white_agent_client.record_failure(participant_url)
+            progress("stage_failed", stage="white_agent", error=str(e))
+            span.end(error=str(e))
+            archive_run.close(complete=False, error=str(e))
+            frames.put(e)
+            raise
+        if graph.failed.is_set():
+            # Another stage failed, so nothing will use the rest of the trajectory
+            print("Assessment failed, no longer reading the trajectory.")
+            span.end(screenshots=trajectory.screenshot_count, cancelled=True)
+            archive_run.close(complete=False, error="assessment failed")
+            frames.put(None)
+            return trajectory
+        archive_run.close(action_history=trajectory.action_history)
+        span.end(screenshots=trajectory.screenshot_count, bytes=trajectory.bytes_received,
+                 streamed=trajectory.streamed)
+        trace.record("action_history", trajectory.action_history)
+        print(f"Received {trajectory.screenshot_count} screenshots ({trajectory.bytes_received} bytes).")
+        progress("stage_finished", stage="white_agent", screenshots=trajectory.screenshot_count,
+                 bytes=trajectory.bytes_received, streamed=trajectory.streamed)
+        frames.put(None)
+        return trajectory
         # --- END LOGGING ---
 
-    except Exception as e:
-        print(f"Failed to run white agent: {e}")
-        return jsonify({"webjudge_status": "failure", "reason": f"White agent at {participant_url} failed to respond."}), 500
+    def received_screenshots():
+        while True:
+            screenshot = frames.get()
+            if screenshot is None:
+                return
+            if isinstance(screenshot, Exception):
+                raise screenshot
+            yield screenshot
 
-    # STEP 2: KEY SCREENSHOT IDENTIFICATION
-    print("Step 2: Identifying Key Screenshots... (Now logging thoughts)")
-    key_screenshots_with_reasons = []
-    
-    for i, screenshot_b64 in enumerate(screenshots_base64):
-        print(f"\n--- Analyzing Screenshot {i} ---")
-        
-        # This handles the case where the list might contain raw bytes
-        if not isinstance(screenshot_b64, str):
-             try:
-                buffered = io.BytesIO()
-                screenshot_b64.save(buffered, format="PNG")
-                img_str = base64.b64encode(buffered.getvalue()).decode('utf-8')
-             except Exception as e:
-                print(f"  Error encoding screenshot {i}: {e}")
-                continue
-        else:
-             img_str = screenshot_b64
+    def recall_stored():
+        # Runs once the white agent is done, so every screenshot has been hashed
+        if graph.failed.is_set():
+            return None
+        progress("stage_started", stage="recall")
+        found = result_store.get(task_id, participant_url,
+                                 trajectory_hash(graph.result("white_agent").action_history, screenshot_hashes),
+                                 version, task_description)
+        if found:
+            print(f"Trajectory already judged (result {found['result_id']}), reusing the stored verdict.")
+            for screenshot in held:
+                screenshot.release("step_2")
+            stored.update(found)
+        trace.record("recall", {"stored_result": found["result_id"] if found else None})
+        progress("stage_finished", stage="recall", stored_result=found["result_id"] if found else None)
+        return found
 
-        # Call the Step 2 LLM
-        reasoning, score = llm_call_step_2(task_description, key_points, img_str)
-        
-        # DEBUG LOG
-        print(f"Screenshot {i} Reasoning: {reasoning}")
-        print(f"Screenshot {i} Score: {score}")
-        # ----------------------------------------
+    def step_2():
+        # STEP 2: KEY SCREENSHOT IDENTIFICATION
+        if stored:
+            return None
+        key_points = graph.result("step_1")
+        print("Step 2: Identifying Key Screenshots...")
+        progress("stage_started", stage="step_2")
+        span = trace.start_span("step_2")
+        skipped_screenshots = []
+        try:
+            screenshots = received_screenshots()
+            if step_2_budget.enabled():
+                # Ranking frames needs the whole trajectory and its action history
+                screenshots = list(screenshots)
+            key_screenshots_with_reasons = score_screenshots(task_description,
+                                                             key_points,
+                                                             screenshots,
+                                                             max_workers=step_2_workers,
+                                                             progress=progress,
+                                                             counters=counters,
+                                                             trace=trace,
+                                                             budget=step_2_budget,
+                                                             action_history=getattr(received.get("trajectory"),
+                                                                                    "action_history", None),
+                                                             skipped=skipped_screenshots)
+        except Exception as e:
+            span.end(error=str(e))
+            raise
 
-        if score >= SCREENSHOT_THRESHOLD:
-            print(f"  > This screenshot PASSED (Score >= {SCREENSHOT_THRESHOLD})")
-            key_screenshots_with_reasons.append({"reasoning": reasoning, "score": score})
-            
-    print(f"\nFound {len(key_screenshots_with_reasons)} key screenshots (Score >= {SCREENSHOT_THRESHOLD}).")
+        print(f"\nFound {len(key_screenshots_with_reasons)} key screenshots (Score >= {SCREENSHOT_THRESHOLD}).")
+        step_2_calls_report = {
+            "screenshots": received["trajectory"].screenshot_count,
+            "vision_calls": counters.get("step_2_vision_calls"),
+            "cache_hits": counters.get("step_2_cache_hits"),
+            "near_duplicates": counters.get("step_2_near_duplicates"),
+            "skipped": counters.get("step_2_cache_hits") + counters.get("step_2_near_duplicates"),
+            "batched_frames": counters.get("step_2_batched_frames"),
+            "batch_fallbacks": counters.get("step_2_batch_fallbacks"),
+            "budget_skipped": counters.get("step_2_budget_skipped"),
+        }
+        print(f"Step 2 vision calls: {step_2_calls_report}")
+        prompt_tokens, cached_tokens = counters.get("step_2_prompt_tokens"), counters.get("step_2_cached_tokens")
+        step_2_tokens_report = {
+            "prompt_tokens": prompt_tokens,
+            "cached_tokens": cached_tokens,
+            "sent_tokens": prompt_tokens - cached_tokens,
+            "saved_pct": round(100 * cached_tokens / prompt_tokens, 1) if prompt_tokens else 0.0,
+        }
+        print(f"Step 2 input tokens: {step_2_tokens_report}")
+        if skipped_screenshots:
+            print(f"Skipped screenshots (budget {step_2_budget.summary()}): {skipped_screenshots}")
+        span.end(key_screenshots=len(key_screenshots_with_reasons), **step_2_calls_report)
+        progress("stage_finished", stage="step_2", key_screenshots=len(key_screenshots_with_reasons))
+        return key_screenshots_with_reasons, step_2_calls_report, step_2_tokens_report, skipped_screenshots
 
-    # STEP 3: OUTCOME JUDGEMENT
-    print("Step 3: Making Outcome Judgement...")
-    
-    # Unpack the new tuple (status, thoughts)
-    final_status, final_thoughts = llm_call_step_3(task_description, 
-                                     key_points, 
-                                     action_history, 
-                                     key_screenshots_with_reasons)
-    
-    # This will print the LLM judge's thoughts
-    print("\n--- WebJudge (Step 3) Final Parsed Thoughts ---")
-    print(final_thoughts)
-    print("-----------------------------------------------\n")
-    # ---------------------
+    def step_3():
+        # STEP 3: OUTCOME JUDGEMENT
+        if stored:
+            return None
+        print("Step 3: Making Outcome Judgement...")
+        progress("stage_started", stage="step_3")
+        span = trace.start_span("step_3")
+        key_screenshots_with_reasons = graph.result("step_2")[0]
+
+        # Unpack the new tuple (status, thoughts)
+        try:
+            final_status, final_thoughts = llm_call_step_3(task_description,
+                                             graph.result("step_1"),
+                                             graph.result("white_agent").action_history,
+                                             key_screenshots_with_reasons,
+                                             trace=trace)
+        except Exception as e:
+            record_error("step_3", e)
+            span.end(error=str(e))
+            raise
+        span.end(webjudge_status=final_status)
+        trace.record("step_3_thoughts", final_thoughts, level=SUMMARY)
+        progress("stage_finished", stage="step_3", webjudge_status=final_status)
+        return final_status, final_thoughts
+
+    graph.add("white_agent", white_agent)
+    if recall:
+        graph.add("recall", recall_stored, after=["white_agent"])
+    graph.add("step_1", step_1)
+    graph.add("step_2", step_2, after=["step_1", "recall"] if recall else ["step_1"],
+              streams_from=["white_agent"])
+    graph.add("step_3", step_3, after=["step_2", "white_agent"])
+    failures = {stage.name: stage.error for stage in graph.run()}
+    for screenshot in held:
+        # Normally already released by Step 2, but not if a stage failed
+        screenshot.release("step_2")
+
+    if "white_agent" in failures:
+        trace.finish("error", stage="white_agent", error=str(failures["white_agent"]))
+        return {"webjudge_status": "failure", "reason": f"White agent at {participant_url} failed to respond.",
+                "trace_id": trace.trace_id}, 500
+    if stored and "recall" not in failures:
+        # The stored verdict stands even if Step 1, which it doesn't need, failed
+        return stored_assessment(stored, graph, trace, received["archive_run"], assessment_started), 200
+    for stage, error in failures.items():
+        trace.finish("error", stage=stage, error=str(error))
+        raise error
+
+    (key_screenshots_with_reasons, step_2_calls_report, step_2_tokens_report,
+     skipped_screenshots) = graph.result("step_2")
+    final_status, final_thoughts = graph.result("step_3")
+    trajectory = graph.result("white_agent")
+    archive_run = received["archive_run"]
+    screenshot_bytes_report = {
+        "preprocessing": SCREENSHOT_PREPROCESS.signature(),
+        "original": counters.get("screenshot_bytes_original"),
+        "sent": counters.get("screenshot_bytes_sent"),
+        "saved": counters.get("screenshot_bytes_original") - counters.get("screenshot_bytes_sent"),
+    }
+    print(f"Screenshot bytes sent to the vision model: {screenshot_bytes_report}")
+
+    # Wall-clock seconds per stage; stages overlap, so they add up to more
+    # than the total. The critical path is the chain of stages the total
+    # actually waited on, and slack how much earlier the others finished.
+    timings = {stage: graph.duration(stage) for stage in graph.stages}
+    timings["screenshot_enqueue"] = counters.get("screenshot_enqueue_seconds")
+    timings["screenshot_memory_wait"] = counters.get("screenshot_memory_wait_seconds")
+    timings["total"] = time.perf_counter() - assessment_started
+    timings = {stage: round(seconds, 4) for stage, seconds in timings.items()}
+    critical_path = dict(graph.critical_path(), windows=graph.windows())
+    print(f"Stage timings (s): {timings}")
+    print(f"Critical path: {' -> '.join(critical_path['stages'])} ({critical_path['seconds']}s), "
+          f"slack: {critical_path['slack']}")
+    for stage, seconds in timings.items():
+        STAGE_SECONDS.observe(seconds, stage=stage)
+    for stage in critical_path["stages"]:
+        CRITICAL_PATH_STAGES.inc(stage=stage)
+    WHITE_AGENT_BYTES.observe(trajectory.bytes_received, transport="multipart" if trajectory.streamed else "json")
+    SCREENSHOTS_PER_RUN.observe(trajectory.screenshot_count)
+    VISION_CALLS.inc(step_2_calls_report["vision_calls"], outcome="issued")
+    VISION_CALLS.inc(step_2_calls_report["cache_hits"], outcome="cache_hit")
+    VISION_CALLS.inc(step_2_calls_report["near_duplicates"], outcome="near_duplicate")
+    VISION_CALLS.inc(step_2_calls_report["budget_skipped"], outcome="budget_skipped")
+    ASSESSMENTS.inc(status=final_status)
     
     print(f"--- Assessment Complete. Status: {final_status} ---")
+    trace.finish("done", webjudge_status=final_status, timings=timings, critical_path=critical_path["stages"])
     
-    return jsonify({
+    payload = {
         "webjudge_status": final_status,
         "webjudge_thoughts": final_thoughts,
         "task_id": task_id,
-        "key_points_identified": key_points,
+        "key_points_identified": graph.result("step_1"),
         "key_screenshots_count": len(key_screenshots_with_reasons),
-    })
+        "screenshot_bytes": screenshot_bytes_report,
+        "step_2_calls": step_2_calls_report,
+        "step_2_tokens": step_2_tokens_report,
+        "skipped_screenshots": skipped_screenshots,
+        "timings": timings,
+        "critical_path": critical_path,
+        "trace_id": trace.trace_id,
+        "screenshot_run": archive_run.run_id,
+    }
+    if result_store is not None and trajectory.screenshot_count == len(screenshot_hashes):
+        try:
+            payload["result_id"] = result_store.put(task_id, participant_url,
+                                                    trajectory_hash(trajectory.action_history, screenshot_hashes),
+                                                    version, task_description, payload, len(screenshot_hashes))
+            STORED_RESULTS.inc(outcome="stored")
+        except Exception as e:
+            print(f"Could not store the result: {e}")
+            record_error("result_store", e)
+    return payload, 200
+
+def stored_assessment(stored, graph, trace, archive_run, assessment_started):
+    """The response for a trajectory that was already judged: its stored verdict, with this run's timings."""
+    payload = stored["payload"]
+    status = payload["webjudge_status"]
+    timings = {stage: round(graph.duration(stage), 4) for stage in graph.stages
+               if graph.duration(stage) is not None}
+    timings["total"] = round(time.perf_counter() - assessment_started, 4)
+    critical_path = dict(graph.critical_path(), windows=graph.windows())
+    STORED_RESULTS.inc(outcome="reused")
+    ASSESSMENTS.inc(status=status)
+    print(f"--- Assessment Complete (stored result {stored['result_id']}). Status: {status} ---")
+    trace.finish("done", webjudge_status=status, timings=timings, stored_result=stored["result_id"])
+    return {
+        **{field: payload.get(field) for field in ("webjudge_status", "webjudge_thoughts", "task_id",
+                                                   "key_points_identified", "key_screenshots_count",
+                                                   "skipped_screenshots")},
+        "timings": timings,
+        "critical_path": critical_path,
+        "trace_id": trace.trace_id,
+        "screenshot_run": archive_run.run_id,
+        "result_id": stored["result_id"],
+        "stored_result": {
+            "recorded_at": stored["recorded_at"],
+            "submissions": stored["submissions"],
+            "trace_id": payload.get("trace_id"),
+            "screenshot_run": payload.get("screenshot_run"),
+        },
+    }
+
+def drain(timeout=300):
+    """
+    Graceful shutdown: refuses new assessments, lets queued and running
+    /assessments jobs finish, then waits for the screenshot archive and
+    trace writers to catch up. Called by the WSGI server as a worker exits.
+    """
+    draining.set()
+    deadline = time.time() + timeout
+    print(f"Draining: waiting for {assessment_jobs.stats()['pending']} assessment jobs to finish...")
+    if not assessment_jobs.shutdown(wait=True, timeout=timeout):
+        print(f"Draining: giving up on {assessment_jobs.stats()['pending']} assessment jobs after {timeout}s.")
+    screenshot_archive.flush(max(0.0, deadline - time.time()))
+    trace_store.flush(max(0.0, deadline - time.time()))
+    print("Drained.")
+
+def draining_response():
+    return jsonify({"error": "The green agent is shutting down; retry on another instance."}), 503
+
+def run_batch(items, max_workers=BATCH_MAX_WORKERS, per_participant=BATCH_PER_PARTICIPANT_CONCURRENCY,
+              progress=no_progress):
+    """
+    Runs a list of assessments concurrently, at most per_participant at a
+    time against any one white agent (judge calls are additionally capped by
+    the judge scheduler). Items that fail validation are reported, not run.
+    Returns (payload, http_status) with aggregate success rates and the
+    per-item results in input order.
+    """
+    def run_item(index, item):
+        options, error = read_assessment_request(item)
+        if error:
+            payload, http_status = error
+        else:
+            try:
+                payload, http_status = run_assessment(**options)
+            except Exception as e:
+                print(f"Batch item {index} crashed: {e}")
+                payload, http_status = {"error": f"Assessment crashed: {e}"}, 500
+        progress("item_finished", index=index, task_id=item.get('task_id'),
+                 participant_url=item.get('participant_url'), webjudge_status=payload.get("webjudge_status"))
+        return {
+            "task_id": item.get('task_id'),
+            "participant_url": item.get('participant_url'),
+            "http_status": http_status,
+            "webjudge_status": payload.get("webjudge_status"),
+            "result": payload,
+        }
+
+    print(f"--- Starting batch of {len(items)} assessments ---")
+    progress("stage_started", stage="batch", items=len(items))
+    # Items with a malformed participant_url share one queue; they are rejected as soon as they run
+    item_results = run_scheduled(items,
+                                 key=lambda item: item.get('participant_url')
+                                 if isinstance(item.get('participant_url'), str) else None,
+                                 run=run_item,
+                                 max_workers=min(max_workers, len(items)),
+                                 per_key_limit=per_participant)
+    summary = summarize_batch(item_results)
+    print(f"--- Batch Complete. Overall: {summary['overall']} ---")
+    progress("stage_finished", stage="batch", **summary["overall"])
+    return {"summary": summary, "items": item_results}, 200
+
+# --- A2A Endpoint ---
+
+@app.route('/start_assessment', methods=['POST'])
+def start_assessment():
+    if draining.is_set():
+        return draining_response()
+    options, error = read_assessment_request(request.json or {})
+    if error:
+        return jsonify(error[0]), error[1]
+    payload, http_status = run_assessment(**options)
+    return jsonify(payload), http_status
+
+def job_links(job):
+    return {
+        "job_id": job.job_id,
+        "status_url": f"/assessments/{job.job_id}",
+        "events_url": f"/assessments/{job.job_id}/events",
+        "result_url": f"/assessments/{job.job_id}/result",
+    }
+
+@app.route('/batch_assessment', methods=['POST'])
+def batch_assessment():
+    """
+    Runs many (task_id, participant_url) assessments in one call. With
+    "async": true the batch is queued as a job (see /assessments/<job_id>).
+    """
+    if draining.is_set():
+        return draining_response()
+    data = request.json or {}
+    try:
+        items = parse_batch_items(data.get('items'))
+        per_participant = int(data.get('per_participant_concurrency', BATCH_PER_PARTICIPANT_CONCURRENCY))
+        if per_participant < 1:
+            raise ValueError("'per_participant_concurrency' must be at least 1")
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": str(e)}), 400
+
+    if not data.get('async'):
+        payload, http_status = run_batch(items, per_participant=per_participant)
+        return jsonify(payload), http_status
+
+    try:
+        job = assessment_jobs.submit(run_batch, {"batch_items": len(items)},
+                                     items=items, per_participant=per_participant)
+    except QueueFullError as e:
+        return jsonify({"error": str(e)}), 503
+    return jsonify(job_links(job)), 202
+
+# --- Assessment Jobs ---
+
+@app.route('/assessments', methods=['POST'])
+def submit_assessment():
+    """Queues an assessment and returns its job id straight away."""
+    if draining.is_set():
+        return draining_response()
+    options, error = read_assessment_request(request.json or {})
+    if error:
+        return jsonify(error[0]), error[1]
+    try:
+        job = assessment_jobs.submit(run_assessment,
+                                     {"task_id": options["task_id"], "participant_url": options["participant_url"]},
+                                     **options)
+    except QueueFullError as e:
+        return jsonify({"error": str(e)}), 503
+
+    return jsonify(job_links(job)), 202
+
+@app.route('/assessments/<job_id>', methods=['GET'])
+def assessment_status(job_id):
+    job = assessment_jobs.get(job_id)
+    if not job:
+        return jsonify({"error": f"Unknown job '{job_id}'"}), 404
+    return jsonify(job.summary())
+
+@app.route('/assessments/<job_id>/result', methods=['GET'])
+def assessment_result(job_id):
+    """The final webjudge_status payload, or 202 with the job status while it is still running."""
+    job = assessment_jobs.get(job_id)
+    if not job:
+        return jsonify({"error": f"Unknown job '{job_id}'"}), 404
+    if not job.finished():
+        return jsonify(job.summary()), 202
+    return jsonify(job.result), job.http_status
+
+@app.route('/assessments/<job_id>/events', methods=['GET'])
+def assessment_events(job_id):
+    """
+    Progress events for a job. Streams them as server-sent events until the
+    job finishes; with ?wait=0 returns the events so far as JSON instead.
+    Either way ?since=N skips the first N events.
+    """
+    job = assessment_jobs.get(job_id)
+    if not job:
+        return jsonify({"error": f"Unknown job '{job_id}'"}), 404
+    since = request.args.get('since', 0, type=int)
+    if request.args.get('wait', 1, type=int) == 0:
+        return jsonify(job.events_since(since, timeout=0))
+
+    def stream(since):
+        while True:
+            events = job.events_since(since, timeout=15)
+            for event in events:
+                yield f"id: {event['seq']}\nevent: {event['event']}\ndata: {json.dumps(event)}\n\n"
+            since += len(events)
+            if not events:
+                if job.finished():
+                    return
+                yield ": keep-alive\n\n"
+
+    return Response(stream(since), mimetype="text/event-stream")
+
+@app.route('/assessments', methods=['GET'])
+def assessment_queue_stats():
+    return jsonify(assessment_jobs.stats())
+
+@app.route('/healthz', methods=['GET'])
+def healthz():
+    """Liveness/readiness for load balancers: 503 once the server has started draining."""
+    status = {"status": "draining" if draining.is_set() else "ok", "pid": os.getpid(),
+              "tasks": len(OM2W_TASKS)}
+    return jsonify(status), 503 if draining.is_set() else 200
 
 @app.route('/list_tasks', methods=['GET'])
 def list_tasks():
@@ -382,109 +1781,96 @@ def list_tasks():
     
     return jsonify(task_list)
 
-if __name__ == '__main__':    
-    # Load tasks on startup
-    # PROMPT 1:"
-    PROMPT_STEP_1 = """
-    You are an expert tasked with analyzing a given task to identify the key points explicitly
-    stated in the task description.
-    **Objective**: Carefully analyze the task description and extract the critical elements
-    explicitly mentioned in the task for achieving its goal.
-    **Instructions**:
-    1. Read the task description carefully.
-    2. Identify and extract **key points** directly stated in the task description.
-    - A **key point** is a critical element, condition, or step explicitly mentioned in the task
-    description.
-    - Do not infer or add any unstated elements.
-    - Words such as "best," "highest," "cheapest," "latest," "most recent," "lowest," "closest," "highest-
-    rated," "largest," and "newest" must go through the sort function (e.g., the key point should be
-    "Filter by highest").
-    **Respond with**:
-    - **Key Points**: A numbered list of the explicit key points for completing this task, one per
-    line, without explanations or additional details.
-    Task: (task)
-    """
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Stage latencies, payload sizes, judge calls and tokens, parse failures and errors (Prometheus text format)."""
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
 
-    # PROMPT 2:"
-    PROMPT_STEP_2 = """
-    You are an expert evaluator tasked with determining whether an image contains information
-    about the necessary steps to complete a task.
-    **Objective**: Analyze the provided image and decide if it shows essential steps or evidence
-    required for completing the task.
-    Use your reasoning to explain your decision before assigning
-    a score.
-    **Instructions**:
-    1. Provide a detailed description of the image, including its contents, visible elements, text (if
-    any), and any notable features.
-    2. Carefully examine the image and evaluate whether it contains necessary steps or evidence
-    crucial to task completion:
-    - Identify key points that could be relevant to task completion, such as actions, progress
-    indicators, tool usage, applied filters, or step-by-step instructions.
-    - Does the image show actions, progress indicators, or critical information directly related to
-    completing the task?
-    - Is this information indispensable for understanding or ensuring task success?
-    - If the image contains partial but relevant information, consider its usefulness rather than
-    dismissing it outright.
-    3. Provide your response in the following format:
-    - **Reasoning**: [Your explanation]
-    **Score**: [1-5]
-    **Task**: (task)
-    **Key Points for Task Completion**: (key points)
-    The snapshot of the web page is shown in the image.
-    """
+@app.route('/traces', methods=['GET'])
+def list_traces():
+    """The most recent traces still in memory, newest first, and trace store counters."""
+    limit = request.args.get('limit', default=50, type=int)
+    return jsonify({"traces": trace_store.recent(limit), "stats": trace_store.stats()})
 
-    # PROMPT 3:"
-    PROMPT_STEP_3 = """
-    You are an expert in evaluating the performance of a web navigation agent.
-    The agent is
-    designed to help a human user navigate a website to complete a task.
-    Given the user's task,
-    the agent's action history, key points for task completion, some potentially important web
-    pages in the agent's trajectory and their reasons, your goal is to determine whether the agent
-    has completed the task and achieved all requirements.
-    Your response must strictly follow the following evaluation criteria!
-    *Important Evaluation Criteria*:
-    1: The filtered results must be displayed correctly. If filters were not properly applied
-    (i.e., missing selection, missing confirmation, or no visible effect in results), the task is not
-    considered successful.
-    2: You must carefully check whether these snapshots and action history meet these key points.
-    Ensure that specific filter conditions, such as "best," "highest," "cheapest," "latest," "most
-    recent," "lowest," "closest," "highest-rated," "largest," and "newest" are correctly applied using
-    the filter function (e.g., sort function).
-    3: Certain key points or requirements should be applied by the filter.
-    Otherwise, a search with
-    all requirements as input will be deemed a failure since it cannot guarantee that all results
-    meet the requirements!
-    4: If the task requires filtering by a specific range of money, years, or the number of beds and
-    bathrooms, the applied filter must exactly match the given requirement.
-    Any deviation results
-    in failure. To ensure the task is successful, the applied filter must precisely match the specified
-    range without being too broad or too narrow.
-    Examples of Failure Cases:
-    - If the requirement is less than \$50, but the applied filter is less than \$25, it is a failure.
-    - If the requirement is \$1500-\$2500, but the applied filter is \$2000-\$2500, it is a failure.
-    - If the requirement is \$25-\$200, but the applied filter is \$0-\$200, it is a failure.
-    - If the required years are 2004-2012, but the applied filter is 2001-2012, it is a failure.
-    - If the required years are before 2015, but the applied filter is 2000-2014, it is a failure.
-    - If the task requires exactly 2 beds, but the filter applied is 2+ beds, it is a failure.
-    5: Some tasks require a submission action or a display of results to be considered successful.
-    6: If the retrieved information is invalid or empty (e.g., No match was found), but the agent
-    has correctly performed the required action, it should still be considered successful.
-    7: If the current page already displays all available items, then applying a filter is not
-    necessary.
-    As long as the agent selects items that meet the requirements (e.g., the cheapest or
-    lowest price), the task is still considered successful.
-    *IMPORTANT*
-    Format your response into two lines as shown below:
-    Thoughts: <your thoughts and reasoning process based on double-checking each key points
-    and the evaluation criteria>
-    Status: "success" or "failure"
-    User Task: (task)
-    Key Points: (key points)
-    Action History: (action history]
-    The potentially important snapshots of the webpage in the agent's trajectory and their reasons:
-    (thoughts)
+@app.route('/traces/<trace_id>', methods=['GET'])
+def get_trace(trace_id):
+    """Spans and payloads recorded for one assessment."""
+    trace = trace_store.get(trace_id)
+    if trace is None:
+        return jsonify({"error": f"Unknown trace '{trace_id}'"}), 404
+    return jsonify(trace)
+
+@app.route('/screenshot_memory_stats', methods=['GET'])
+def screenshot_memory_stats():
+    """Memory held by received screenshots across running assessments, and time spent waiting for it."""
+    return jsonify(screenshot_memory.stats())
+
+@app.route('/screenshot_archive_stats', methods=['GET'])
+def screenshot_archive_stats():
+    """Runs, stored images, deduplicated frames and evictions for the screenshot archive."""
+    return jsonify(screenshot_archive.stats())
+
+@app.route('/white_agent_stats', methods=['GET'])
+def white_agent_stats():
+    """Requests, retries, failures and circuit breaker state per white agent."""
+    return jsonify(white_agent_client.stats())
+
+@app.route('/judge_cache_stats', methods=['GET'])
+def judge_cache_stats():
+    """Hit/miss counters for the Step 2 judgement cache."""
+    return jsonify(judge_cache.stats())
+
+@app.route('/prompt_prefix_stats', methods=['GET'])
+def prompt_prefix_stats():
+    """Shared Step 2 prompt prefixes: rendered, reused, and cached by the judge backend."""
+    return jsonify(prefix_cache.stats())
+
+def result_store_filters():
+    """
+    judge_version from the query string: the current configuration's by
+    default, "all" for every version, or a specific one.
     """
+    version = request.args.get('judge_version', 'current')
+    return {"version": current_judge_version() if version == 'current' else None if version == 'all' else version,
+            "task_id": request.args.get('task_id')}
 
-    load_om2w_tasks() 
-    app.run(port=5001, debug=True)
+@app.route('/leaderboard', methods=['GET'])
+def leaderboard():
+    """Success rate per participant over their stored results (optionally for one task)."""
+    if result_store is None:
+        return jsonify({"error": "The result store is disabled (RESULT_STORE_PATH is empty)."}), 404
+    filters = result_store_filters()
+    return jsonify({"judge_version": filters["version"], "task_id": filters["task_id"],
+                    "participants": result_store.leaderboard(**filters)})
+
+@app.route('/results', methods=['GET'])
+def list_results():
+    """Stored results, most recently submitted first, filtered by task_id and participant_url."""
+    if result_store is None:
+        return jsonify({"error": "The result store is disabled (RESULT_STORE_PATH is empty)."}), 404
+    limit = request.args.get('limit', default=100, type=int)
+    return jsonify({"results": result_store.results(participant_url=request.args.get('participant_url'),
+                                                    limit=limit, **result_store_filters()),
+                    "stats": result_store.stats()})
+
+@app.route('/judge_scheduler_stats', methods=['GET'])
+def judge_scheduler_stats():
+    """Queue depth, wait times, throttling and retries of the judge scheduler."""
+    return jsonify(judge_scheduler.stats())
+
+if __name__ == '__main__':    
+    parser = argparse.ArgumentParser(description="WebJudge green agent")
+    parser.add_argument("--precompute-key-points", action="store_true",
+                        help="Run Step 1 for every task and store the key points, then exit")
+    parser.add_argument("--refresh-tasks", action="store_true",
+                        help="Re-download the dataset from Hugging Face and rebuild the task store, then exit")
+    parser.add_argument("--workers", type=int, default=8,
+                        help="Parallel Step 1 calls for --precompute-key-points")
+    args = parser.parse_args()
+
+    # Load tasks on startup
+    load_om2w_tasks(refresh=args.refresh_tasks) 
+    if args.precompute_key_points:
+        precompute_key_points(workers=args.workers)
+    elif not args.refresh_tasks:
+        app.run(port=5001, debug=True)
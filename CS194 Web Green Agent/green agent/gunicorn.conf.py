@@ -0,0 +1,37 @@
+import os
+import sys
+import subprocess
+
+# gunicorn settings for the green agent: gunicorn -c gunicorn.conf.py wsgi:app
+
+bind = os.environ.get("GREEN_AGENT_BIND", "127.0.0.1:5001")
+# One worker by default: POST /assessments jobs, /metrics and the judge
+# scheduler's limits live in the worker's memory (see the README before
+# raising this)
+workers = int(os.environ.get("GREEN_AGENT_WORKERS", "1"))
+threads = int(os.environ.get("GREEN_AGENT_THREADS", "16"))
+worker_class = "gthread"
+# One synchronous /start_assessment can take several minutes
+timeout = int(os.environ.get("GREEN_AGENT_TIMEOUT", "900"))
+# How long a stopping worker may take to finish requests and drain jobs;
+# gunicorn kills it once this has passed
+graceful_timeout = int(os.environ.get("GREEN_AGENT_GRACEFUL_TIMEOUT", "300"))
+# Draining stops this long before the kill, so it can finish writing out
+drain_margin = int(os.environ.get("GREEN_AGENT_DRAIN_MARGIN", "15"))
+keepalive = 5
+# The app is imported in each worker, not in the master: the judge clients
+# and background writer threads must not be shared across fork().
+preload_app = False
+
+def on_starting(server):
+    # Build the task store once, before the workers start, so they don't all
+    # download the dataset at the same time.
+    tasks_file = os.environ.get("OM2W_TASKS_FILE", "tasks.store")
+    if not os.path.exists(tasks_file):
+        server.log.info("No task store at %s yet, building it", tasks_file)
+        subprocess.run([sys.executable, "-c", "import green_agent_server; green_agent_server.load_om2w_tasks()"],
+                       check=False)
+
+def worker_exit(server, worker):
+    from green_agent_server import drain
+    drain(timeout=max(1, graceful_timeout - drain_margin))
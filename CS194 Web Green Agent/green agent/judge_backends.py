@@ -0,0 +1,228 @@
+import os
+import re
+import time
+import random
+import hashlib
+import threading
+
+# Judge model backends. The pipeline only talks to a backend through
+# generate(step, contents), where step is 1, 2 or 3 (Step 1 and 3 are text
+# only, Step 2 carries a screenshot), so the Gemini models can be swapped
+# for the local stand-in when running offline or under synthetic load.
+# Backends that can hold a prompt prefix as cached context also offer
+# create_prefix_cache / release_prefix_cache (see prompt_templates.py).
+
+class JudgeBackendError(Exception):
+    """
+    A judge model call failed. status is the provider's HTTP status when
+    known (429 and 5xx are retried by the judge scheduler) and retry_after
+    its suggested delay in seconds, if it gave one.
+    """
+    def __init__(self, message, status=None, retry_after=None):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+def _retry_delay(message):
+    """Seconds from a 'retry_delay { seconds: N }' or 'retry in Ns' hint in an error message, or None."""
+    match = (re.search(r"retry_delay\s*\{\s*seconds:\s*(\d+)", message)
+             or re.search(r"retry in ([\d.]+)\s*s", message, re.IGNORECASE))
+    return float(match.group(1)) if match else None
+
+class JudgeResponse:
+    def __init__(self, text, prompt_tokens=None, response_tokens=None, cached_tokens=None):
+        self.text = text
+        self.prompt_tokens = prompt_tokens  # all input tokens, including cached_tokens
+        self.response_tokens = response_tokens
+        self.cached_tokens = cached_tokens  # input tokens served from a cached context
+
+class CachedPrefix:
+    """
+    A prompt prefix held by the provider as cached context. Backends return
+    one from create_prefix_cache() and take it as generate(...,
+    cached_prefix=...), in which case contents holds only what follows it.
+    """
+    def __init__(self, text, tokens, model=None, resource=None):
+        self.text = text
+        self.tokens = tokens
+        self.model = model        # provider model bound to the cached context
+        self.resource = resource  # provider object to delete on release
+
+class GeminiBackend:
+    name = "gemini"
+
+    def __init__(self, text_model_name='gemini-2.0-flash-lite', vision_model_name='gemini-2.0-flash-lite',
+                 api_key=None, min_cache_tokens=4096):
+        import google.generativeai as genai
+
+        # Configure the Gemini API client
+        genai.configure(api_key=api_key)
+        self.text_model_name = text_model_name
+        self.vision_model_name = vision_model_name
+        self.min_cache_tokens = min_cache_tokens  # Gemini rejects smaller cached content
+        self.text_model = genai.GenerativeModel(text_model_name)
+        self.vision_model = genai.GenerativeModel(vision_model_name)
+
+    def model_name(self, step):
+        return self.vision_model_name if step == 2 else self.text_model_name
+
+    def generate(self, step, contents, cached_prefix=None):
+        from google.api_core import exceptions as google_exceptions
+
+        if cached_prefix is not None:
+            model = cached_prefix.model
+        else:
+            model = self.vision_model if step == 2 else self.text_model
+        try:
+            response = model.generate_content(contents)
+        except google_exceptions.GoogleAPICallError as e:
+            raise JudgeBackendError(str(e), status=e.code, retry_after=_retry_delay(str(e))) from e
+        usage = getattr(response, "usage_metadata", None)
+        return JudgeResponse(response.text,
+                             prompt_tokens=getattr(usage, "prompt_token_count", None),
+                             response_tokens=getattr(usage, "candidates_token_count", None),
+                             cached_tokens=getattr(usage, "cached_content_token_count", None))
+
+    def create_prefix_cache(self, step, text, ttl_seconds):
+        """
+        Registers text as cached content for the step's model. Gemini only
+        caches prompts above a minimum size and only for some model
+        versions, and raises otherwise.
+        """
+        import datetime
+        import google.generativeai as genai
+        from google.generativeai import caching
+        from google.api_core import exceptions as google_exceptions
+
+        try:
+            cache = caching.CachedContent.create(model=f"models/{self.model_name(step)}", contents=[text],
+                                                 ttl=datetime.timedelta(seconds=ttl_seconds))
+        except google_exceptions.GoogleAPICallError as e:
+            raise JudgeBackendError(str(e), status=e.code, retry_after=_retry_delay(str(e))) from e
+        return CachedPrefix(text, tokens=getattr(cache.usage_metadata, "total_token_count", None),
+                            model=genai.GenerativeModel.from_cached_content(cached_content=cache), resource=cache)
+
+    def release_prefix_cache(self, prefix):
+        prefix.resource.delete()
+
+class LocalStandInBackend:
+    """
+    Offline stand-in for the judge models. Responses are derived from a hash
+    of the request, so the same input always gets the same answer, and are
+    shaped so that parse_key_points, parse_screenshot_score (or, for several
+    images, parse_batch_screenshot_scores) and parse_final_status accept them. Latency, jitter and an error rate can be
+    configured to imitate a real provider, as can a share of calls that are
+    rejected with a 429 and a Retry-After hint.
+    """
+    name = "local"
+
+    def __init__(self, latency_ms=300, jitter_ms=100, error_rate=0.0, seed=0, rate_limit_rate=0.0,
+                 retry_after=1.0, min_cache_tokens=4096):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate  # share of calls answered with a 429
+        self.retry_after = retry_after
+        self.min_cache_tokens = min_cache_tokens  # smallest prefix create_prefix_cache accepts
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        return cls(latency_ms=float(os.environ.get("LOCAL_JUDGE_LATENCY_MS", "300")),
+                   jitter_ms=float(os.environ.get("LOCAL_JUDGE_JITTER_MS", "100")),
+                   error_rate=float(os.environ.get("LOCAL_JUDGE_ERROR_RATE", "0")),
+                   seed=int(os.environ.get("LOCAL_JUDGE_SEED", "0")),
+                   rate_limit_rate=float(os.environ.get("LOCAL_JUDGE_RATE_LIMIT_RATE", "0")),
+                   retry_after=float(os.environ.get("LOCAL_JUDGE_RETRY_AFTER_SECONDS", "1")),
+                   min_cache_tokens=int(os.environ.get("LOCAL_JUDGE_MIN_CACHE_TOKENS", "4096")))
+
+    def model_name(self, step):
+        return "local-stand-in"
+
+    def create_prefix_cache(self, step, text, ttl_seconds):
+        """Pretends to cache the prefix, refusing ones below min_cache_tokens like a real provider."""
+        tokens = len(text) // 4
+        if tokens < self.min_cache_tokens:
+            raise JudgeBackendError(f"Cached content is too small ({tokens} tokens, minimum {self.min_cache_tokens})",
+                                    status=400)
+        return CachedPrefix(text, tokens)
+
+    def release_prefix_cache(self, prefix):
+        pass
+
+    def generate(self, step, contents, cached_prefix=None):
+        with self._lock:
+            delay = max(0.0, self.latency_ms + self._random.uniform(-self.jitter_ms, self.jitter_ms)) / 1000
+            fail = self._random.random() < self.error_rate
+            rate_limited = self._random.random() < self.rate_limit_rate
+        if rate_limited:
+            raise JudgeBackendError("Injected rate limit from the local stand-in judge", status=429,
+                                    retry_after=self.retry_after)
+        time.sleep(delay)
+        if fail:
+            raise JudgeBackendError("Injected error from the local stand-in judge")
+
+        parts = contents if isinstance(contents, list) else [contents]
+        if cached_prefix is not None:
+            parts = [cached_prefix.text] + parts
+        prompt = "\n".join(p for p in parts if isinstance(p, str))
+        digest = hashlib.sha256()
+        for part in parts:
+            digest.update(_content_bytes(part))
+        seed = int(digest.hexdigest()[:8], 16)
+
+        if step == 1:
+            text = self._key_points(prompt)
+        elif step == 2:
+            images = [p for p in parts if not isinstance(p, str)]
+            blocks = [self._screenshot_judgement(image) for image in images]
+            if len(blocks) == 1:
+                text = blocks[0]
+            else:
+                text = "\n".join(f"**Image {n}**\n{block}" for n, block in enumerate(blocks, 1))
+        else:
+            status = "success" if seed % 2 == 0 else "failure"
+            text = f"Thoughts: Stand-in verdict derived from the request hash {seed:08x}.\nStatus: \"{status}\""
+
+        images = sum(1 for p in parts if not isinstance(p, str))
+        return JudgeResponse(text,
+                             prompt_tokens=len(prompt) // 4 + 258 * images,
+                             response_tokens=len(text) // 4,
+                             cached_tokens=cached_prefix.tokens if cached_prefix is not None else 0)
+
+    @staticmethod
+    def _screenshot_judgement(image):
+        # Depends on the image alone, so batched and one-at-a-time judging agree
+        seed = int(hashlib.sha256(_content_bytes(image)).hexdigest()[:8], 16)
+        score = seed % 5 + 1
+        return (f"- **Reasoning**: Stand-in judgement for image {seed:08x}; "
+                f"treating it as {'relevant' if score >= 4 else 'not relevant'} to the task.\n"
+                f"**Score**: {score}")
+
+    @staticmethod
+    def _key_points(prompt):
+        matches = re.findall(r"Task:\s*(.+)", prompt)
+        task = matches[-1].strip() if matches else "Complete the task"
+        clauses = [c.strip() for c in re.split(r",|\band\b|\bwith\b|\bthat\b", task) if c.strip()]
+        lines = [f"{i}. {clause}" for i, clause in enumerate(clauses[:6], 1)]
+        return "**Key Points**:\n" + "\n".join(lines)
+
+def _content_bytes(part):
+    if isinstance(part, str):
+        return part.encode("utf-8")
+    if isinstance(part, dict):
+        return bytes(part.get("data", b""))
+    if hasattr(part, "tobytes"):  # PIL image
+        return part.tobytes()
+    return repr(part).encode("utf-8")
+
+def create_judge_backend(name=None):
+    """Builds the backend selected by JUDGE_BACKEND ("gemini", the default, or "local")."""
+    name = (name or os.environ.get("JUDGE_BACKEND", "gemini")).lower()
+    if name == "gemini":
+        return GeminiBackend(api_key=os.environ.get("GOOGLE_API_KEY"),
+                             min_cache_tokens=int(os.environ.get("GEMINI_MIN_CACHE_TOKENS", "4096")))
+    if name == "local":
+        return LocalStandInBackend.from_env()
+    raise ValueError(f"Unknown JUDGE_BACKEND '{name}' (expected 'gemini' or 'local')")
@@ -0,0 +1,207 @@
+import os
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+
+# Cache of Step 2 judgements (reasoning + score), keyed by the screenshot's
+# content hash and everything else that goes into the vision prompt.
+# Tier 1 is an in-memory LRU, tier 2 is a directory of small JSON files
+# that survives restarts and is trimmed to a maximum total size.
+
+def make_judgement_key(image_bytes, task_description, key_points, model_name, *extra):
+    """
+    Builds the cache key for one Step 2 call. `extra` takes anything else
+    that changes the judgement, such as the prompt text or preprocessing.
+    """
+    h = hashlib.sha256()
+    h.update(hashlib.sha256(image_bytes).digest())
+    for part in (task_description, "\n".join(key_points), model_name, *extra):
+        h.update(b"\0")
+        h.update(part.encode("utf-8"))
+    return h.hexdigest()
+
+class JudgeCache:
+    def __init__(self, cache_dir=None, max_memory_entries=1024, max_disk_bytes=64 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_bytes = max_disk_bytes
+        self._memory = OrderedDict()
+        self._in_flight = {}
+        self._lock = threading.Lock()
+        self._disk_bytes = 0
+        self.counters = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "in_flight_hits": 0,
+            "misses": 0,
+            "disk_evictions": 0,
+        }
+        if self.cache_dir:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            self._disk_bytes = sum(size for _, size, _ in self._disk_entries())
+
+    def get_or_compute(self, key, compute, cacheable=None):
+        """
+        Returns (value, hit). On a miss, compute() is called and its result
+        stored, unless cacheable(value) is False (e.g. an unreadable model
+        response, which is better asked again next time). Concurrent callers
+        asking for the same key wait for the first one instead of computing
+        it again.
+        """
+        while True:
+            with self._lock:
+                value = self._memory_get(key)
+                if value is not None:
+                    self.counters["memory_hits"] += 1
+                    return value, True
+                waiter = self._in_flight.get(key)
+                if waiter is None:
+                    self._in_flight[key] = threading.Event()
+                    break
+            # Someone else is computing this key; wait, then re-check.
+            # If their call failed we loop round and compute it ourselves.
+            waiter.wait()
+            with self._lock:
+                value = self._memory_get(key)
+                if value is not None:
+                    self.counters["in_flight_hits"] += 1
+                    return value, True
+
+        try:
+            value = self._disk_get(key)
+            if value is not None:
+                with self._lock:
+                    self.counters["disk_hits"] += 1
+                    self._memory_put(key, value)
+                return value, True
+
+            with self._lock:
+                self.counters["misses"] += 1
+            value = compute()
+            if cacheable is not None and not cacheable(value):
+                return value, False
+            with self._lock:
+                self._memory_put(key, value)
+            self._disk_put(key, value)
+            return value, False
+        finally:
+            with self._lock:
+                self._in_flight.pop(key).set()
+
+    def get(self, key):
+        """Returns the cached value, or None, without computing anything."""
+        with self._lock:
+            value = self._memory_get(key)
+            if value is not None:
+                self.counters["memory_hits"] += 1
+                return value
+        value = self._disk_get(key)
+        with self._lock:
+            if value is None:
+                self.counters["misses"] += 1
+            else:
+                self.counters["disk_hits"] += 1
+                self._memory_put(key, value)
+        return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._memory_put(key, value)
+        self._disk_put(key, value)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counters)
+            stats["memory_entries"] = len(self._memory)
+            stats["disk_bytes"] = self._disk_bytes
+        hits = stats["memory_hits"] + stats["disk_hits"] + stats["in_flight_hits"]
+        lookups = hits + stats["misses"]
+        stats["hits"] = hits
+        stats["hit_rate"] = round(hits / lookups, 4) if lookups else 0.0
+        return stats
+
+    # --- memory tier (caller holds self._lock) ---
+
+    def _memory_get(self, key):
+        value = self._memory.get(key)
+        if value is not None:
+            self._memory.move_to_end(key)
+        return value
+
+    def _memory_put(self, key, value):
+        self._memory[key] = value
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+
+    # --- disk tier ---
+
+    def _disk_path(self, key):
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+
+    def _disk_entries(self):
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if name.endswith(".json"):
+                    path = os.path.join(root, name)
+                    try:
+                        st = os.stat(path)
+                    except OSError:
+                        continue
+                    yield path, st.st_size, st.st_mtime
+
+    def _disk_get(self, key):
+        if not self.cache_dir:
+            return None
+        path = self._disk_path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                value = json.load(f)
+            os.utime(path)  # mtime doubles as last-used time for eviction
+            return value
+        except (OSError, ValueError):
+            return None
+
+    def _disk_put(self, key, value):
+        if not self.cache_dir:
+            return
+        path = self._disk_path(key)
+        data = json.dumps(value).encode("utf-8")
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            try:
+                replaced = os.path.getsize(path)  # an entry being overwritten is no longer counted
+            except OSError:
+                replaced = 0
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"DEBUG (JudgeCache): Failed to write {path}: {e}")
+            return
+        with self._lock:
+            self._disk_bytes += len(data) - replaced
+            over_budget = self._disk_bytes > self.max_disk_bytes
+        if over_budget:
+            self._evict_disk()
+
+    def _evict_disk(self):
+        """Deletes least recently used files until the disk tier is back under 90% of its cap."""
+        entries = sorted(self._disk_entries(), key=lambda e: e[2])
+        total = sum(size for _, size, _ in entries)
+        target = self.max_disk_bytes * 0.9
+        evicted = 0
+        for path, size, _ in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            evicted += 1
+        with self._lock:
+            self._disk_bytes = total
+            self.counters["disk_evictions"] += evicted
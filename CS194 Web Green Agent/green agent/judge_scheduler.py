@@ -0,0 +1,165 @@
+import time
+import heapq
+import random
+import itertools
+import threading
+
+# Shared scheduler for judge model calls across all assessments in the
+# process. Calls wait in one priority queue and go out when
+#   - fewer than max_concurrency calls are running,
+#   - the requests-per-minute and tokens-per-minute buckets allow it, and
+#   - no rate-limit backoff is in force.
+# Lower priority numbers go first (Step 3, then Step 1, then Step 2, so an
+# assessment that is nearly done is not held up behind new ones), and calls
+# of equal priority go in arrival order. A call that fails with a retryable
+# status (429 or 5xx) pauses everyone for the provider's Retry-After hint,
+# or a jittered exponential backoff, and is then retried in its old place.
+
+STEP_PRIORITIES = {3: 0, 1: 1, 2: 2}
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+class TokenBucket:
+    """Refills at per_minute / 60 per second up to per_minute; 0 = unlimited."""
+    def __init__(self, per_minute):
+        self.per_minute = per_minute
+        self.level = float(per_minute)
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.level = min(self.per_minute, self.level + (now - self.updated) * self.per_minute / 60)
+        self.updated = now
+
+    def wait_time(self, amount, now):
+        """Seconds until amount can be taken (amounts above the capacity wait for a full bucket)."""
+        if not self.per_minute:
+            return 0.0
+        self._refill(now)
+        missing = min(amount, self.per_minute) - self.level
+        return max(0.0, missing * 60 / self.per_minute)
+
+    def take(self, amount, now):
+        """Takes amount; may leave the bucket in debt when a call used more than estimated."""
+        if self.per_minute:
+            self._refill(now)
+            self.level -= amount
+
+class JudgeScheduler:
+    def __init__(self, max_concurrency=8, requests_per_minute=0, tokens_per_minute=0, max_retries=3,
+                 backoff_base=1.0, backoff_max=60.0, on_wait=None, on_retry=None):
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.on_wait = on_wait    # on_wait(step, seconds) after each call is let through
+        self.on_retry = on_retry  # on_retry(step, status, delay) before each retry
+        self._requests = TokenBucket(requests_per_minute)
+        self._tokens = TokenBucket(tokens_per_minute)
+        self._waiting = []  # heap of (priority, sequence)
+        self._waiting_steps = {}  # sequence -> step
+        self._running = 0
+        self._blocked_until = 0.0
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+        self._stats = {"calls": 0, "retries": 0, "rate_limited": 0, "failed": 0, "max_queue_depth": 0,
+                       "throttled_seconds": 0.0}
+        self._waits = {}  # step -> [count, total seconds, max seconds]
+
+    def call(self, step, fn, estimated_tokens=0, actual_tokens=None):
+        """
+        Runs fn() when the scheduler lets a call for this step through and
+        returns its result. actual_tokens(result), if given, settles the
+        token bucket with what the call really used. Retryable errors are
+        retried up to max_retries times; anything else is raised at once.
+        """
+        priority = STEP_PRIORITIES.get(step, len(STEP_PRIORITIES))
+        ticket = (priority, next(self._sequence))
+        for attempt in range(self.max_retries + 1):
+            self._acquire(step, ticket, estimated_tokens)
+            try:
+                result = fn()
+            except Exception as e:
+                status = getattr(e, "status", None)
+                if status not in RETRY_STATUSES or attempt == self.max_retries:
+                    self._release(failed=True)
+                    raise
+                delay = self._backoff(attempt, getattr(e, "retry_after", None))
+                self._release(retry_delay=delay, rate_limited=status == 429)
+                if self.on_retry:
+                    self.on_retry(step, status, delay)
+                continue
+            used = actual_tokens(result) if actual_tokens else None
+            self._release(extra_tokens=(used - estimated_tokens) if used is not None else 0)
+            return result
+
+    def _acquire(self, step, ticket, tokens):
+        queued = time.monotonic()
+        with self._condition:
+            heapq.heappush(self._waiting, ticket)
+            self._waiting_steps[ticket[1]] = step
+            self._stats["max_queue_depth"] = max(self._stats["max_queue_depth"], len(self._waiting))
+            while True:
+                if self._waiting[0] == ticket and self._running < self.max_concurrency:
+                    now = time.monotonic()
+                    wait = max(self._blocked_until - now, self._requests.wait_time(1, now),
+                               self._tokens.wait_time(tokens, now))
+                    if wait <= 0:
+                        break
+                    # Only the head of the queue waits on the buckets, so
+                    # nothing behind it can overtake it
+                    self._condition.wait(wait)
+                    self._stats["throttled_seconds"] += time.monotonic() - now
+                else:
+                    self._condition.wait()
+            heapq.heappop(self._waiting)
+            del self._waiting_steps[ticket[1]]
+            self._requests.take(1, now)
+            self._tokens.take(tokens, now)
+            self._running += 1
+            self._stats["calls"] += 1
+            waited = now - queued
+            waits = self._waits.setdefault(step, [0, 0.0, 0.0])
+            waits[0] += 1
+            waits[1] += waited
+            waits[2] = max(waits[2], waited)
+            self._condition.notify_all()
+        if self.on_wait:
+            self.on_wait(step, waited)
+
+    def _release(self, failed=False, retry_delay=None, rate_limited=False, extra_tokens=0):
+        with self._condition:
+            self._running -= 1
+            now = time.monotonic()
+            if extra_tokens:
+                self._tokens.take(extra_tokens, now)
+            if failed:
+                self._stats["failed"] += 1
+            if retry_delay is not None:
+                self._stats["retries"] += 1
+                self._stats["rate_limited"] += rate_limited
+                self._blocked_until = max(self._blocked_until, now + retry_delay)
+            self._condition.notify_all()
+
+    def _backoff(self, attempt, retry_after=None):
+        if retry_after is not None:
+            return min(float(retry_after), self.backoff_max)
+        # Full jitter: anywhere between 0 and the exponential cap
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def stats(self):
+        with self._condition:
+            queued = {}
+            for step in self._waiting_steps.values():
+                queued[step] = queued.get(step, 0) + 1
+            return {
+                **self._stats,
+                "throttled_seconds": round(self._stats["throttled_seconds"], 3),
+                "queue_depth": len(self._waiting),
+                "queued_by_step": queued,
+                "running": self._running,
+                "max_concurrency": self.max_concurrency,
+                "requests_per_minute": self._requests.per_minute,
+                "tokens_per_minute": self._tokens.per_minute,
+                "backoff_remaining_seconds": round(max(0.0, self._blocked_until - time.monotonic()), 3),
+                "wait_seconds": {step: {"calls": count, "mean": round(total / count, 4), "max": round(peak, 4)}
+                                 for step, (count, total, peak) in sorted(self._waits.items())},
+            }
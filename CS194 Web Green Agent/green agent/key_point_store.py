@@ -0,0 +1,102 @@
+import os
+import json
+import hashlib
+import threading
+import contextlib
+try:
+    import fcntl
+except ImportError:  # Windows, where the server runs as a single process
+    fcntl = None
+
+# Persistent store of Step 1 key points, keyed by task_id.
+# Every entry records the version (hash of the Step 1 prompt and text model)
+# and the task text it was generated from, so editing PROMPT_STEP_1,
+# switching models or a changed task description makes the entry stale.
+
+def key_point_version(prompt_text, model_name):
+    """Version string for key points produced by this prompt/model pair."""
+    return hashlib.sha256(f"{model_name}\0{prompt_text}".encode("utf-8")).hexdigest()[:16]
+
+def _task_hash(task_description):
+    return hashlib.sha256(task_description.encode("utf-8")).hexdigest()[:16]
+
+class KeyPointStore:
+    """
+    Safe to share between worker processes: saving merges with whatever
+    is on disk, and a lookup that misses re-reads the file if another
+    process has written it since.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._loaded_mtime = None
+        self._lock = threading.Lock()
+        self._entries = self._read()
+
+    def _read(self):
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            mtime = os.path.getmtime(self.path)
+            with open(self.path, "r", encoding="utf-8") as f:
+                entries = json.load(f).get("entries", {})
+            self._loaded_mtime = mtime
+            return entries
+        except (OSError, ValueError) as e:
+            print(f"DEBUG (KeyPointStore): Ignoring unreadable store '{self.path}': {e}")
+            return {}
+
+    def _reload_if_changed(self):
+        try:
+            changed = os.path.getmtime(self.path) != self._loaded_mtime
+        except OSError:
+            return
+        if changed:
+            with self._lock:
+                self._entries = {**self._read(), **self._entries}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, task_id, version, task_description):
+        """Returns the stored key points, or None if missing or stale."""
+        entry = self._entries.get(task_id)
+        if entry is None:
+            self._reload_if_changed()
+            entry = self._entries.get(task_id)
+        if (entry is None or entry["version"] != version
+                or entry["task_hash"] != _task_hash(task_description)):
+            return None
+        return entry["key_points"]
+
+    def put(self, task_id, version, task_description, key_points):
+        """Stores key points for a task and writes the store back to disk."""
+        with self._lock:
+            self._entries[task_id] = {
+                "version": version,
+                "task_hash": _task_hash(task_description),
+                "key_points": list(key_points),
+            }
+            self._save()
+
+    @contextlib.contextmanager
+    def _file_lock(self):
+        """Held across read-merge-write so concurrent worker processes can't drop each other's entries."""
+        if fcntl is None:
+            yield
+            return
+        with open(f"{self.path}.lock", "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _save(self):
+        with self._file_lock():
+            # Keep entries other processes have added since we last read the file
+            self._entries = {**self._read(), **self._entries}
+            tmp_path = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"entries": self._entries}, f, indent=1)
+            os.replace(tmp_path, self.path)
+            self._loaded_mtime = os.path.getmtime(self.path)
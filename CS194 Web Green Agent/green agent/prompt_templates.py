@@ -0,0 +1,186 @@
+import re
+import time
+import threading
+import contextlib
+from collections import OrderedDict
+
+# Compiled prompt templates, and the shared Step 2 prefix.
+#
+# A PromptTemplate is split at its placeholders once, so rendering is a
+# single join instead of a chain of str.replace calls over the whole prompt.
+#
+# Every Step 2 call for an assessment sends the same instructions, task and
+# key points; only the screenshot changes. PrefixCache renders that prefix
+# once per (template, task, key points) and, when the judge backend can
+# cache context (create_prefix_cache), registers it there so each call
+# only sends the screenshot. Backends that can't, or prefixes the provider
+# won't cache (e.g. too short), fall back to sending the text every time.
+# Prefixes below the backend's min_cache_tokens are not even offered to it.
+# Creating the cached copy goes through the same call function (the judge
+# scheduler) as every judge call, so it counts against the rate limits and
+# is retried the same way; calls meanwhile send the text. Other failures to
+# cache (timeouts, 5xx) only send the text until a later retry. A backend handle is released once no call is using it, so evicting
+# or refreshing a prefix never pulls it from under a request in flight.
+
+# Provider statuses that mean it will not cache this prefix, however often asked
+REFUSED_STATUSES = (400, 404)
+
+class PromptTemplate:
+    def __init__(self, text, placeholders):
+        """placeholders maps names to the literal markers in text, e.g. {"task": "(task)"}."""
+        self.text = text
+        self.placeholders = dict(placeholders)
+        names = {marker: name for name, marker in self.placeholders.items()}
+        pattern = "|".join(re.escape(marker) for marker in sorted(names, key=len, reverse=True))
+        self._segments = []  # literal strings and (name,) placeholders, in order
+        position = 0
+        for match in re.finditer(pattern, text):
+            self._segments.append(text[position:match.start()])
+            self._segments.append((names[match.group(0)],))
+            position = match.end()
+        self._segments.append(text[position:])
+
+    def render(self, **values):
+        missing = set(self.placeholders) - set(values)
+        if missing:
+            raise KeyError(f"No value for placeholder(s) {', '.join(sorted(missing))}")
+        return "".join(segment if isinstance(segment, str) else str(values[segment[0]])
+                       for segment in self._segments)
+
+class SharedPrefix:
+    """A rendered prompt prefix and, if the backend cached it, the backend's handle."""
+    def __init__(self, text):
+        self.text = text
+        self.handle = None
+        self.created_at = None
+        self.failures = 0   # failed attempts to cache it in a row
+        self.retry_at = 0.0  # no new attempt before this time
+        self.creating = False  # a thread is creating the backend's copy
+        # Guarded by PrefixCache._lock
+        self.users = 0  # calls inside PrefixCache.use()
+        self.evicted = False
+        self.stale_handles = []  # replaced handles, released once users drops to 0
+        self._lock = threading.Lock()
+
+class PrefixCache:
+    def __init__(self, max_entries=64, ttl_seconds=600, use_backend_cache=True, call=None):
+        """call(step, fn, estimated_tokens=...) runs fn, e.g. JudgeScheduler.call; by default fn is called directly."""
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.use_backend_cache = use_backend_cache
+        self.call = call or (lambda step, fn, estimated_tokens=0: fn())
+        self._prefixes = OrderedDict()  # key -> SharedPrefix, least recently used first
+        self._unsupported = set()  # (backend name, step) the backend refused to cache
+        self._lock = threading.Lock()
+        self.counters = {"rendered": 0, "reused": 0, "backend_cached": 0, "backend_refused": 0,
+                         "backend_too_small": 0, "backend_errors": 0, "backend_released": 0}
+
+    @contextlib.contextmanager
+    def use(self, backend, step, template, **values):
+        """
+        The shared prefix for these values, cached in the backend if possible.
+        Its backend handle is not released before the with block ends.
+        """
+        key = (id(template), step, getattr(backend, "name", ""), tuple(sorted(
+            (name, tuple(v) if isinstance(v, list) else v) for name, v in values.items())))
+        unused = []
+        with self._lock:
+            prefix = self._prefixes.get(key)
+            if prefix is None:
+                prefix = SharedPrefix(template.render(**values))
+                self._prefixes[key] = prefix
+                self.counters["rendered"] += 1
+                while len(self._prefixes) > self.max_entries:
+                    old = self._prefixes.popitem(last=False)[1]
+                    old.evicted = True
+                    if not old.users:
+                        unused.extend(self._take_handles(old))
+            else:
+                self._prefixes.move_to_end(key)
+                self.counters["reused"] += 1
+            prefix.users += 1
+        self._release(backend, unused)
+        try:
+            self._ensure_backend_cache(backend, step, prefix)
+            yield prefix
+        finally:
+            with self._lock:
+                prefix.users -= 1
+                unused = [] if prefix.users else self._take_handles(prefix)
+            self._release(backend, unused)
+
+    def _take_handles(self, prefix):
+        """Handles of an unused prefix that can go: replaced ones, and the current one if evicted (holds _lock)."""
+        handles, prefix.stale_handles = prefix.stale_handles, []
+        if prefix.evicted and prefix.handle is not None:
+            handles.append(prefix.handle)
+            prefix.handle = None
+        return handles
+
+    def _ensure_backend_cache(self, backend, step, prefix):
+        if not self.use_backend_cache or not hasattr(backend, "create_prefix_cache"):
+            return
+        if (getattr(backend, "name", ""), step) in self._unsupported:
+            return
+        tokens = len(prefix.text) // 4
+        if tokens < getattr(backend, "min_cache_tokens", 0):
+            # The provider would refuse it; don't spend a request finding out
+            with self._lock:
+                self.counters["backend_too_small"] += 1
+            return
+        with prefix._lock:
+            now = time.time()
+            # Re-create the backend's copy a little before it expires
+            if prefix.handle is not None and now - prefix.created_at < 0.9 * self.ttl_seconds:
+                return
+            if prefix.creating or now < prefix.retry_at:
+                return
+            prefix.creating = True
+        try:
+            handle = self.call(step, lambda: backend.create_prefix_cache(step, prefix.text, self.ttl_seconds),
+                               estimated_tokens=tokens)
+        except Exception as e:
+            name = getattr(backend, "name", "backend")
+            if getattr(e, "status", None) in REFUSED_STATUSES:
+                print(f"DEBUG (PrefixCache): {name} won't cache the Step {step} "
+                      f"prefix, sending it with every call instead: {e}")
+                with self._lock:
+                    self._unsupported.add((getattr(backend, "name", ""), step))
+                    self.counters["backend_refused"] += 1
+                with prefix._lock:
+                    prefix.creating = False
+                return
+            with prefix._lock:
+                prefix.creating = False
+                prefix.failures += 1
+                delay = min(self.ttl_seconds, 5 * 2 ** (prefix.failures - 1))
+                prefix.retry_at = time.time() + delay
+            print(f"DEBUG (PrefixCache): Could not cache the Step {step} prefix with {name}, "
+                  f"sending it as text and retrying in {delay:.0f}s: {e}")
+            with self._lock:
+                self.counters["backend_errors"] += 1
+            return
+        with prefix._lock, self._lock:
+            prefix.creating = False
+            prefix.failures = 0
+            if prefix.handle is not None:
+                prefix.stale_handles.append(prefix.handle)
+            prefix.handle = handle
+            prefix.created_at = time.time()
+            self.counters["backend_cached"] += 1
+
+    def _release(self, backend, handles):
+        if not hasattr(backend, "release_prefix_cache"):
+            return
+        for handle in handles:
+            try:
+                backend.release_prefix_cache(handle)
+                with self._lock:
+                    self.counters["backend_released"] += 1
+            except Exception as e:
+                print(f"DEBUG (PrefixCache): Could not release a cached prefix: {e}")
+
+    def stats(self):
+        with self._lock:
+            return {**self.counters, "entries": len(self._prefixes), "max_entries": self.max_entries,
+                    "ttl_seconds": self.ttl_seconds, "use_backend_cache": self.use_backend_cache}
@@ -0,0 +1,166 @@
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+
+# Persistent store of finished assessments, in one SQLite file.
+#
+# A result is keyed by task_id, participant URL, the hash of the trajectory
+# the white agent returned (its action history and the SHA-256 of every
+# screenshot) and the judge version (models, prompts and every setting that
+# changes a verdict). Resubmitting the same trajectory under the same judge
+# finds the stored verdict, so no judge call is repeated; a new trajectory,
+# an edited task or a different judge is assessed as usual. Each stored
+# result also counts how often it was submitted.
+#
+# Per-participant success rates are computed with one indexed GROUP BY, so
+# leaderboards stay cheap however many results accumulate. The database is
+# in WAL mode, so several worker processes can share it.
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    id INTEGER PRIMARY KEY,
+    task_id TEXT NOT NULL,
+    participant_url TEXT NOT NULL,
+    trajectory_hash TEXT NOT NULL,
+    judge_version TEXT NOT NULL,
+    task_hash TEXT NOT NULL,
+    webjudge_status TEXT NOT NULL,
+    success INTEGER NOT NULL,
+    screenshots INTEGER NOT NULL,
+    payload TEXT NOT NULL,
+    recorded_at REAL NOT NULL,
+    last_submitted_at REAL NOT NULL,
+    submissions INTEGER NOT NULL DEFAULT 1,
+    UNIQUE (task_id, participant_url, trajectory_hash, judge_version)
+);
+CREATE INDEX IF NOT EXISTS results_by_participant ON results (judge_version, participant_url, success);
+CREATE INDEX IF NOT EXISTS results_by_task ON results (judge_version, task_id, participant_url);
+"""
+
+def judge_version(*parts):
+    """Version string for verdicts produced with these models, prompts and settings."""
+    h = hashlib.sha256()
+    for part in parts:
+        h.update(json.dumps(part, sort_keys=True, default=str).encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()[:16]
+
+def trajectory_hash(action_history, screenshot_hashes):
+    """Hash of a trajectory: its action history and the SHA-256 of each screenshot, in order."""
+    h = hashlib.sha256(json.dumps(action_history, sort_keys=True, default=str).encode("utf-8"))
+    for screenshot_hash in screenshot_hashes:
+        h.update(b"\0" + screenshot_hash.encode("ascii"))
+    return h.hexdigest()
+
+def _task_hash(task_description):
+    return hashlib.sha256(task_description.encode("utf-8")).hexdigest()[:16]
+
+class ResultStore:
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()  # one connection per thread
+        self._lock = threading.Lock()
+        self.counters = {"hits": 0, "misses": 0, "stored": 0}
+        with self._connection() as db:
+            db.executescript(SCHEMA)
+
+    def _connection(self):
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=30)
+            db.row_factory = sqlite3.Row
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db = db
+        return db
+
+    def _count(self, name):
+        with self._lock:
+            self.counters[name] += 1
+
+    def has_results(self, task_id, participant_url, version):
+        """True if anything is stored for this task and participant under this judge version."""
+        row = self._connection().execute(
+            "SELECT 1 FROM results WHERE judge_version = ? AND task_id = ? AND participant_url = ? LIMIT 1",
+            (version, task_id, participant_url)).fetchone()
+        return row is not None
+
+    def get(self, task_id, participant_url, trajectory, version, task_description):
+        """
+        The stored result for this trajectory, counting the resubmission, or
+        None if there is none or the task description has changed since.
+        Returns {"result_id", "payload", "recorded_at", "submissions"}.
+        """
+        with self._connection() as db:
+            row = db.execute(
+                "SELECT id, task_hash, payload, recorded_at, submissions FROM results "
+                "WHERE task_id = ? AND participant_url = ? AND trajectory_hash = ? AND judge_version = ?",
+                (task_id, participant_url, trajectory, version)).fetchone()
+            if row is None or row["task_hash"] != _task_hash(task_description):
+                self._count("misses")
+                return None
+            db.execute("UPDATE results SET submissions = submissions + 1, last_submitted_at = ? WHERE id = ?",
+                       (time.time(), row["id"]))
+        self._count("hits")
+        return {"result_id": row["id"], "payload": json.loads(row["payload"]), "recorded_at": row["recorded_at"],
+                "submissions": row["submissions"] + 1}
+
+    def put(self, task_id, participant_url, trajectory, version, task_description, payload, screenshots):
+        """Stores the result of an assessment, replacing one for the same trajectory. Returns its id."""
+        now = time.time()
+        status = payload["webjudge_status"]
+        with self._connection() as db:
+            db.execute(
+                "INSERT INTO results (task_id, participant_url, trajectory_hash, judge_version, task_hash, "
+                "webjudge_status, success, screenshots, payload, recorded_at, last_submitted_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (task_id, participant_url, trajectory_hash, judge_version) DO UPDATE SET "
+                "task_hash = excluded.task_hash, webjudge_status = excluded.webjudge_status, "
+                "success = excluded.success, screenshots = excluded.screenshots, payload = excluded.payload, "
+                "recorded_at = excluded.recorded_at, last_submitted_at = excluded.last_submitted_at, "
+                "submissions = submissions + 1",
+                (task_id, participant_url, trajectory, version, _task_hash(task_description), status,
+                 int(status == "success"), screenshots, json.dumps(payload), now, now))
+            result_id = db.execute(
+                "SELECT id FROM results WHERE task_id = ? AND participant_url = ? AND trajectory_hash = ? "
+                "AND judge_version = ?", (task_id, participant_url, trajectory, version)).fetchone()["id"]
+        self._count("stored")
+        return result_id
+
+    def leaderboard(self, version=None, task_id=None):
+        """
+        Success rate per participant over their distinct stored trajectories
+        (all judge versions if version is None), best first.
+        """
+        where, params = self._filters(version=version, task_id=task_id)
+        rows = self._connection().execute(
+            "SELECT participant_url, COUNT(*) AS results, SUM(success) AS successes, "
+            "COUNT(DISTINCT task_id) AS tasks, COUNT(DISTINCT CASE WHEN success THEN task_id END) AS tasks_solved, "
+            "SUM(submissions) AS submissions, MAX(last_submitted_at) AS last_submitted_at "
+            f"FROM results {where} GROUP BY participant_url "
+            "ORDER BY CAST(SUM(success) AS REAL) / COUNT(*) DESC, COUNT(*) DESC", params).fetchall()
+        return [dict(row, success_rate=round(row["successes"] / row["results"], 4)) for row in rows]
+
+    def results(self, version=None, task_id=None, participant_url=None, limit=100):
+        """The most recently submitted results, without their stored payloads."""
+        where, params = self._filters(version=version, task_id=task_id, participant_url=participant_url)
+        rows = self._connection().execute(
+            "SELECT id, task_id, participant_url, trajectory_hash, judge_version, webjudge_status, screenshots, "
+            f"recorded_at, last_submitted_at, submissions FROM results {where} "
+            "ORDER BY last_submitted_at DESC LIMIT ?", params + [limit]).fetchall()
+        return [dict(row) for row in rows]
+
+    def _filters(self, **filters):
+        columns = {"version": "judge_version", "task_id": "task_id", "participant_url": "participant_url"}
+        conditions = [(f"{columns[name]} = ?", value) for name, value in filters.items() if value is not None]
+        where = "WHERE " + " AND ".join(c for c, _ in conditions) if conditions else ""
+        return where, [value for _, value in conditions]
+
+    def stats(self):
+        row = self._connection().execute(
+            "SELECT COUNT(*) AS results, COUNT(DISTINCT participant_url) AS participants, "
+            "COUNT(DISTINCT judge_version) AS judge_versions FROM results").fetchone()
+        with self._lock:
+            return {**self.counters, **dict(row), "path": self.path}
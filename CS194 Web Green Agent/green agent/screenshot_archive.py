@@ -0,0 +1,350 @@
+import os
+import json
+import time
+import uuid
+import queue
+import hashlib
+import threading
+import contextlib
+try:
+    import fcntl
+except ImportError:  # Windows, where the server runs as a single process
+    fcntl = None
+from screenshot_memory import screenshot_data, release_screenshot
+
+# Content-addressed archive of the screenshots white agents send back.
+#
+#   <root>/objects/ab/<sha256>.png   one file per distinct image
+#   <root>/runs/<run_id>.json        manifest: run attributes, action history
+#                                    and the screenshots in trajectory order
+#   <root>/runs/<run_id>.open        images of a run still being received
+#   <root>/totals.json               running object, byte and run counts
+#
+# Screenshots are handed to a background writer thread, so saving them
+# never holds up judging. Identical frames, within a run or across runs,
+# are stored once. When the archive grows past its size or run cap the
+# oldest runs are dropped, along with images no other run refers to.
+# Writes keep totals.json up to date, so closing a run only reads that
+# file; the archive is rescanned only when a cap is exceeded, and eviction
+# then goes a tenth below the cap so the next scans are not back to back.
+#
+# Several worker processes may share one archive. Writing an image and
+# evicting runs hold a lock on <root>/archive.lock, and eviction counts
+# references from the manifests and .open files on disk, so the caps apply
+# to the whole archive and no process deletes an image another one still
+# uses. A .open file left by a worker that died mid-run is ignored once it
+# has not changed for abandoned_run_seconds.
+
+def _extension(data):
+    if data.startswith(b"\x89PNG"):
+        return ".png"
+    if data.startswith(b"\xff\xd8"):
+        return ".jpg"
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return ".webp"
+    return ".bin"
+
+def _write_atomic(path, data):
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+class ArchiveRun:
+    """One assessment's screenshots. add() and close() only enqueue work."""
+    def __init__(self, archive, run_id, attributes):
+        self.archive = archive
+        self.run_id = run_id
+        self.attributes = attributes
+        self.created_at = time.time()
+        self.screenshots = []  # filled in by the writer thread
+        self.write_seconds = 0.0  # spent by the writer thread decoding and writing them
+
+    def add(self, index, screenshot):
+        """
+        Queues a screenshot (a Screenshot, raw bytes or a base64 string) for
+        writing. A Screenshot is released as "archive" once written or dropped.
+        """
+        self.archive._enqueue(("screenshot", self, index, screenshot))
+
+    def close(self, complete=True, **attributes):
+        """Queues the run's manifest; attributes (e.g. action_history) are added to it."""
+        self.attributes.update(attributes)
+        self.archive._enqueue(("close", self, complete, None))
+
+class ScreenshotArchive:
+    def __init__(self, root, max_bytes=1024 * 1024 * 1024, max_runs=0, queue_depth=128,
+                 abandoned_run_seconds=3600):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.max_runs = max_runs  # 0 = no limit
+        self.abandoned_run_seconds = abandoned_run_seconds  # must outlast the longest assessment
+        self._objects_dir = os.path.join(root, "objects")
+        self._runs_dir = os.path.join(root, "runs")
+        os.makedirs(self._objects_dir, exist_ok=True)
+        os.makedirs(self._runs_dir, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._counts = {"runs": 0, "screenshots": 0, "objects_written": 0, "deduplicated": 0,
+                        "dropped": 0, "runs_evicted": 0, "objects_evicted": 0, "errors": 0,
+                        "write_seconds": 0.0}
+        self._parsed = {}  # manifest file name -> (created_at, run_id, object names); manifests never change
+        self._disk = {"objects": 0, "bytes": 0, "stored_runs": 0}  # as of the last read of totals.json
+        self._totals_path = os.path.join(root, "totals.json")
+        with self._file_lock():
+            # Rebuilt on start, which also corrects any drift left by a worker that died mid-write
+            self._scan()
+            self._write_totals()
+
+        self._queue = queue.Queue(maxsize=queue_depth)
+        threading.Thread(target=self._write_loop, name="screenshot-archive", daemon=True).start()
+
+    def start_run(self, **attributes):
+        """Starts archiving a run; the id is unique across threads and processes."""
+        run_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        with self._lock:
+            self._counts["runs"] += 1
+        return ArchiveRun(self, run_id, attributes)
+
+    def manifest(self, run_id):
+        """A finished run's manifest, or None."""
+        try:
+            with open(os.path.join(self._runs_dir, f"{run_id}.json"), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def object_path(self, name):
+        return os.path.join(self._objects_dir, name[:2], name)
+
+    def flush(self, timeout=None):
+        """Waits until everything queued so far has been written."""
+        deadline = None if timeout is None else time.time() + timeout
+        with self._queue.all_tasks_done:
+            while self._queue.unfinished_tasks:
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._queue.all_tasks_done.wait(remaining)
+        return True
+
+    def stats(self):
+        """Counters for this process; objects, bytes and stored_runs cover the whole archive as last read."""
+        with self._lock:
+            return {**self._counts, **self._disk, "max_bytes": self.max_bytes,
+                    "max_runs": self.max_runs, "queued": self._queue.qsize()}
+
+    def _enqueue(self, item):
+        if item[0] == "close":
+            # Closing writes the manifest and removes the run's .open file, so it is never
+            # skipped; waiting here only happens once per run, after it has been judged
+            self._queue.put(item)
+            return
+        try:
+            # Never block an assessment; if the writer is this far behind, skip the frame
+            self._queue.put_nowait(item)
+        except queue.Full:
+            with self._lock:
+                self._counts["dropped"] += 1
+            release_screenshot(item[3], "archive")
+
+    @contextlib.contextmanager
+    def _file_lock(self):
+        """Serializes writing images and evicting runs across the processes sharing the archive."""
+        if fcntl is None:
+            yield
+            return
+        with open(os.path.join(self.root, "archive.lock"), "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _scan(self):
+        """
+        Reads the archive as every process has left it (caller holds the file
+        lock). Returns (manifests oldest first as (created_at, run_id, names),
+        names used by open runs, {object name: bytes}).
+        """
+        manifests = []
+        in_use = set()
+        seen = set()
+        abandoned = time.time() - self.abandoned_run_seconds
+        for entry in os.scandir(self._runs_dir):
+            if entry.name.endswith(".open"):
+                try:
+                    if entry.stat().st_mtime < abandoned:
+                        os.remove(entry.path)
+                        continue
+                    with open(entry.path, "r", encoding="utf-8") as f:
+                        in_use.update(f.read().split())
+                except OSError:
+                    pass
+                continue
+            if not entry.name.endswith(".json"):
+                continue
+            seen.add(entry.name)
+            parsed = self._parsed.get(entry.name)
+            if parsed is None:
+                try:
+                    with open(entry.path, "r", encoding="utf-8") as f:
+                        manifest = json.load(f)
+                except (OSError, ValueError):
+                    continue
+                parsed = (manifest.get("created_at", 0), manifest["run_id"],
+                          [s["object"] for s in manifest.get("screenshots", [])])
+                self._parsed[entry.name] = parsed
+            manifests.append(parsed)
+        for name in set(self._parsed) - seen:
+            del self._parsed[name]  # evicted by another process
+        manifests.sort()
+        objects = {}
+        for prefix in os.scandir(self._objects_dir):
+            if not prefix.is_dir():
+                continue
+            for entry in os.scandir(prefix.path):
+                if entry.name.endswith(".tmp"):
+                    continue
+                try:
+                    objects[entry.name] = entry.stat().st_size
+                except OSError:
+                    continue
+        with self._lock:
+            self._disk = {"objects": len(objects), "bytes": sum(objects.values()), "stored_runs": len(manifests)}
+        return manifests, in_use, objects
+
+    def _read_totals(self):
+        """Loads totals.json into self._disk (caller holds the file lock)."""
+        try:
+            with open(self._totals_path, "r", encoding="utf-8") as f:
+                totals = json.load(f)
+        except (OSError, ValueError):
+            # Missing or unreadable: count the archive again
+            self._scan()
+            self._write_totals()
+            return
+        with self._lock:
+            self._disk = {key: int(totals.get(key, 0)) for key in ("objects", "bytes", "stored_runs")}
+
+    def _write_totals(self, **changes):
+        """Adds changes to self._disk and saves it to totals.json (caller holds the file lock)."""
+        with self._lock:
+            for key, change in changes.items():
+                self._disk[key] += change
+            totals = dict(self._disk)
+        _write_atomic(self._totals_path, json.dumps(totals).encode("utf-8"))
+
+    def _over_limits(self, total_bytes, stored_runs, headroom=0.0):
+        if total_bytes > self.max_bytes * (1 - headroom):
+            return True
+        return bool(self.max_runs) and stored_runs > self.max_runs - int(self.max_runs * headroom)
+
+    def _write_loop(self):
+        while True:
+            kind, run, arg, screenshot = self._queue.get()
+            try:
+                if kind == "screenshot":
+                    started = time.perf_counter()
+                    try:
+                        self._write_screenshot(run, arg, screenshot)
+                    finally:
+                        elapsed = time.perf_counter() - started
+                        run.write_seconds += elapsed
+                        with self._lock:
+                            self._counts["write_seconds"] += elapsed
+                else:
+                    self._write_manifest(run, arg)
+                    self._enforce_limits()
+            except Exception as e:
+                print(f"DEBUG (ScreenshotArchive): Failed to archive for run {run.run_id}: {e}")
+                with self._lock:
+                    self._counts["errors"] += 1
+            finally:
+                if kind == "screenshot":
+                    release_screenshot(screenshot, "archive")
+                self._queue.task_done()
+
+    def _write_screenshot(self, run, index, screenshot):
+        data = screenshot_data(screenshot)
+        name = hashlib.sha256(data).hexdigest() + _extension(data)
+        path = self.object_path(name)
+        with self._file_lock():
+            stored = os.path.exists(path)  # by any process
+            if not stored:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                _write_atomic(path, data)
+                self._read_totals()
+                self._write_totals(objects=1, bytes=len(data))
+            # Until the manifest is written, this tells other processes the image is in use
+            with open(self._open_path(run), "a", encoding="utf-8") as f:
+                f.write(name + "\n")
+        with self._lock:
+            self._counts["deduplicated" if stored else "objects_written"] += 1
+            self._counts["screenshots"] += 1
+        run.screenshots.append({"index": index, "object": name, "bytes": len(data)})
+
+    def _write_manifest(self, run, complete):
+        manifest = {
+            "run_id": run.run_id,
+            "created_at": run.created_at,
+            "complete": complete,
+            "write_seconds": round(run.write_seconds, 4),
+            **run.attributes,
+            "screenshots": sorted(run.screenshots, key=lambda s: s["index"]),
+        }
+        path = os.path.join(self._runs_dir, f"{run.run_id}.json")
+        with self._file_lock():
+            _write_atomic(path, json.dumps(manifest, indent=1, default=str).encode("utf-8"))
+            self._read_totals()
+            self._write_totals(stored_runs=1)
+            self._remove(self._open_path(run))
+
+    def _open_path(self, run):
+        return os.path.join(self._runs_dir, f"{run.run_id}.open")
+
+    def _enforce_limits(self):
+        """Once either cap is exceeded, drops the oldest runs, archive-wide, until a tenth below it."""
+        with self._file_lock():
+            self._read_totals()
+            if not self._over_limits(self._disk["bytes"], self._disk["stored_runs"]):
+                return
+            manifests, in_use, objects = self._scan()
+            total_bytes = sum(objects.values())
+            refs = {}
+            for _, _, names in manifests:
+                for name in set(names):
+                    refs[name] = refs.get(name, 0) + 1
+            # Images left behind by abandoned runs go first
+            removable = [name for name in objects if name not in refs and name not in in_use]
+            runs_evicted = 0
+            while manifests and self._over_limits(total_bytes, len(manifests), headroom=0.1):
+                if len(manifests) <= 1 and not removable:
+                    break
+                if not removable:
+                    _, run_id, names = manifests.pop(0)
+                    self._remove(os.path.join(self._runs_dir, f"{run_id}.json"))
+                    runs_evicted += 1
+                    for name in set(names):
+                        refs[name] -= 1
+                        if refs[name] <= 0:
+                            del refs[name]
+                            if name in objects and name not in in_use:
+                                removable.append(name)
+                for name in removable:
+                    if self._remove(self.object_path(name)):
+                        total_bytes -= objects.pop(name)
+                        with self._lock:
+                            self._counts["objects_evicted"] += 1
+                removable = []
+            with self._lock:
+                self._counts["runs_evicted"] += runs_evicted
+                self._disk = {"objects": len(objects), "bytes": total_bytes, "stored_runs": len(manifests)}
+            self._write_totals()
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+            return True
+        except OSError:
+            return False
@@ -0,0 +1,154 @@
+import io
+import time
+import base64
+import threading
+from PIL import Image
+
+# Screenshots held in memory while assessments run.
+#
+# A Screenshot decodes the white agent's base64 (or takes the raw bytes of a
+# streamed frame) once; the archive writer, frame hashing and the judge all
+# read that one buffer, and the PIL image is only opened when the judge
+# needs it. Every consumer of a frame is registered as a holder, and when
+# the last one releases it the buffer and image are dropped.
+#
+# All screenshots in the process are charged to one MemoryBudget. When it
+# is full, an assessment waits before taking on another frame (so reading
+# the white agent's response slows down) until other frames are released.
+# An assessment holding no frames is never held back, so each one always
+# makes progress, and a wait ends after max_wait seconds at the latest.
+# Callers that must hold several frames before they can release any (a
+# Step 2 batch, or a whole trajectory to rank) take those without waiting.
+
+class MemoryBudget:
+    def __init__(self, max_bytes=0, max_wait=30.0):
+        self.max_bytes = max_bytes  # 0 = no limit
+        self.max_wait = max_wait
+        self._held = {}  # owner -> bytes
+        self._in_use = 0
+        self._condition = threading.Condition()
+        self._stats = {"peak_bytes": 0, "waits": 0, "wait_seconds": 0.0, "overcommitted": 0}
+
+    def acquire(self, nbytes, owner, wait=True):
+        """
+        Charges nbytes to owner, first waiting for room if wait is set. wait
+        may also be a function, checked again whenever memory is released:
+        the wait ends as soon as it returns False. Returns the seconds waited.
+        """
+        def blocked():
+            return (self._in_use + nbytes > self.max_bytes and self._held.get(owner, 0) > 0
+                    and (wait() if callable(wait) else wait))
+
+        with self._condition:
+            started = time.monotonic()
+            waiting = bool(self.max_bytes) and blocked()
+            if waiting:
+                self._stats["waits"] += 1
+                deadline = started + self.max_wait
+                while blocked():
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._stats["overcommitted"] += 1
+                        break
+                    self._condition.wait(remaining)
+            waited = time.monotonic() - started if waiting else 0.0
+            self._stats["wait_seconds"] += waited
+            self._held[owner] = self._held.get(owner, 0) + nbytes
+            self._in_use += nbytes
+            self._stats["peak_bytes"] = max(self._stats["peak_bytes"], self._in_use)
+        return waited
+
+    def release(self, nbytes, owner):
+        with self._condition:
+            self._in_use -= nbytes
+            self._held[owner] = self._held.get(owner, 0) - nbytes
+            if self._held[owner] <= 0:
+                del self._held[owner]
+            self._condition.notify_all()
+
+    def stats(self):
+        with self._condition:
+            return {**self._stats, "wait_seconds": round(self._stats["wait_seconds"], 3),
+                    "in_use_bytes": self._in_use, "max_bytes": self.max_bytes, "max_wait": self.max_wait,
+                    "owners": len(self._held)}
+
+class Screenshot:
+    """One received frame, decoded once and shared by everything that uses it."""
+    def __init__(self, index, screenshot, budget=None, owner=None, holders=(), wait=True):
+        """
+        screenshot is raw image bytes or a base64 string. holders names the
+        consumers that will release() the frame; with a budget, the frame is
+        charged to owner (one assessment) until the last of them has, after
+        waiting for room as MemoryBudget.acquire does. Raises ValueError
+        (binascii.Error) if the string is not valid base64.
+        """
+        self.index = index
+        self.budget = budget
+        self.owner = owner
+        self.waited = 0.0
+        self._holders = set(holders)
+        self._charged = 0
+        self._image = None
+        self._lock = threading.Lock()
+        if budget is not None:
+            # base64 decodes to three bytes for every four characters
+            self._charged = len(screenshot) * 3 // 4 if isinstance(screenshot, str) else len(screenshot)
+            self.waited = budget.acquire(self._charged, owner, wait=wait)
+        try:
+            self._data = base64.b64decode(screenshot, validate=True) if isinstance(screenshot, str) else bytes(screenshot)
+        except ValueError:
+            if budget is not None:
+                budget.release(self._charged, owner)
+            raise
+        self.nbytes = len(self._data)
+
+    def held_by(self, holder):
+        # No lock: the budget calls this while it waits, and a stale answer only means one more check
+        return holder in self._holders
+
+    @property
+    def data(self):
+        data = self._data
+        if data is None:
+            raise ValueError(f"Screenshot {self.index} has already been released")
+        return data
+
+    def image(self):
+        """The frame as a PIL image, opened on first use. Don't close it; release() does."""
+        with self._lock:
+            if self._image is None:
+                image = Image.open(io.BytesIO(self.data))
+                if self.budget is not None:
+                    # Decoded pixels; charged without waiting, the frame is already being judged
+                    pixels = image.width * image.height * len(image.getbands())
+                    self.budget.acquire(pixels, self.owner, wait=False)
+                    self._charged += pixels
+                self._image = image
+            return self._image
+
+    def release(self, holder):
+        """holder is done with the frame; the last one to release it frees it."""
+        with self._lock:
+            self._holders.discard(holder)
+            if self._holders or self._data is None:
+                return
+            if self._image is not None:
+                self._image.close()
+            self._image = None
+            self._data = None
+            charged, self._charged = self._charged, 0
+        if self.budget is not None and charged:
+            self.budget.release(charged, self.owner)
+
+def screenshot_data(screenshot):
+    """Raw image bytes of a Screenshot, of raw bytes, or of a base64 string."""
+    if isinstance(screenshot, Screenshot):
+        return screenshot.data
+    if isinstance(screenshot, (bytes, bytearray)):
+        return bytes(screenshot)
+    return base64.b64decode(screenshot)
+
+def release_screenshot(screenshot, holder):
+    """Screenshot.release for anything that may be a Screenshot (plain bytes and strings need no release)."""
+    if isinstance(screenshot, Screenshot):
+        screenshot.release(holder)
@@ -0,0 +1,88 @@
+import io
+import os
+from PIL import Image
+
+# Optional preprocessing of screenshots before they are sent to the vision
+# model: crop to the browser viewport, cap the longest edge, and re-encode
+# as JPEG/WebP. With everything switched off the screenshot is passed
+# through untouched, as the bytes the white agent sent, so it never has to
+# be decoded.
+
+class PreprocessConfig:
+    def __init__(self, max_edge=None, image_format=None, quality=80, viewport=None):
+        self.max_edge = max_edge          # longest edge in pixels, None = keep
+        self.image_format = image_format  # "JPEG", "WEBP" or None = keep PNG
+        self.quality = quality            # JPEG/WebP quality 1-100
+        self.viewport = viewport          # (width, height) crop from top-left, None = keep
+
+    def enabled(self):
+        return bool(self.max_edge or self.image_format or self.viewport)
+
+    def signature(self):
+        """Short description of the settings; part of the judgement cache key."""
+        if not self.enabled():
+            return "original"
+        viewport = "x".join(map(str, self.viewport)) if self.viewport else "-"
+        return f"edge={self.max_edge or '-'};format={self.image_format or 'PNG'};q={self.quality};viewport={viewport}"
+
+    @classmethod
+    def from_env(cls):
+        """
+        Reads SCREENSHOT_MAX_EDGE, SCREENSHOT_FORMAT, SCREENSHOT_QUALITY and
+        SCREENSHOT_VIEWPORT (e.g. "1280x800"). Unset means no preprocessing.
+        """
+        max_edge = int(os.environ.get("SCREENSHOT_MAX_EDGE", "0")) or None
+        image_format = os.environ.get("SCREENSHOT_FORMAT", "").upper() or None
+        if image_format not in (None, "JPEG", "WEBP"):
+            raise ValueError(f"SCREENSHOT_FORMAT must be JPEG or WEBP, not '{image_format}'")
+        quality = int(os.environ.get("SCREENSHOT_QUALITY", "80"))
+        viewport = os.environ.get("SCREENSHOT_VIEWPORT", "")
+        viewport = tuple(int(v) for v in viewport.lower().split("x")) if viewport else None
+        return cls(max_edge=max_edge, image_format=image_format, quality=quality, viewport=viewport)
+
+def _mime_type(data):
+    if data.startswith(b"\x89PNG"):
+        return "image/png"
+    if data.startswith(b"\xff\xd8"):
+        return "image/jpeg"
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp"
+    return None
+
+def preprocess_screenshot(image_data, config, open_image=None):
+    """
+    Prepares one screenshot for the vision model. Returns (content, sent_bytes):
+    content is an inline {"mime_type", "data"} blob with the original bytes
+    when preprocessing is off (the PIL image for formats Gemini may not
+    take as is), otherwise with the re-encoded image, and sent_bytes is the
+    size of the encoded image. open_image(), if given, returns image_data
+    opened with PIL (e.g. a shared copy, which is not modified); it is only
+    called when the pixels are needed.
+    """
+    if not config.enabled() and _mime_type(image_data):
+        return {"mime_type": _mime_type(image_data), "data": image_data}, len(image_data)
+    image = open_image() if open_image is not None else Image.open(io.BytesIO(image_data))
+    if not config.enabled():
+        return image, len(image_data)
+
+    if config.viewport:
+        width, height = config.viewport
+        image = image.crop((0, 0, min(width, image.width), min(height, image.height)))
+
+    if config.max_edge and max(image.size) > config.max_edge:
+        image = image.copy()
+        image.thumbnail((config.max_edge, config.max_edge), Image.LANCZOS)
+
+    image_format = config.image_format or "PNG"
+    if image_format == "JPEG" and image.mode != "RGB":
+        image = image.convert("RGB")
+    elif image.mode not in ("RGB", "RGBA", "L"):
+        image = image.convert("RGBA")
+
+    output = io.BytesIO()
+    if image_format == "PNG":
+        image.save(output, format="PNG")
+    else:
+        image.save(output, format=image_format, quality=config.quality)
+    data = output.getvalue()
+    return {"mime_type": f"image/{image_format.lower()}", "data": data}, len(data)
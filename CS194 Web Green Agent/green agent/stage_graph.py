@@ -0,0 +1,115 @@
+import time
+import threading
+
+# A small dependency graph for the stages of one assessment. Each stage is
+# a function run on its own thread as soon as the stages listed in `after`
+# have finished. A stage may also stream from others while it runs
+# (`streams_from`): it starts without waiting for them, but cannot finish
+# before they do, which matters for the critical path.
+#
+# If a stage raises, stages that depend on it are not started, `failed` is
+# set so running stages can stop early, and run() still waits for every
+# started stage before returning.
+
+class StageSkipped(Exception):
+    """A stage was not run because a stage it depends on failed."""
+
+class Stage:
+    def __init__(self, name, fn, after, streams_from):
+        self.name = name
+        self.fn = fn
+        self.after = list(after)
+        self.streams_from = list(streams_from)
+        self.result = None
+        self.error = None
+        self.started = None
+        self.finished = None
+        self.done = threading.Event()
+
+class StageGraph:
+    def __init__(self, name="stages"):
+        self.name = name
+        self.stages = {}  # name -> Stage, in the order they were added
+        self.failed = threading.Event()
+        self.origin = None
+
+    def add(self, name, fn, after=(), streams_from=()):
+        for dependency in list(after) + list(streams_from):
+            if dependency not in self.stages:
+                raise ValueError(f"Stage '{name}' depends on unknown stage '{dependency}'")
+        self.stages[name] = Stage(name, fn, after, streams_from)
+
+    def run(self):
+        """Runs every stage and waits for them. Returns the stages that failed, in the order they were added."""
+        self.origin = time.perf_counter()
+        threads = [threading.Thread(target=self._run_stage, args=(stage,), name=f"{self.name}-{stage.name}",
+                                    daemon=True) for stage in self.stages.values()]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return [s for s in self.stages.values() if s.error is not None and not isinstance(s.error, StageSkipped)]
+
+    def _run_stage(self, stage):
+        try:
+            for dependency in stage.after:
+                self.stages[dependency].done.wait()
+                if self.stages[dependency].error is not None:
+                    raise StageSkipped(f"'{dependency}' failed")
+            stage.started = time.perf_counter()
+            stage.result = stage.fn()
+        except StageSkipped as e:
+            stage.error = e
+        except Exception as e:
+            stage.error = e
+            self.failed.set()
+        finally:
+            stage.finished = time.perf_counter()
+            stage.done.set()
+
+    def result(self, name):
+        return self.stages[name].result
+
+    def duration(self, name):
+        stage = self.stages[name]
+        if stage.started is None:
+            return None
+        return stage.finished - stage.started
+
+    def windows(self):
+        """{stage: {"start", "end"}} in seconds since run() began, for the stages that ran."""
+        return {s.name: {"start": round(s.started - self.origin, 4), "end": round(s.finished - self.origin, 4)}
+                for s in self.stages.values() if s.started is not None}
+
+    def critical_path(self):
+        """
+        The chain of stages that decided when the graph finished: from the
+        last stage to finish, back through whichever stage it was waiting
+        for that finished last. Returns {"stages", "seconds", "slack"},
+        where slack is how much later each other stage could have finished
+        without delaying the end.
+        """
+        ran = [s for s in self.stages.values() if s.started is not None]
+        if not ran:
+            return {"stages": [], "seconds": 0.0, "slack": {}}
+        end = max(s.finished for s in ran)
+        stage = max(ran, key=lambda s: s.finished)
+        path = [stage.name]
+        while True:
+            upstream = [self.stages[d] for d in stage.after + stage.streams_from
+                        if self.stages[d].started is not None]
+            if not upstream:
+                break
+            stage = max(upstream, key=lambda s: s.finished)
+            path.append(stage.name)
+        path.reverse()
+
+        def latest_finish(stage):
+            # When the stage could have finished without delaying anything downstream
+            downstream = [s for s in ran if stage.name in s.after or stage.name in s.streams_from]
+            if not downstream:
+                return end
+            return min(s.started if stage.name in s.after else latest_finish(s) for s in downstream)
+
+        slack = {s.name: round(max(0.0, latest_finish(s) - s.finished), 4) for s in ran if s.name not in path}
+        return {"stages": path, "seconds": round(end - self.origin, 4), "slack": slack}
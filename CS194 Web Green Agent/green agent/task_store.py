@@ -0,0 +1,98 @@
+import os
+import json
+import mmap
+import time
+import struct
+import threading
+from collections.abc import Mapping
+
+# Local, memory-mapped copy of the Online-Mind2Web tasks.
+#
+# File layout:
+#   MAGIC
+#   8-byte little-endian length of the header
+#   header: JSON {"source", "built_at", "count", "index": {task_id: [offset, length]}}
+#   records: one compact JSON object per task, at the offsets in the index
+#
+# Opening a store only reads the header; a task is decoded the first time
+# it is looked up. Because the file is memory-mapped read-only, processes
+# that open the same store share its pages instead of each holding a copy.
+
+MAGIC = b"OM2WTASKS1\n"
+_LENGTH = struct.Struct("<Q")
+
+def build_task_store(path, tasks, source=""):
+    """Writes an iterable of task dicts (each with a 'task_id') to a task store file."""
+    index = {}
+    records = bytearray()
+    for task in tasks:
+        record = json.dumps(dict(task), separators=(",", ":"), default=str).encode("utf-8")
+        index[task['task_id']] = [len(records), len(record)]
+        records.extend(record)
+
+    header = json.dumps({
+        "source": source,
+        "built_at": time.time(),
+        "count": len(index),
+        "index": index,
+    }, separators=(",", ":")).encode("utf-8")
+
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(MAGIC)
+        f.write(_LENGTH.pack(len(header)))
+        f.write(header)
+        f.write(records)
+    os.replace(tmp_path, path)  # readers of the old file keep their mapping
+    return len(index)
+
+class TaskStore(Mapping):
+    """Read-only task_id -> task mapping backed by a task store file."""
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "rb")
+        try:
+            if self._file.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"'{path}' is not a task store")
+            (header_length,) = _LENGTH.unpack(self._file.read(_LENGTH.size))
+            header = json.loads(self._file.read(header_length))
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except Exception:
+            self._file.close()
+            raise
+        self.source = header["source"]
+        self.built_at = header["built_at"]
+        self._index = header["index"]
+        self._records_start = len(MAGIC) + _LENGTH.size + header_length
+        self._decoded = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def open(cls, path):
+        """Opens the store at path, or returns None if it is missing or unreadable."""
+        if not os.path.exists(path):
+            return None
+        try:
+            return cls(path)
+        except (OSError, ValueError, KeyError) as e:
+            print(f"DEBUG (TaskStore): Ignoring unreadable task store '{path}': {e}")
+            return None
+
+    def __getitem__(self, task_id):
+        task = self._decoded.get(task_id)
+        if task is None:
+            offset, length = self._index[task_id]
+            start = self._records_start + offset
+            task = json.loads(self._map[start:start + length])
+            with self._lock:
+                self._decoded[task_id] = task
+        return task
+
+    def __iter__(self):
+        return iter(self._index)
+
+    def __len__(self):
+        return len(self._index)
+
+    def __contains__(self, task_id):
+        return task_id in self._index
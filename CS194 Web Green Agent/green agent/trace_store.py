@@ -0,0 +1,238 @@
+import os
+import json
+import time
+import uuid
+import queue
+import random
+import threading
+from collections import OrderedDict
+
+# Structured per-assessment traces. A trace holds timed spans (Step 1, the
+# white agent fetch, each Step 2 screenshot, ...) and payloads such as raw
+# judge responses. The most recent traces are kept in memory in a ring
+# buffer, and finished traces are written to disk by a background thread
+# so they can still be looked up after they drop out of the buffer.
+#
+# Verbosity decides which payloads are kept:
+#   spans    - timings and small attributes only
+#   summary  - plus parsed results (key points, scores, verdict)
+#   full     - plus raw judge responses, prompts and action histories
+
+VERBOSITY_LEVELS = {"spans": 0, "summary": 1, "full": 2}
+SUMMARY = VERBOSITY_LEVELS["summary"]
+FULL = VERBOSITY_LEVELS["full"]
+
+def _truncate(value, limit):
+    if isinstance(value, str) and len(value) > limit:
+        return value[:limit] + f"... [{len(value) - limit} more characters]"
+    if isinstance(value, dict):
+        return {k: _truncate(v, limit) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_truncate(v, limit) for v in value]
+    return value
+
+class Span:
+    def __init__(self, trace, name, attributes):
+        self._trace = trace
+        self.name = name
+        self.attributes = attributes
+        self.start = time.perf_counter()
+
+    def end(self, **attributes):
+        self.attributes.update(attributes)
+        self._trace._add_span(self, time.perf_counter())
+
+class Trace:
+    def __init__(self, trace_id, name, attributes, verbosity, max_payload_chars, on_finish):
+        self.trace_id = trace_id
+        self.name = name
+        self.attributes = attributes
+        self.verbosity = verbosity
+        self.max_payload_chars = max_payload_chars
+        self.status = "running"
+        self.started_at = time.time()
+        self.finished_at = None
+        self.spans = []
+        self.payloads = []
+        self._start = time.perf_counter()
+        self._on_finish = on_finish
+        self._lock = threading.Lock()
+
+    def start_span(self, name, **attributes):
+        return Span(self, name, attributes)
+
+    def _add_span(self, span, end):
+        with self._lock:
+            self.spans.append({
+                "name": span.name,
+                "start_ms": round((span.start - self._start) * 1000, 2),
+                "duration_ms": round((end - span.start) * 1000, 2),
+                **span.attributes,
+            })
+
+    def record(self, name, payload, level=FULL):
+        """Keeps a payload if the trace's verbosity is at least level."""
+        if level > self.verbosity:
+            return
+        with self._lock:
+            self.payloads.append({
+                "name": name,
+                "at_ms": round((time.perf_counter() - self._start) * 1000, 2),
+                "data": _truncate(payload, self.max_payload_chars),
+            })
+
+    def finish(self, status, **attributes):
+        with self._lock:
+            if self.finished_at is not None:
+                return
+            self.status = status
+            self.attributes.update(attributes)
+            self.finished_at = time.time()
+        self._on_finish(self)
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                "trace_id": self.trace_id,
+                "name": self.name,
+                "status": self.status,
+                "started_at": self.started_at,
+                "finished_at": self.finished_at,
+                "attributes": dict(self.attributes),
+                "spans": list(self.spans),
+                "payloads": list(self.payloads),
+            }
+
+    def summary(self):
+        with self._lock:
+            return {"trace_id": self.trace_id, "name": self.name, "status": self.status,
+                    "started_at": self.started_at, "finished_at": self.finished_at, **self.attributes}
+
+class NullTrace:
+    """Stands in for a trace that was not sampled; records nothing."""
+    trace_id = None
+
+    def start_span(self, name, **attributes):
+        return self
+
+    def end(self, **attributes):
+        pass
+
+    def record(self, name, payload, level=FULL):
+        pass
+
+    def finish(self, status, **attributes):
+        pass
+
+NULL_TRACE = NullTrace()
+
+class TraceStore:
+    def __init__(self, capacity=200, spill_dir=None, sample_rate=1.0, verbosity="summary",
+                 max_payload_chars=20000, max_spilled_traces=2000):
+        if verbosity not in VERBOSITY_LEVELS:
+            raise ValueError(f"Trace verbosity must be one of {', '.join(VERBOSITY_LEVELS)}, not '{verbosity}'")
+        self.capacity = capacity
+        self.spill_dir = spill_dir
+        self.sample_rate = sample_rate
+        self.verbosity = verbosity
+        self.max_payload_chars = max_payload_chars
+        self.max_spilled_traces = max_spilled_traces
+        self._traces = OrderedDict()  # trace_id -> Trace, oldest first
+        self._lock = threading.Lock()
+        self._counts = {"started": 0, "not_sampled": 0, "spilled": 0, "spill_dropped": 0, "evicted": 0}
+        self._spill_queue = queue.Queue(maxsize=256)
+        if self.spill_dir:
+            os.makedirs(self.spill_dir, exist_ok=True)
+            threading.Thread(target=self._spill_loop, name="trace-spill", daemon=True).start()
+
+    def start(self, name, **attributes):
+        """Starts a trace, or returns NULL_TRACE if this one is not sampled."""
+        if self.sample_rate < 1 and random.random() >= self.sample_rate:
+            self._count("not_sampled")
+            return NULL_TRACE
+        trace = Trace(uuid.uuid4().hex[:16], name, attributes, VERBOSITY_LEVELS[self.verbosity],
+                      self.max_payload_chars, self._finished)
+        with self._lock:
+            self._traces[trace.trace_id] = trace
+            self._counts["started"] += 1
+            while len(self._traces) > self.capacity:
+                self._traces.popitem(last=False)
+                self._counts["evicted"] += 1
+        return trace
+
+    def get(self, trace_id):
+        """The trace as a dict, from memory or the spill directory, or None."""
+        with self._lock:
+            trace = self._traces.get(trace_id)
+        if trace is not None:
+            return trace.to_dict()
+        if not self.spill_dir or not trace_id.isalnum():
+            return None
+        try:
+            with open(os.path.join(self.spill_dir, f"{trace_id}.json"), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def flush(self, timeout=None):
+        """Waits until every finished trace queued so far has been written."""
+        deadline = None if timeout is None else time.time() + timeout
+        with self._spill_queue.all_tasks_done:
+            while self._spill_queue.unfinished_tasks:
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._spill_queue.all_tasks_done.wait(remaining)
+        return True
+
+    def recent(self, limit=50):
+        with self._lock:
+            traces = list(self._traces.values())[-limit:]
+        return [trace.summary() for trace in reversed(traces)]
+
+    def stats(self):
+        with self._lock:
+            return {**self._counts, "in_memory": len(self._traces), "capacity": self.capacity,
+                    "sample_rate": self.sample_rate, "verbosity": self.verbosity,
+                    "spill_dir": self.spill_dir, "spill_queue": self._spill_queue.qsize()}
+
+    def _count(self, name):
+        with self._lock:
+            self._counts[name] += 1
+
+    def _finished(self, trace):
+        if not self.spill_dir:
+            return
+        try:
+            # Never block the request path; drop the spill if the writer is behind
+            self._spill_queue.put_nowait(trace)
+        except queue.Full:
+            self._count("spill_dropped")
+
+    def _spill_loop(self):
+        while True:
+            trace = self._spill_queue.get()
+            try:
+                path = os.path.join(self.spill_dir, f"{trace.trace_id}.json")
+                tmp_path = f"{path}.tmp"
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump(trace.to_dict(), f, default=str)
+                os.replace(tmp_path, path)
+                self._count("spilled")
+                if self._counts["spilled"] % 100 == 0:
+                    self._prune()
+            except Exception as e:
+                print(f"DEBUG (TraceStore): Could not write trace {trace.trace_id}: {e}")
+            finally:
+                self._spill_queue.task_done()
+
+    def _prune(self):
+        entries = [e for e in os.scandir(self.spill_dir) if e.name.endswith(".json")]
+        if len(entries) <= self.max_spilled_traces:
+            return
+        entries.sort(key=lambda e: e.stat().st_mtime)
+        for entry in entries[:len(entries) - self.max_spilled_traces]:
+            try:
+                os.remove(entry.path)
+            except OSError:
+                pass
@@ -0,0 +1,144 @@
+import json
+import base64
+
+# Reading a white agent's /run_task response. Two transports are supported:
+#
+#   application/json  - the original form, one document with "action_history"
+#                       and a "screenshots_base64" list.
+#   multipart/mixed   - the streaming form: one image/* part per screenshot,
+#                       raw bytes in trajectory order, plus one
+#                       application/json part holding {"action_history": ...}
+#                       (normally sent last).
+#
+# The green agent asks for the streaming form with RUN_TASK_ACCEPT and falls
+# back to JSON for white agents that ignore the Accept header.
+
+RUN_TASK_ACCEPT = "multipart/mixed, application/json;q=0.9"
+STREAM_CHUNK_SIZE = 64 * 1024
+
+class TrajectoryError(Exception):
+    """The white agent's response could not be read as a trajectory."""
+
+def iter_multipart(chunks, boundary):
+    """
+    Incrementally splits a multipart body into (headers, body) pairs,
+    yielding each part as soon as its closing delimiter has arrived.
+    `chunks` is an iterable of bytes, `boundary` the boundary as bytes.
+    """
+    delimiter = b"\r\n--" + boundary
+    buf = bytearray(b"\r\n")  # lets the first delimiter match like the others
+    chunks = iter(chunks)
+
+    def fill():
+        chunk = next(chunks, None)
+        if chunk is None:
+            raise TrajectoryError("Trajectory stream ended unexpectedly")
+        buf.extend(chunk)
+
+    # Skip the preamble up to the first delimiter
+    while True:
+        pos = buf.find(delimiter)
+        if pos >= 0:
+            del buf[:pos + len(delimiter)]
+            break
+        fill()
+
+    while True:
+        while len(buf) < 2:
+            fill()
+        if buf[:2] == b"--":
+            return
+        if buf[:2] != b"\r\n":
+            raise TrajectoryError("Malformed multipart delimiter")
+        del buf[:2]
+
+        while True:
+            end = buf.find(b"\r\n\r\n")
+            if end >= 0:
+                break
+            fill()
+        headers = {}
+        for line in bytes(buf[:end]).decode("latin-1").split("\r\n"):
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+        del buf[:end + 4]
+
+        search_from = 0
+        while True:
+            pos = buf.find(delimiter, search_from)
+            if pos >= 0:
+                break
+            search_from = max(0, len(buf) - len(delimiter))
+            fill()
+        body = bytes(buf[:pos])
+        del buf[:pos + len(delimiter)]
+        yield headers, body
+
+def _boundary(content_type):
+    for param in content_type.split(";")[1:]:
+        name, _, value = param.strip().partition("=")
+        if name.lower() == "boundary":
+            return value.strip('"').encode("latin-1")
+    raise TrajectoryError("Multipart response has no boundary")
+
+class Trajectory:
+    """
+    A white agent's /run_task response in either transport. Iterate
+    screenshots() to receive the frames as they arrive; action_history is
+    set once that iteration has finished.
+    """
+    def __init__(self, response):
+        self.response = response
+        self.content_type = response.headers.get("Content-Type", "")
+        self.streamed = self.content_type.lower().startswith("multipart/")
+        self.action_history = None
+        self.screenshot_count = 0
+        self.bytes_received = 0
+
+    def screenshots(self):
+        """Yields each screenshot, as raw bytes (streamed) or a base64 string (JSON)."""
+        try:
+            if self.streamed:
+                yield from self._streamed_screenshots()
+            else:
+                yield from self._json_screenshots()
+        except TrajectoryError:
+            raise
+        except Exception as e:
+            raise TrajectoryError(f"Failed to read trajectory: {e}") from e
+        finally:
+            self.response.close()
+        if self.action_history is None:
+            raise TrajectoryError("Trajectory did not include an action history")
+
+    def _json_screenshots(self):
+        # Read the body without keeping it on the response, and hand the
+        # screenshots out one by one so each base64 string can be freed as
+        # soon as its consumer has decoded it
+        body = b"".join(self.response.iter_content(chunk_size=STREAM_CHUNK_SIZE))
+        self.bytes_received = len(body)
+        trajectory = json.loads(body)
+        del body
+        self.action_history = trajectory["action_history"]
+        screenshots = trajectory.pop("screenshots_base64")
+        screenshots.reverse()
+        while screenshots:
+            self.screenshot_count += 1
+            yield screenshots.pop()
+
+    def _streamed_screenshots(self):
+        def counted(chunks):
+            for chunk in chunks:
+                self.bytes_received += len(chunk)
+                yield chunk
+
+        chunks = counted(self.response.iter_content(chunk_size=STREAM_CHUNK_SIZE))
+        for headers, body in iter_multipart(chunks, _boundary(self.content_type)):
+            part_type = headers.get("content-type", "").lower()
+            if part_type.startswith("image/"):
+                if headers.get("content-transfer-encoding", "").lower() == "base64":
+                    body = base64.b64decode(body)
+                self.screenshot_count += 1
+                yield body
+            elif part_type.startswith("application/json"):
+                self.action_history = json.loads(body)["action_history"]
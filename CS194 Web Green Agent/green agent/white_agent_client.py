@@ -0,0 +1,183 @@
+import time
+import random
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import ConnectTimeoutError, NewConnectionError
+
+# HTTP client for calls to white agents. Every participant gets its own
+# keep-alive session and connection pool. Transient failures are retried
+# with jittered exponential backoff, and a circuit breaker stops calling a
+# participant that keeps failing until a cool-down has passed.
+#
+# Only failures where the white agent cannot have started the task are
+# retried: failing to connect at all (refused, unresolvable, connect
+# timeout) and 429/502/503/504 responses. A connection that broke after
+# the request was sent (reset, closed without an answer) and a read timeout
+# are not retried, since the agent may already be running the task.
+
+RETRY_STATUSES = {429, 502, 503, 504}
+
+def _never_sent(error):
+    """True if a requests.ConnectionError happened before the request reached the white agent."""
+    if isinstance(error, requests.ConnectTimeout):
+        return True
+    reason = error.args[0] if error.args else None
+    reason = getattr(reason, "reason", reason)  # requests wraps urllib3's MaxRetryError
+    return isinstance(reason, (NewConnectionError, ConnectTimeoutError))
+
+class CircuitOpenError(Exception):
+    """The participant's circuit breaker is open, so it is not being called."""
+
+class CircuitBreaker:
+    """
+    closed -> open after failure_threshold consecutive failures; after
+    reset_seconds one trial call is let through (half-open), and its
+    outcome closes or re-opens the breaker.
+    """
+    def __init__(self, failure_threshold=5, reset_seconds=60):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.times_opened = 0
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.time() - self.opened_at >= self.reset_seconds:
+                self.state = "half_open"
+                return True
+            return False  # open, or half-open with the trial call still running
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self.consecutive_failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.consecutive_failures += 1
+            if self.state == "half_open" or (self.failure_threshold
+                                             and self.consecutive_failures >= self.failure_threshold):
+                if self.state != "open":
+                    self.times_opened += 1
+                self.state = "open"
+                self.opened_at = time.time()
+
+    def is_open(self):
+        """True while calls are being refused (open and still cooling down)."""
+        with self._lock:
+            return self.state == "open" and time.time() - self.opened_at < self.reset_seconds
+
+    def summary(self):
+        with self._lock:
+            return {"state": self.state, "consecutive_failures": self.consecutive_failures,
+                    "times_opened": self.times_opened}
+
+class _Participant:
+    def __init__(self, pool_size, breaker):
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.breaker = breaker
+        self.counts = {"requests": 0, "attempts": 0, "retries": 0, "failures": 0, "rejected": 0}
+
+class WhiteAgentClient:
+    def __init__(self, connect_timeout=5, read_timeout=300, retries=2, backoff_base=0.5, backoff_max=10,
+                 pool_size=8, failure_threshold=5, reset_seconds=60):
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.retries = retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.pool_size = pool_size
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self._participants = {}
+        self._lock = threading.Lock()
+
+    def _participant(self, participant_url):
+        key = participant_url.rstrip("/")
+        with self._lock:
+            participant = self._participants.get(key)
+            if participant is None:
+                participant = _Participant(self.pool_size,
+                                           CircuitBreaker(self.failure_threshold, self.reset_seconds))
+                self._participants[key] = participant
+            return participant
+
+    def _count(self, participant, name):
+        with self._lock:
+            participant.counts[name] += 1
+
+    def available(self, participant_url):
+        """False while the participant's circuit breaker is open."""
+        return not self._participant(participant_url).breaker.is_open()
+
+    def post(self, participant_url, path, **kwargs):
+        """
+        POSTs to participant_url + path. Returns the response once it has a
+        non-error status; raises CircuitOpenError, or the last
+        requests.RequestException once retries are used up.
+        """
+        participant = self._participant(participant_url)
+        self._count(participant, "requests")
+        if not participant.breaker.allow():
+            self._count(participant, "rejected")
+            raise CircuitOpenError(f"White agent at {participant_url} is failing repeatedly; "
+                                   f"not calling it for up to {self.reset_seconds}s")
+
+        url = participant_url.rstrip("/") + path
+        for attempt in range(self.retries + 1):
+            if attempt:
+                self._count(participant, "retries")
+            self._count(participant, "attempts")
+            retry_after = None
+            try:
+                response = participant.session.post(url, timeout=(self.connect_timeout, self.read_timeout), **kwargs)
+            except requests.ConnectionError as e:
+                if not _never_sent(e):
+                    self.record_failure(participant_url)
+                    raise
+                error = e
+            except Exception:
+                # Anything else counts too, or a half-open breaker would wait forever for its trial call
+                self.record_failure(participant_url)
+                raise
+            else:
+                if response.status_code < 400:
+                    participant.breaker.record_success()
+                    return response
+                response.close()
+                error = requests.HTTPError(f"{response.status_code} from {url}", response=response)
+                if response.status_code not in RETRY_STATUSES:
+                    self.record_failure(participant_url)
+                    raise error
+                retry_after = response.headers.get("Retry-After")
+            if attempt < self.retries:
+                time.sleep(self._backoff(attempt, retry_after))
+        self.record_failure(participant_url)
+        raise error
+
+    def _backoff(self, attempt, retry_after=None):
+        if retry_after and retry_after.isdigit():
+            return min(float(retry_after), self.backoff_max)
+        # Full jitter: anywhere between 0 and the exponential cap
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def record_failure(self, participant_url):
+        """Counts a failure against the participant, e.g. a trajectory that broke off mid-stream."""
+        participant = self._participant(participant_url)
+        self._count(participant, "failures")
+        participant.breaker.record_failure()
+
+    def stats(self):
+        with self._lock:
+            participants = dict(self._participants)
+            counts = {url: dict(p.counts) for url, p in participants.items()}
+        return {url: {**counts[url], **p.breaker.summary()} for url, p in participants.items()}
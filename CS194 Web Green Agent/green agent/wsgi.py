@@ -0,0 +1,16 @@
+import green_agent_server
+from green_agent_server import app
+
+__all__ = ["app"]
+
+# WSGI entry point for running the green agent under a production server
+# with several worker processes and threads, instead of the Flask
+# development server:
+#
+#   gunicorn -c gunicorn.conf.py wsgi:app              (Linux/macOS)
+#   waitress-serve --port=5001 --threads=16 wsgi:app   (Windows, one process)
+#
+# Each worker opens the memory-mapped task store, so the workers share one
+# copy of the task index through the OS page cache.
+
+green_agent_server.load_om2w_tasks()
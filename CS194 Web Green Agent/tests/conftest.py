@@ -0,0 +1,22 @@
+import os
+import sys
+import tempfile
+
+# The green agent's modules import each other by name, as they do when the
+# server is started from its own folder
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "green agent"))
+
+# green_agent_server configures itself from the environment when it is
+# imported: use the offline stand-in judge, and keep everything it writes
+# out of the source tree
+_state_dir = tempfile.mkdtemp(prefix="green-agent-tests-")
+os.environ.update({
+    "JUDGE_BACKEND": "local",
+    "OM2W_OFFLINE": "1",
+    "OM2W_TASKS_FILE": os.path.join(_state_dir, "tasks.store"),
+    "JUDGE_CACHE_DIR": "",
+    "KEY_POINTS_FILE": os.path.join(_state_dir, "key_points.json"),
+    "RESULT_STORE_PATH": "",
+    "SCREENSHOT_ARCHIVE_DIR": os.path.join(_state_dir, "screenshot_archive"),
+    "TRACE_DIR": "",
+})
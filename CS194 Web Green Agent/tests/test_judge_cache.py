@@ -0,0 +1,77 @@
+import os
+import json
+import time
+
+from judge_cache import JudgeCache, make_judgement_key
+
+def judgement(score, reasoning="Shows the applied filter."):
+    return {"reasoning": reasoning, "score": score}
+
+def files_on_disk(cache_dir):
+    return {os.path.join(root, name): os.path.getsize(os.path.join(root, name))
+            for root, _, files in os.walk(cache_dir) for name in files}
+
+def test_key_depends_on_every_input():
+    base = make_judgement_key(b"png", "task", ["a", "b"], "model", "prompt")
+    assert base == make_judgement_key(b"png", "task", ["a", "b"], "model", "prompt")
+    assert base != make_judgement_key(b"png2", "task", ["a", "b"], "model", "prompt")
+    assert base != make_judgement_key(b"png", "task", ["a", "b"], "model", "other prompt")
+    assert base != make_judgement_key(b"png", "task", ["a\nb"], "model", "prompt", "preprocess")
+
+def test_overwriting_an_entry_counts_its_bytes_once(tmp_path):
+    cache = JudgeCache(cache_dir=str(tmp_path))
+    for n in range(5):
+        cache.put("ab" + "0" * 62, judgement(1 + n % 5, "x" * n))
+    assert cache.stats()["disk_bytes"] == sum(files_on_disk(tmp_path).values())
+
+def test_disk_bytes_are_rebuilt_on_restart(tmp_path):
+    cache = JudgeCache(cache_dir=str(tmp_path))
+    for n in range(10):
+        cache.put(f"{n:064x}", judgement(3))
+    restarted = JudgeCache(cache_dir=str(tmp_path))
+    assert restarted.stats()["disk_bytes"] == cache.stats()["disk_bytes"] == sum(files_on_disk(tmp_path).values())
+    assert restarted.get(f"{4:064x}") == judgement(3)
+
+def test_disk_tier_is_trimmed_to_its_cap(tmp_path):
+    entry_bytes = len(json.dumps(judgement(3)).encode("utf-8"))
+    cache = JudgeCache(cache_dir=str(tmp_path), max_memory_entries=1, max_disk_bytes=10 * entry_bytes)
+    for n in range(30):
+        cache.put(f"{n:064x}", judgement(3))
+    on_disk = files_on_disk(tmp_path)
+    assert sum(on_disk.values()) <= 10 * entry_bytes
+    assert cache.stats()["disk_bytes"] == sum(on_disk.values())
+    assert cache.stats()["disk_evictions"] == 30 - len(on_disk)
+
+def test_least_recently_used_entries_are_evicted_first(tmp_path):
+    entry_bytes = len(json.dumps(judgement(3)).encode("utf-8"))
+    cache = JudgeCache(cache_dir=str(tmp_path), max_memory_entries=1, max_disk_bytes=4 * entry_bytes)
+    keys = [f"{n:064x}" for n in range(4)]
+    for n, key in enumerate(keys):
+        cache.put(key, judgement(3))
+        path = os.path.join(str(tmp_path), key[:2], f"{key}.json")
+        os.utime(path, (time.time() - 100 + n, time.time() - 100 + n))
+    # Memory only holds keys[3], so this is read from disk, which marks it as used
+    assert cache.get(keys[0]) == judgement(3)
+    cache.put(f"{99:064x}", judgement(3))
+    remaining = {os.path.basename(path)[:-len(".json")] for path in files_on_disk(tmp_path)}
+    assert keys[0] in remaining  # just read, so most recently used
+    assert keys[1] not in remaining
+
+def test_unreadable_judgements_are_not_cached(tmp_path):
+    cache = JudgeCache(cache_dir=str(tmp_path))
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return judgement(0, "No reasoning found.")
+
+    for _ in range(3):
+        value, hit = cache.get_or_compute("cd" + "0" * 62, compute, cacheable=lambda j: 1 <= j["score"] <= 5)
+        assert not hit
+    assert len(calls) == 3
+    assert files_on_disk(tmp_path) == {}
+
+def test_computed_value_is_reused(tmp_path):
+    cache = JudgeCache(cache_dir=str(tmp_path))
+    assert cache.get_or_compute("ef" + "0" * 62, lambda: judgement(5)) == (judgement(5), False)
+    assert cache.get_or_compute("ef" + "0" * 62, lambda: judgement(1)) == (judgement(5), True)
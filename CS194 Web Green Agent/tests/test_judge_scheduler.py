@@ -0,0 +1,100 @@
+import time
+import threading
+
+import pytest
+
+from judge_scheduler import JudgeScheduler
+
+class JudgeError(Exception):
+    def __init__(self, status, retry_after=None):
+        super().__init__(f"HTTP {status}")
+        self.status = status
+        self.retry_after = retry_after
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.005)
+
+def test_queued_calls_go_out_by_step_priority_then_arrival():
+    scheduler = JudgeScheduler(max_concurrency=1)
+    release = threading.Event()
+    order = []
+    holder = threading.Thread(target=scheduler.call, args=(2, release.wait))
+    holder.start()
+    wait_for(lambda: scheduler.stats()["running"] == 1)
+    threads = []
+    for label, step in [("2a", 2), ("1", 1), ("2b", 2), ("3", 3)]:
+        thread = threading.Thread(target=scheduler.call, args=(step, lambda label=label: order.append(label)))
+        thread.start()
+        threads.append(thread)
+        wait_for(lambda: scheduler.stats()["queue_depth"] == len(threads))
+    assert scheduler.stats()["queued_by_step"] == {1: 1, 2: 2, 3: 1}
+    release.set()
+    for thread in [holder] + threads:
+        thread.join(timeout=5)
+    # Step 3 finishes an assessment, so it goes first; equal steps keep their order
+    assert order == ["3", "1", "2a", "2b"]
+
+def test_rate_limit_is_retried_after_the_providers_hint():
+    retries = []
+    scheduler = JudgeScheduler(on_retry=lambda step, status, delay: retries.append((step, status, delay)))
+    attempts = []
+
+    def fn():
+        attempts.append(time.monotonic())
+        if len(attempts) == 1:
+            raise JudgeError(429, retry_after=0.2)
+        return "Score: 4"
+
+    assert scheduler.call(2, fn) == "Score: 4"
+    assert attempts[1] - attempts[0] >= 0.2
+    assert retries == [(2, 429, 0.2)]
+    stats = scheduler.stats()
+    assert (stats["calls"], stats["retries"], stats["rate_limited"], stats["failed"]) == (2, 1, 1, 0)
+
+def test_backoff_pauses_every_call_not_just_the_one_retried():
+    scheduler = JudgeScheduler(max_concurrency=2)
+    failed_at = []
+    started_at = []
+
+    def rate_limited():
+        if not failed_at:
+            failed_at.append(time.monotonic())
+            raise JudgeError(503, retry_after=0.3)
+
+    first = threading.Thread(target=scheduler.call, args=(2, rate_limited))
+    first.start()
+    wait_for(lambda: failed_at)
+    scheduler.call(3, lambda: started_at.append(time.monotonic()))
+    first.join(timeout=5)
+    assert started_at[0] - failed_at[0] >= 0.25
+
+def test_other_errors_are_raised_without_a_retry():
+    scheduler = JudgeScheduler()
+    attempts = []
+
+    def fn():
+        attempts.append(1)
+        raise JudgeError(400)
+
+    with pytest.raises(JudgeError):
+        scheduler.call(1, fn)
+    assert len(attempts) == 1
+    assert (scheduler.stats()["retries"], scheduler.stats()["failed"]) == (0, 1)
+    assert scheduler.stats()["running"] == 0
+
+def test_retries_stop_after_max_retries():
+    scheduler = JudgeScheduler(max_retries=2, backoff_base=0.01)
+    attempts = []
+
+    def fn():
+        attempts.append(1)
+        raise JudgeError(503)
+
+    with pytest.raises(JudgeError):
+        scheduler.call(2, fn)
+    assert len(attempts) == 3
+    stats = scheduler.stats()
+    assert (stats["retries"], stats["failed"], stats["running"]) == (2, 1, 0)
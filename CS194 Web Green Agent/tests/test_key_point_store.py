@@ -0,0 +1,59 @@
+import os
+import json
+import threading
+import multiprocessing
+
+import pytest
+
+from key_point_store import KeyPointStore, key_point_version
+
+VERSION = key_point_version("PROMPT_STEP_1", "gemini-2.0-flash-lite")
+TASK = "Find a 36 inch stainless steel fridge with at least 4 stars"
+
+def entries_on_disk(path):
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)["entries"]
+
+def test_stale_entries_are_not_returned(tmp_path):
+    store = KeyPointStore(str(tmp_path / "key_points.json"))
+    store.put("t1", VERSION, TASK, ["36 inch", "stainless steel"])
+    assert store.get("t1", VERSION, TASK) == ["36 inch", "stainless steel"]
+    assert store.get("t1", key_point_version("edited prompt", "gemini-2.0-flash-lite"), TASK) is None
+    assert store.get("t1", VERSION, TASK + " under $2000") is None
+    assert store.get("t2", VERSION, TASK) is None
+
+def test_a_miss_rereads_what_another_worker_wrote(tmp_path):
+    path = str(tmp_path / "key_points.json")
+    first = KeyPointStore(path)
+    second = KeyPointStore(path)
+    first.put("t1", VERSION, TASK, ["36 inch"])
+    assert second.get("t1", VERSION, TASK) == ["36 inch"]
+
+def test_threads_saving_at_once_lose_nothing(tmp_path):
+    path = str(tmp_path / "key_points.json")
+    stores = [KeyPointStore(path) for _ in range(2)]
+    threads = [threading.Thread(target=lambda n=n: stores[n % 2].put(f"t{n}", VERSION, TASK, [str(n)]))
+               for n in range(20)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=10)
+    assert set(entries_on_disk(path)) == {f"t{n}" for n in range(20)}
+
+def _put_tasks(path, worker):
+    store = KeyPointStore(path)
+    for n in range(15):
+        store.put(f"w{worker}-t{n}", VERSION, TASK, [f"point {n}"])
+
+@pytest.mark.skipif(os.name == "nt", reason="sharing the store between processes needs fcntl")
+def test_workers_saving_at_once_lose_nothing(tmp_path):
+    path = str(tmp_path / "key_points.json")
+    workers = [multiprocessing.Process(target=_put_tasks, args=(path, worker)) for worker in range(4)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join(timeout=60)
+        assert worker.exitcode == 0
+    entries = entries_on_disk(path)
+    assert set(entries) == {f"w{worker}-t{n}" for worker in range(4) for n in range(15)}
+    assert KeyPointStore(path).get("w3-t14", VERSION, TASK) == ["point 14"]
@@ -0,0 +1,80 @@
+import hashlib
+
+import pytest
+
+from result_store import ResultStore, judge_version, trajectory_hash
+
+TASK = "Find a 36 inch stainless steel fridge with at least 4 stars"
+ACTIONS = [{"command": "CLICK", "target": "Refrigerators"}, {"command": "TYPE", "text": "36 inch"}]
+SHOTS = [hashlib.sha256(bytes([n])).hexdigest() for n in range(3)]
+
+@pytest.fixture
+def store(tmp_path):
+    return ResultStore(str(tmp_path / "results.db"))
+
+def payload(status="success"):
+    return {"webjudge_status": status, "webjudge_thoughts": "Filters applied.", "task_id": "t1"}
+
+def test_trajectory_hash_covers_actions_and_every_screenshot():
+    base = trajectory_hash(ACTIONS, SHOTS)
+    assert base == trajectory_hash(list(ACTIONS), list(SHOTS))
+    assert base != trajectory_hash(ACTIONS[:1], SHOTS)
+    assert base != trajectory_hash(ACTIONS, SHOTS[:2])
+    assert base != trajectory_hash(ACTIONS, list(reversed(SHOTS)))
+
+def test_judge_version_changes_with_any_setting():
+    version = judge_version("gemini-2.0-flash-lite", "prompt", {"threshold": 4})
+    assert version == judge_version("gemini-2.0-flash-lite", "prompt", {"threshold": 4})
+    assert version != judge_version("gemini-2.0-flash-lite", "prompt", {"threshold": 3})
+    assert version != judge_version("gemini-2.0-flash", "prompt", {"threshold": 4})
+
+def test_stored_result_is_found_and_counts_resubmissions(store):
+    trajectory = trajectory_hash(ACTIONS, SHOTS)
+    assert not store.has_results("t1", "http://agent", "v1")
+    result_id = store.put("t1", "http://agent", trajectory, "v1", TASK, payload(), len(SHOTS))
+    assert store.has_results("t1", "http://agent", "v1")
+    found = store.get("t1", "http://agent", trajectory, "v1", TASK)
+    assert found["result_id"] == result_id
+    assert found["payload"] == payload()
+    assert found["submissions"] == 2
+    assert store.get("t1", "http://agent", trajectory, "v1", TASK)["submissions"] == 3
+    assert store.stats()["hits"] == 2
+
+def test_lookups_miss_on_any_other_key(store):
+    trajectory = trajectory_hash(ACTIONS, SHOTS)
+    store.put("t1", "http://agent", trajectory, "v1", TASK, payload(), len(SHOTS))
+    assert store.get("t1", "http://agent", trajectory_hash(ACTIONS, SHOTS[:2]), "v1", TASK) is None
+    assert store.get("t1", "http://other-agent", trajectory, "v1", TASK) is None
+    assert store.get("t2", "http://agent", trajectory, "v1", TASK) is None
+    assert not store.has_results("t1", "http://agent", "v2")
+    assert store.get("t1", "http://agent", trajectory, "v2", TASK) is None
+    # An edited task description invalidates the stored verdict
+    assert store.get("t1", "http://agent", trajectory, "v1", TASK + " under $2000") is None
+    assert store.stats()["misses"] == 5
+
+def test_storing_again_replaces_the_result(store):
+    trajectory = trajectory_hash(ACTIONS, SHOTS)
+    first = store.put("t1", "http://agent", trajectory, "v1", TASK, payload("failure"), len(SHOTS))
+    second = store.put("t1", "http://agent", trajectory, "v1", TASK, payload("success"), len(SHOTS))
+    assert first == second
+    assert store.get("t1", "http://agent", trajectory, "v1", TASK)["payload"]["webjudge_status"] == "success"
+    assert store.stats()["results"] == 1
+
+def test_leaderboard_is_per_judge_version(store):
+    for n, (participant, status) in enumerate([("http://a", "success"), ("http://a", "failure"),
+                                               ("http://b", "success")]):
+        store.put("t1", participant, trajectory_hash(ACTIONS, SHOTS[n:]), "v1", TASK, payload(status), 3)
+    store.put("t1", "http://b", trajectory_hash(ACTIONS, []), "v0", TASK, payload("failure"), 0)
+    board = store.leaderboard(version="v1")
+    assert [(row["participant_url"], row["results"], row["success_rate"]) for row in board] == [
+        ("http://b", 1, 1.0), ("http://a", 2, 0.5)]
+    everything = {row["participant_url"]: row["results"] for row in store.leaderboard()}
+    assert everything == {"http://a": 2, "http://b": 2}
+    assert store.leaderboard(version="v1", task_id="t2") == []
+    assert [row["participant_url"] for row in store.results(participant_url="http://a")] == ["http://a"] * 2
+
+def test_store_is_shared_through_the_file(tmp_path):
+    path = str(tmp_path / "results.db")
+    trajectory = trajectory_hash(ACTIONS, SHOTS)
+    ResultStore(path).put("t1", "http://agent", trajectory, "v1", TASK, payload(), len(SHOTS))
+    assert ResultStore(path).get("t1", "http://agent", trajectory, "v1", TASK)["payload"] == payload()
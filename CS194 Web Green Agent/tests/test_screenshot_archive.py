@@ -0,0 +1,153 @@
+import os
+import json
+import time
+import hashlib
+import multiprocessing
+
+import pytest
+
+from screenshot_archive import ScreenshotArchive
+
+def frame(n, size=1000):
+    return b"\x89PNG" + n.to_bytes(4, "big") * (size // 4)
+
+def object_name(data):
+    return hashlib.sha256(data).hexdigest() + ".png"
+
+def archive_run(archive, frames, **attributes):
+    run = archive.start_run(**attributes)
+    for index, data in enumerate(frames):
+        run.add(index, data)
+    run.close(action_history=[])
+    assert archive.flush(timeout=10)
+    return run.run_id
+
+def stored_objects(root):
+    objects_dir = os.path.join(root, "objects")
+    return {name for prefix in os.listdir(objects_dir) for name in os.listdir(os.path.join(objects_dir, prefix))}
+
+def referenced_objects(archive, run_ids):
+    return {s["object"] for run_id in run_ids for s in archive.manifest(run_id)["screenshots"]}
+
+def test_identical_frames_are_stored_once(tmp_path):
+    archive = ScreenshotArchive(str(tmp_path))
+    first = archive_run(archive, [frame(1), frame(2), frame(1)], task_id="t1")
+    second = archive_run(archive, [frame(2), frame(3)], task_id="t1")
+    manifest = archive.manifest(first)
+    assert [s["index"] for s in manifest["screenshots"]] == [0, 1, 2]
+    assert manifest["task_id"] == "t1" and manifest["complete"]
+    assert len(stored_objects(str(tmp_path))) == 3
+    stats = archive.stats()
+    assert (stats["objects_written"], stats["deduplicated"]) == (3, 2)
+    assert stats["write_seconds"] >= manifest["write_seconds"] > 0
+    with open(archive.object_path(archive.manifest(second)["screenshots"][1]["object"]), "rb") as f:
+        assert f.read() == frame(3)
+
+def test_oldest_runs_go_with_images_no_other_run_uses(tmp_path):
+    archive = ScreenshotArchive(str(tmp_path), max_runs=2)
+    first = archive_run(archive, [frame(1), frame(2)])
+    second = archive_run(archive, [frame(2), frame(3)])
+    third = archive_run(archive, [frame(3), frame(4)])
+    assert archive.manifest(first) is None
+    # frame(1) was only used by the evicted run; frame(2) is still used by the second
+    assert stored_objects(str(tmp_path)) == referenced_objects(archive, [second, third])
+    assert archive.stats()["runs_evicted"] == 1
+    assert archive.stats()["objects_evicted"] == 1
+
+def test_size_cap_keeps_the_newest_run(tmp_path):
+    archive = ScreenshotArchive(str(tmp_path), max_bytes=2500)
+    run_ids = [archive_run(archive, [frame(3 * n), frame(3 * n + 1), frame(3 * n + 2)]) for n in range(3)]
+    # Each run alone is over the cap, but the newest one is never evicted
+    assert [archive.manifest(run_id) is not None for run_id in run_ids] == [False, False, True]
+    assert stored_objects(str(tmp_path)) == referenced_objects(archive, run_ids[2:])
+
+def test_images_of_open_runs_are_kept(tmp_path):
+    archive = ScreenshotArchive(str(tmp_path), max_runs=1)
+    open_run = archive.start_run()
+    open_run.add(0, frame(1))
+    archive.flush(timeout=10)
+    archive_run(archive, [frame(2)])
+    archive_run(archive, [frame(3)])
+    assert object_name(frame(1)) in stored_objects(str(tmp_path))
+    open_run.close()
+    archive.flush(timeout=10)
+    assert not [name for name in os.listdir(os.path.join(str(tmp_path), "runs")) if name.endswith(".open")]
+
+def test_abandoned_runs_stop_protecting_their_images(tmp_path):
+    archive = ScreenshotArchive(str(tmp_path), max_runs=1, abandoned_run_seconds=60)
+    abandoned = archive.start_run()
+    abandoned.add(0, frame(1))
+    archive.flush(timeout=10)
+    open_path = os.path.join(str(tmp_path), "runs", f"{abandoned.run_id}.open")
+    os.utime(open_path, (time.time() - 120, time.time() - 120))
+    archive_run(archive, [frame(2)])
+    archive_run(archive, [frame(3)])
+    assert not os.path.exists(open_path)
+    assert stored_objects(str(tmp_path)) == {object_name(frame(3))}
+
+def test_reopened_archive_sees_existing_runs(tmp_path):
+    archive = ScreenshotArchive(str(tmp_path))
+    archive_run(archive, [frame(1), frame(2)])
+    reopened = ScreenshotArchive(str(tmp_path))
+    assert reopened.stats()["stored_runs"] == 1
+    assert reopened.stats()["objects"] == 2
+
+def test_closing_a_run_is_never_skipped_when_the_writer_is_behind(tmp_path):
+    archive = ScreenshotArchive(str(tmp_path), queue_depth=1)
+    write_screenshot = archive._write_screenshot
+
+    def slow_write(*args):
+        time.sleep(0.05)
+        write_screenshot(*args)
+
+    archive._write_screenshot = slow_write
+    run = archive.start_run()
+    for index in range(5):
+        run.add(index, frame(index))
+    run.close(action_history=[])
+    assert archive.flush(timeout=10)
+    assert archive.stats()["dropped"] > 0
+    assert archive.manifest(run.run_id)["complete"]
+    assert not [name for name in os.listdir(os.path.join(str(tmp_path), "runs")) if name.endswith(".open")]
+
+def test_closing_runs_within_the_caps_does_not_rescan(tmp_path):
+    archive = ScreenshotArchive(str(tmp_path), max_runs=3)
+    scans = []
+    scan = archive._scan
+
+    def counted_scan():
+        scans.append(1)
+        return scan()
+
+    archive._scan = counted_scan
+    run_ids = [archive_run(archive, [frame(n), frame(n + 1)]) for n in range(3)]
+    assert scans == []
+    assert archive.stats()["stored_runs"] == 3
+    assert archive.stats()["bytes"] == sum(os.path.getsize(archive.object_path(n)) for n in stored_objects(str(tmp_path)))
+    archive_run(archive, [frame(9)])
+    assert len(scans) == 1
+    assert archive.manifest(run_ids[0]) is None
+
+def _write_runs(root, seed):
+    archive = ScreenshotArchive(root, max_bytes=20 * 1000)
+    for n in range(15):
+        archive_run(archive, [frame((seed * 7 + n + k) % 40) for k in range(4)])
+
+@pytest.mark.skipif(os.name == "nt", reason="sharing an archive between processes needs fcntl")
+def test_workers_sharing_an_archive_keep_it_consistent(tmp_path):
+    root = str(tmp_path)
+    workers = [multiprocessing.Process(target=_write_runs, args=(root, seed)) for seed in range(4)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join(timeout=60)
+        assert worker.exitcode == 0
+    archive = ScreenshotArchive(root)
+    run_ids = [name[:-len(".json")] for name in os.listdir(os.path.join(root, "runs")) if name.endswith(".json")]
+    objects = stored_objects(root)
+    # No run refers to a deleted image, no image is left that no run uses, and the cap holds overall
+    assert referenced_objects(archive, run_ids) == objects
+    assert sum(os.path.getsize(os.path.join(root, "objects", n[:2], n)) for n in objects) <= 20 * 1000
+    for run_id in run_ids:
+        with open(os.path.join(root, "runs", f"{run_id}.json"), encoding="utf-8") as f:
+            assert json.load(f)["complete"]
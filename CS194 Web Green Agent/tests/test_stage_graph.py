@@ -0,0 +1,89 @@
+import time
+import threading
+
+import pytest
+
+from stage_graph import StageGraph, StageSkipped
+
+def test_stages_wait_only_for_what_they_run_after():
+    graph = StageGraph()
+    events = []
+    c_started = threading.Event()
+
+    def a():
+        # Only returns once c is running, so c cannot be waiting for a
+        assert c_started.wait(timeout=5)
+        events.append("a done")
+        return "key points"
+
+    def c():
+        events.append("c started")
+        c_started.set()
+
+    graph.add("a", a)
+    graph.add("b", lambda: events.append(f"b got {graph.result('a')}"), after=["a"])
+    graph.add("c", c)
+    assert graph.run() == []
+    assert events.index("c started") < events.index("a done") < events.index("b got key points")
+    assert graph.stages["b"].started >= graph.stages["a"].finished
+
+def test_a_stage_streaming_from_another_starts_without_waiting_for_it():
+    graph = StageGraph()
+    received = []
+    producer_done = threading.Event()
+
+    def producer():
+        time.sleep(0.03)
+        producer_done.set()
+
+    def consumer():
+        # Running while the producer is still going
+        received.append(producer_done.is_set())
+        producer_done.wait(timeout=5)
+
+    graph.add("producer", producer)
+    graph.add("consumer", consumer, streams_from=["producer"])
+    graph.run()
+    assert received == [False]
+    assert graph.critical_path()["stages"][-1] == "consumer"
+
+def test_a_failure_skips_dependents_and_signals_running_stages():
+    graph = StageGraph()
+    stopped_early = []
+
+    def white_agent():
+        time.sleep(0.02)
+        raise ConnectionError("refused")
+
+    def step_1():
+        # A long stage that checks `failed` and gives up
+        stopped_early.append(graph.failed.wait(timeout=5))
+
+    graph.add("white_agent", white_agent)
+    graph.add("step_1", step_1)
+    graph.add("step_2", lambda: pytest.fail("must not run"), after=["step_1", "white_agent"])
+    graph.add("step_3", lambda: pytest.fail("must not run"), after=["step_2"])
+    failed = graph.run()
+    assert [stage.name for stage in failed] == ["white_agent"]
+    assert stopped_early == [True]
+    for name in ("step_2", "step_3"):
+        assert isinstance(graph.stages[name].error, StageSkipped)
+        assert graph.duration(name) is None
+    assert set(graph.windows()) == {"white_agent", "step_1"}
+
+def test_dependencies_must_already_be_added():
+    graph = StageGraph()
+    with pytest.raises(ValueError, match="unknown stage 'step_1'"):
+        graph.add("step_2", lambda: None, after=["step_1"])
+
+def test_critical_path_follows_the_chain_the_end_waited_on():
+    graph = StageGraph()
+    graph.add("step_1", lambda: time.sleep(0.05))
+    graph.add("white_agent", lambda: time.sleep(0.01))
+    graph.add("step_2", lambda: time.sleep(0.05), after=["step_1", "white_agent"])
+    graph.run()
+    path = graph.critical_path()
+    assert path["stages"] == ["step_1", "step_2"]
+    assert path["seconds"] >= 0.1
+    # The white agent could have finished about 40ms later without delaying Step 2
+    assert 0.02 < path["slack"]["white_agent"] < 0.2
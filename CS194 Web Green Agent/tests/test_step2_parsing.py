@@ -0,0 +1,31 @@
+from green_agent_server import parse_batch_screenshot_scores, parse_screenshot_score
+
+def test_single_image_answer():
+    assert parse_screenshot_score("Reasoning: Shows the fridge filter.\nScore: 4") == ("Shows the fridge filter.", 4)
+
+def test_batch_answer_in_order():
+    response = ("Image 1:\nReasoning: Search results.\nScore: 2\n\n"
+                "Image 2:\nReasoning: The 36 inch filter is applied.\nScore: 5\n")
+    assert parse_batch_screenshot_scores(response, 2) == [("Search results.", 2),
+                                                          ("The 36 inch filter is applied.", 5)]
+
+def test_batch_accepts_markdown_headers():
+    response = ("**Image 2**\nReasoning: Later page.\nScore: 3\n"
+                "### Image 1:\nReasoning: Home page.\nScore: 1\n")
+    assert parse_batch_screenshot_scores(response, 2) == [("Home page.", 1), ("Later page.", 3)]
+
+def test_batch_marks_unusable_blocks():
+    response = ("Image 1:\nReasoning: Fine.\nScore: 4\n"
+                "Image 2:\nReasoning: Out of range.\nScore: 9\n"
+                "Image 3:\nReasoning: First answer.\nScore: 2\n"
+                "Image 3:\nReasoning: Second answer.\nScore: 5\n")
+    # Image 2's score is out of range, Image 3 is answered twice and Image 4 not at all
+    assert parse_batch_screenshot_scores(response, 4) == [("Fine.", 4), None, None, None]
+
+def test_lone_image_without_label():
+    assert parse_batch_screenshot_scores("Reasoning: Cart page.\nScore: 3", 1) == [("Cart page.", 3)]
+    assert parse_batch_screenshot_scores("Reasoning: Cart page.\nScore: 3", 2) == [None, None]
+
+def test_score_in_reasoning_is_not_taken_for_the_block_score():
+    response = "Image 1:\nReasoning: Rated Score: 5 by users, but unrelated.\nScore: 1\n"
+    assert parse_batch_screenshot_scores(response, 1)[0][1] == 1
@@ -0,0 +1,91 @@
+import json
+import base64
+
+import pytest
+
+from trajectory_stream import Trajectory, TrajectoryError, iter_multipart
+
+BOUNDARY = "frame-boundary"
+FRAMES = [b"\x89PNG first frame", b"\x89PNG second\r\n-- frame with a near-delimiter", b""]
+ACTION_HISTORY = [{"command": "CLICK"}, {"command": "TYPE", "text": "36 inch"}]
+
+class FakeResponse:
+    def __init__(self, body, content_type, chunk_size):
+        self.body = body
+        self.headers = {"Content-Type": content_type}
+        self.chunk_size = chunk_size
+        self.closed = False
+
+    def iter_content(self, chunk_size=1):
+        # Ignores the requested size, so the test decides where chunks split
+        for start in range(0, len(self.body), self.chunk_size):
+            yield self.body[start:start + self.chunk_size]
+
+    def close(self):
+        self.closed = True
+
+def multipart_body(frames=FRAMES, action_history=ACTION_HISTORY, boundary=BOUNDARY):
+    parts = [b"preamble to ignore"]
+    for frame in frames:
+        parts.append(f"\r\n--{boundary}\r\nContent-Type: image/png\r\n\r\n".encode() + frame)
+    parts.append(f"\r\n--{boundary}\r\nContent-Type: application/json\r\n\r\n".encode()
+                 + json.dumps({"action_history": action_history}).encode())
+    parts.append(f"\r\n--{boundary}--\r\n".encode())
+    return b"".join(parts)
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 7, 16, 1 << 20])
+def test_multipart_frames_survive_any_chunking(chunk_size):
+    response = FakeResponse(multipart_body(), f'multipart/mixed; boundary="{BOUNDARY}"', chunk_size)
+    trajectory = Trajectory(response)
+    assert list(trajectory.screenshots()) == FRAMES
+    assert trajectory.streamed
+    assert trajectory.action_history == ACTION_HISTORY
+    assert trajectory.screenshot_count == len(FRAMES)
+    # Reading stops at the closing delimiter; what follows it may stay unread
+    assert response.body.rindex(b"--") < trajectory.bytes_received <= len(response.body)
+    assert response.closed
+
+def test_iter_multipart_yields_each_part_as_soon_as_it_is_complete():
+    body = multipart_body()
+    received = []
+
+    def chunks():
+        for start in range(0, len(body), 5):
+            received.append(start + 5)
+            yield body[start:start + 5]
+
+    parts = iter_multipart(chunks(), BOUNDARY.encode())
+    headers, first = next(parts)
+    assert headers["content-type"] == "image/png"
+    assert first == FRAMES[0]
+    # Only read up to just past the first part's closing delimiter
+    assert received[-1] < body.index(FRAMES[1])
+
+def test_base64_encoded_parts_are_decoded():
+    body = (f"--{BOUNDARY}\r\nContent-Type: image/png\r\nContent-Transfer-Encoding: base64\r\n\r\n".encode()
+            + base64.b64encode(FRAMES[0])
+            + f"\r\n--{BOUNDARY}\r\nContent-Type: application/json\r\n\r\n".encode()
+            + json.dumps({"action_history": []}).encode() + f"\r\n--{BOUNDARY}--".encode())
+    trajectory = Trajectory(FakeResponse(body, f"multipart/mixed; boundary={BOUNDARY}", 4))
+    assert list(trajectory.screenshots()) == [FRAMES[0]]
+
+def test_truncated_stream_is_an_error():
+    body = multipart_body()
+    trajectory = Trajectory(FakeResponse(body[:len(body) // 2], f"multipart/mixed; boundary={BOUNDARY}", 3))
+    with pytest.raises(TrajectoryError):
+        list(trajectory.screenshots())
+
+def test_missing_action_history_is_an_error():
+    body = (f"--{BOUNDARY}\r\nContent-Type: image/png\r\n\r\n".encode() + FRAMES[0]
+            + f"\r\n--{BOUNDARY}--".encode())
+    trajectory = Trajectory(FakeResponse(body, f"multipart/mixed; boundary={BOUNDARY}", 3))
+    with pytest.raises(TrajectoryError, match="action history"):
+        list(trajectory.screenshots())
+
+def test_json_trajectory():
+    screenshots = [base64.b64encode(frame).decode() for frame in FRAMES]
+    body = json.dumps({"action_history": ACTION_HISTORY, "screenshots_base64": screenshots}).encode()
+    trajectory = Trajectory(FakeResponse(body, "application/json", 10))
+    assert list(trajectory.screenshots()) == screenshots
+    assert not trajectory.streamed
+    assert trajectory.action_history == ACTION_HISTORY
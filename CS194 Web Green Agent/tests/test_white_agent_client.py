@@ -0,0 +1,97 @@
+import time
+import socket
+import threading
+
+import pytest
+import requests
+
+from white_agent_client import CircuitBreaker, CircuitOpenError, WhiteAgentClient
+
+def closed_port_url():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return f"http://127.0.0.1:{s.getsockname()[1]}"
+
+def hang_up_server():
+    """A server that reads each request and closes the connection without answering."""
+    listener = socket.socket()
+    listener.bind(("127.0.0.1", 0))
+    listener.listen()
+    accepted = []
+
+    def serve():
+        while True:
+            try:
+                connection, _ = listener.accept()
+            except OSError:
+                return
+            accepted.append(1)
+            connection.recv(65536)
+            connection.close()
+
+    threading.Thread(target=serve, daemon=True).start()
+    return f"http://127.0.0.1:{listener.getsockname()[1]}", accepted, listener
+
+def test_breaker_lets_one_trial_call_through_after_the_cool_down():
+    breaker = CircuitBreaker(failure_threshold=2, reset_seconds=0.05)
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_failure()
+    assert not breaker.allow() and breaker.is_open()
+    time.sleep(0.06)
+    assert breaker.allow()
+    assert breaker.summary()["state"] == "half_open"
+    # Only the trial call; everything else waits for its outcome
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.summary() == {"state": "closed", "consecutive_failures": 0, "times_opened": 1}
+    assert breaker.allow()
+
+def test_failed_trial_call_opens_the_breaker_again():
+    breaker = CircuitBreaker(failure_threshold=5, reset_seconds=0.05)
+    for _ in range(5):
+        breaker.record_failure()
+    time.sleep(0.06)
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.is_open()
+    assert not breaker.allow()
+    assert breaker.summary()["times_opened"] == 2
+
+def test_trial_call_raising_anything_else_still_settles_the_breaker():
+    client = WhiteAgentClient(failure_threshold=1, reset_seconds=0.05)
+    url = "http://white-agent.invalid"
+    client.record_failure(url)
+    assert not client.available(url)
+    time.sleep(0.06)
+
+    def broken_post(*args, **kwargs):
+        raise TypeError("unexpected keyword argument")
+
+    client._participant(url).session.post = broken_post
+    with pytest.raises(TypeError):
+        client.post(url, "/run_task")
+    # Re-opened rather than stuck half-open
+    assert not client.available(url)
+    with pytest.raises(CircuitOpenError):
+        client.post(url, "/run_task")
+
+def test_refused_connections_are_retried():
+    client = WhiteAgentClient(retries=2, backoff_base=0.001, failure_threshold=0)
+    url = closed_port_url()
+    with pytest.raises(requests.ConnectionError):
+        client.post(url, "/run_task", json={})
+    stats = client.stats()[url]
+    assert (stats["attempts"], stats["retries"], stats["failures"]) == (3, 2, 1)
+
+def test_connection_dropped_after_sending_is_not_retried():
+    client = WhiteAgentClient(retries=2, backoff_base=0.001, failure_threshold=0)
+    url, accepted, listener = hang_up_server()
+    try:
+        with pytest.raises(requests.ConnectionError):
+            client.post(url, "/run_task", json={})
+    finally:
+        listener.close()
+    # The white agent may already be running the task, so it is only sent once
+    assert len(accepted) == 1
+    assert client.stats()[url]["attempts"] == 1
@@ -1,27 +1,77 @@
 import base64
+import json
 import os
-from flask import Flask, request, jsonify
+import re
+import uuid
+import threading
+from flask import Flask, Response, request
 
 app = Flask(__name__)
 
-def load_screenshots_from_disk(folder_name):
-    screenshots = []
+# The run's screenshots are read once, in step order (step_2 before
+# step_10), and both response bodies are built ahead of time: the JSON
+# document with base64 screenshots, and the multipart/mixed stream with one
+# raw image part per screenshot followed by a JSON part with the action
+# history. Requests are answered with those bytes as they are. If a
+# screenshot in the run folder is added, removed or modified, the bodies are
+# rebuilt on the next request.
+def step_number(filename):
+    match = re.search(r"(\d+)", filename)
+    return int(match.group(1)) if match else -1
+
+def list_screenshots(folder_name):
+    """[(filename, mtime, size)] of the screenshots in a run folder, in step order."""
     if not os.path.isdir(folder_name):
-        print(f"Error: Screenshot folder '{folder_name}' not found.")
         return []
-    files = sorted(os.listdir(folder_name))
-    for filename in files:
-        if filename.endswith(".png") or filename.endswith(".jpg"):
-            file_path = os.path.join(folder_name, filename)
+    entries = []
+    for entry in os.scandir(folder_name):
+        if entry.name.endswith(".png") or entry.name.endswith(".jpg"):
+            stat = entry.stat()
+            entries.append((entry.name, stat.st_mtime_ns, stat.st_size))
+    return sorted(entries, key=lambda e: (step_number(e[0]), e[0]))
+
+class TrajectoryCache:
+    def __init__(self, folder_name, action_history):
+        self.folder_name = folder_name
+        self.action_history = action_history
+        self._files = None
+        self._bodies = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        """(json_body, multipart_chunks, boundary, multipart_length), rebuilt if the run folder changed."""
+        files = list_screenshots(self.folder_name)
+        with self._lock:
+            if files != self._files:
+                self._bodies = self._build(files)
+                self._files = files
+            return self._bodies
+
+    def _build(self, files):
+        if not os.path.isdir(self.folder_name):
+            print(f"Error: Screenshot folder '{self.folder_name}' not found.")
+        boundary = uuid.uuid4().hex
+        screenshots_base64, chunks = [], []
+        for filename, _, _ in files:
+            file_path = os.path.join(self.folder_name, filename)
             try:
                 with open(file_path, "rb") as f:
                     img_bytes = f.read()
-                    b64_string = base64.b64encode(img_bytes).decode('utf-8')
-                    screenshots.append(b64_string)
             except Exception as e:
                 print(f"Error loading screenshot {file_path}: {e}")
-    print(f"Loaded {len(screenshots)} screenshots from {folder_name}")
-    return screenshots
+                continue
+            screenshots_base64.append(base64.b64encode(img_bytes).decode('utf-8'))
+            content_type = "image/png" if filename.endswith(".png") else "image/jpeg"
+            chunks.append(f"--{boundary}\r\nContent-Type: {content_type}\r\n"
+                          f"Content-Disposition: attachment; filename=\"{filename}\"\r\n\r\n".encode()
+                          + img_bytes + b"\r\n")
+        chunks.append(f"--{boundary}\r\nContent-Type: application/json\r\n\r\n".encode()
+                      + json.dumps({"action_history": self.action_history}).encode()
+                      + f"\r\n--{boundary}--\r\n".encode())
+        json_body = json.dumps({"action_history": self.action_history,
+                                "screenshots_base64": screenshots_base64}).encode()
+        print(f"Loaded {len(screenshots_base64)} screenshots from {self.folder_name}")
+        return json_body, tuple(chunks), boundary, sum(len(chunk) for chunk in chunks)
 
 # Static careless action history
 CARELESS_ACTION_HISTORY = [
@@ -72,17 +122,23 @@ CARELESS_ACTION_HISTORY = [
     {"command": "END_TASK"}
 ]
 
+# Built at startup so the first request doesn't pay for it
+trajectory_cache = TrajectoryCache("careless_run", CARELESS_ACTION_HISTORY)
+trajectory_cache.get()
+
 @app.route('/run_task', methods=['POST'])
 def run_task():
     data = request.json
     task_description = data.get('task_description', '')
     
+    json_body, chunks, boundary, multipart_length = trajectory_cache.get()
+    if "multipart/mixed" in request.headers.get("Accept", ""):
+        print("CarelessStaticAgent: Streaming 'CARELESS' trajectory with real screenshots.")
+        return Response(chunks, content_type=f"multipart/mixed; boundary={boundary}",
+                        headers={"Content-Length": str(multipart_length)})
+
     print("CarelessStaticAgent: Returning 'CARELESS' trajectory with real screenshots.")
-    screenshots = load_screenshots_from_disk("careless_run")
-    return jsonify({
-        "action_history": CARELESS_ACTION_HISTORY,
-        "screenshots_base64": screenshots
-    }), 200
+    return Response(json_body, content_type="application/json")
 
 if __name__ == '__main__':
     app.run(port=6002)
\ No newline at end of file
@@ -0,0 +1,337 @@
+import os
+import re
+import ast
+import json
+import time
+import uuid
+import base64
+import random
+import argparse
+import threading
+from flask import Flask, Response, request, jsonify
+
+# One white agent that replays every recorded run it can find, each under
+# its own participant URL, so the green agent can be driven by many
+# participants from a single process:
+#
+#   http://127.0.0.1:6100/runs/<run>                  one participant per run
+#   http://127.0.0.1:6100/runs/<run>/agents/<name>    any number of extra
+#                                                     participants replaying it
+#
+# Runs are found by walking the white_agents folder (or --root) for *_run
+# folders of screenshots. The action history comes from an
+# action_history.json next to the screenshots, or else from the
+# <KIND>_ACTION_HISTORY literal in the static white agent script beside the
+# folder. --archive also replays the complete runs of a green agent's
+# screenshot archive. GET /runs lists everything with its participant URL.
+# Runs recorded since startup are picked up by walking the folders again,
+# at most once every --rescan-seconds, so requests for unknown names do not
+# each walk the whole tree.
+#
+# Like the static white agents, a run's answers (JSON and multipart/mixed)
+# are built once and rebuilt when its files change. --latency-ms,
+# --step-ms and --bandwidth-kbps make the replay behave more like a real
+# browsing agent: a delay before answering, a delay per step (between
+# streamed screenshots, or added up front for JSON), and a cap on the
+# transfer rate of each response.
+
+app = Flask(__name__)
+
+WHITE_AGENTS_DIR = os.path.dirname(os.path.abspath(__file__))
+SEND_CHUNK_SIZE = 64 * 1024
+
+def step_number(filename):
+    match = re.search(r"(\d+)", filename)
+    return int(match.group(1)) if match else -1
+
+def slug(text):
+    return re.sub(r"[^a-z0-9]+", "-", text.lower()).strip("-")
+
+def script_action_history(agent_dir, kind):
+    """The <KIND>_ACTION_HISTORY literal of a static white agent script in agent_dir, or None."""
+    for filename in sorted(os.listdir(agent_dir)):
+        if not filename.endswith(".py"):
+            continue
+        try:
+            with open(os.path.join(agent_dir, filename), "r", encoding="utf-8") as f:
+                tree = ast.parse(f.read())
+        except (OSError, SyntaxError, ValueError):
+            continue
+        for node in tree.body:
+            if (isinstance(node, ast.Assign) and len(node.targets) == 1
+                    and isinstance(node.targets[0], ast.Name)
+                    and node.targets[0].id == f"{kind.upper()}_ACTION_HISTORY"):
+                return ast.literal_eval(node.value)
+    return None
+
+class RecordedRun:
+    """A run folder of screenshots and its action history."""
+    def __init__(self, name, folder, action_history=None, history_source=None):
+        self.name = name
+        self.folder = folder
+        self.action_history = action_history
+        self.history_source = history_source  # file the action history is read from, if not given
+
+    def files(self):
+        """[(path, mtime, size)] of the screenshots (and the action history file), in step order."""
+        entries = []
+        for entry in os.scandir(self.folder):
+            if entry.name.endswith((".png", ".jpg", ".jpeg")):
+                stat = entry.stat()
+                entries.append((entry.path, stat.st_mtime_ns, stat.st_size))
+        entries.sort(key=lambda e: (step_number(os.path.basename(e[0])), e[0]))
+        if self.history_source:
+            stat = os.stat(self.history_source)
+            entries.append((self.history_source, stat.st_mtime_ns, stat.st_size))
+        return entries
+
+    def load(self):
+        """(action_history, [(filename, image bytes)]) as recorded."""
+        screenshots = []
+        for path, _, _ in self.files():
+            if path == self.history_source:
+                continue
+            with open(path, "rb") as f:
+                screenshots.append((os.path.basename(path), f.read()))
+        action_history = self.action_history
+        if self.history_source:
+            with open(self.history_source, "r", encoding="utf-8") as f:
+                action_history = json.load(f)
+            if isinstance(action_history, dict):
+                action_history = action_history.get("action_history", [])
+        return action_history, screenshots
+
+class ArchivedRun(RecordedRun):
+    """A complete run from a green agent's screenshot archive (runs/<id>.json plus objects/)."""
+    def __init__(self, name, archive_root, manifest_path):
+        super().__init__(name, archive_root)
+        self.manifest_path = manifest_path
+
+    def files(self):
+        stat = os.stat(self.manifest_path)
+        return [(self.manifest_path, stat.st_mtime_ns, stat.st_size)]
+
+    def load(self):
+        with open(self.manifest_path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        screenshots = []
+        for shot in sorted(manifest.get("screenshots", []), key=lambda s: s["index"]):
+            name = shot["object"]
+            with open(os.path.join(self.folder, "objects", name[:2], name), "rb") as f:
+                screenshots.append((f"step_{shot['index'] + 1}{os.path.splitext(name)[1]}", f.read()))
+        return manifest.get("action_history") or [], screenshots
+
+def discover_runs(roots, archives=()):
+    """{name: RecordedRun} for every run folder under roots and every complete run in archives."""
+    runs = {}
+    for root in roots:
+        for dirpath, dirnames, filenames in os.walk(root):
+            dirnames.sort()
+            if not os.path.basename(dirpath).endswith("_run"):
+                continue
+            if not any(f.endswith((".png", ".jpg", ".jpeg")) for f in filenames):
+                continue
+            kind = os.path.basename(dirpath)[:-len("_run")]
+            agent_dir = os.path.dirname(dirpath)
+            group = os.path.relpath(os.path.dirname(agent_dir), root)
+            group = "" if group == "." else group.replace("white agents", "")
+            name = slug(f"{group} {kind}") or slug(kind)
+            history_file = os.path.join(dirpath, "action_history.json")
+            if os.path.exists(history_file):
+                run = RecordedRun(name, dirpath, history_source=history_file)
+            else:
+                action_history = script_action_history(agent_dir, kind)
+                if action_history is None:
+                    print(f"Skipping {dirpath}: no action_history.json or {kind.upper()}_ACTION_HISTORY found")
+                    continue
+                run = RecordedRun(name, dirpath, action_history=action_history)
+            if name in runs:
+                name = run.name = slug(os.path.relpath(dirpath, root))
+            runs[name] = run
+    for archive in archives:
+        runs_dir = os.path.join(archive, "runs")
+        if not os.path.isdir(runs_dir):
+            continue
+        for filename in sorted(os.listdir(runs_dir)):
+            if not filename.endswith(".json"):
+                continue
+            path = os.path.join(runs_dir, filename)
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    complete = json.load(f).get("complete", False)
+            except (OSError, ValueError):
+                continue
+            if complete:
+                name = f"archive-{filename[:-len('.json')]}"
+                runs[name] = ArchivedRun(name, archive, path)
+    return runs
+
+class ReplayCache:
+    """Pre-built answers per run, rebuilt when the run's files change."""
+    def __init__(self):
+        self._entries = {}  # run name -> (files, answers)
+        self._lock = threading.Lock()
+
+    def get(self, run):
+        """{"json", "chunks", "boundary", "multipart_length", "screenshots"} for a run."""
+        files = run.files()
+        with self._lock:
+            entry = self._entries.get(run.name)
+            if entry is not None and entry[0] == files:
+                return entry[1]
+        answers = self._build(run)
+        with self._lock:
+            self._entries[run.name] = (files, answers)
+        return answers
+
+    @staticmethod
+    def _build(run):
+        action_history, screenshots = run.load()
+        boundary = uuid.uuid4().hex
+        chunks = []
+        for filename, img_bytes in screenshots:
+            content_type = "image/jpeg" if filename.endswith((".jpg", ".jpeg")) else "image/png"
+            chunks.append(f"--{boundary}\r\nContent-Type: {content_type}\r\n"
+                          f"Content-Disposition: attachment; filename=\"{filename}\"\r\n\r\n".encode()
+                          + img_bytes + b"\r\n")
+        chunks.append(f"--{boundary}\r\nContent-Type: application/json\r\n\r\n".encode()
+                      + json.dumps({"action_history": action_history}).encode()
+                      + f"\r\n--{boundary}--\r\n".encode())
+        json_body = json.dumps({"action_history": action_history,
+                                "screenshots_base64": [base64.b64encode(data).decode("utf-8")
+                                                       for _, data in screenshots]}).encode()
+        print(f"Loaded {len(screenshots)} screenshots for run '{run.name}'")
+        return {"json": json_body, "chunks": tuple(chunks), "boundary": boundary,
+                "multipart_length": sum(len(chunk) for chunk in chunks), "screenshots": len(screenshots)}
+
+class Shaping:
+    def __init__(self, latency_ms=0, jitter_ms=0, step_ms=0, bandwidth_kbps=0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.step_ms = step_ms
+        self.bandwidth_kbps = bandwidth_kbps  # 0 = unlimited
+
+    def enabled(self):
+        return bool(self.latency_ms or self.jitter_ms or self.step_ms or self.bandwidth_kbps)
+
+    def first_byte_delay(self):
+        return max(0.0, self.latency_ms + random.uniform(-self.jitter_ms, self.jitter_ms)) / 1000
+
+    def send(self, chunks, step_delays):
+        """Yields chunks in pieces, sleeping step_delays[i] before chunk i and pacing to the bandwidth cap."""
+        bytes_per_second = self.bandwidth_kbps * 1000 / 8
+        for chunk, delay in zip(chunks, step_delays):
+            if delay:
+                time.sleep(delay)
+            if not bytes_per_second:
+                yield chunk
+                continue
+            for start in range(0, len(chunk), SEND_CHUNK_SIZE):
+                piece = chunk[start:start + SEND_CHUNK_SIZE]
+                time.sleep(len(piece) / bytes_per_second)
+                yield piece
+
+roots = [WHITE_AGENTS_DIR]
+archives = []
+shaping = Shaping()
+replay_cache = ReplayCache()
+runs = {}
+runs_lock = threading.Lock()
+requests_served = {}  # participant path -> count
+rescan_seconds = 5.0
+last_scan = 0.0  # time.monotonic() of the last walk
+scan_lock = threading.Lock()
+
+def rescan():
+    """Walks the roots again unless that was done in the last rescan_seconds."""
+    global runs, last_scan
+    # One walk at a time, and not under runs_lock, so known runs keep being served meanwhile
+    with scan_lock:
+        if time.monotonic() - last_scan < rescan_seconds:
+            return
+        found = discover_runs(roots, archives)
+        with runs_lock:
+            runs = found
+        last_scan = time.monotonic()
+
+def find_run(name):
+    with runs_lock:
+        run = runs.get(name)
+    if run is None:
+        # Perhaps a run recorded since the last walk
+        rescan()
+        with runs_lock:
+            run = runs.get(name)
+    return run
+
+def replay(run_name, participant):
+    run = find_run(run_name)
+    if run is None:
+        return jsonify({"error": f"No recorded run named '{run_name}'"}), 404
+    with runs_lock:
+        requests_served[participant] = requests_served.get(participant, 0) + 1
+    answers = replay_cache.get(run)
+    streamed = "multipart/mixed" in request.headers.get("Accept", "")
+    print(f"ReplayAgent: {'Streaming' if streamed else 'Returning'} run '{run.name}' to {participant}.")
+
+    if streamed:
+        chunks, headers = answers["chunks"], {"Content-Length": str(answers["multipart_length"])}
+        content_type = f"multipart/mixed; boundary={answers['boundary']}"
+        # One step per screenshot part, nothing before the closing JSON part
+        step_delays = [shaping.step_ms / 1000] * (len(chunks) - 1) + [0]
+    else:
+        chunks, headers = (answers["json"],), {"Content-Length": str(len(answers["json"]))}
+        content_type = "application/json"
+        # The whole run has to be over before a JSON answer can be sent
+        step_delays = [shaping.step_ms / 1000 * answers["screenshots"]]
+    if not shaping.enabled():
+        return Response(chunks, content_type=content_type, headers=headers)
+    time.sleep(shaping.first_byte_delay())
+    return Response(shaping.send(chunks, step_delays), content_type=content_type, headers=headers)
+
+@app.route('/runs/<run_name>/run_task', methods=['POST'])
+def run_task(run_name):
+    return replay(run_name, f"/runs/{run_name}")
+
+@app.route('/runs/<run_name>/agents/<agent>/run_task', methods=['POST'])
+def agent_run_task(run_name, agent):
+    return replay(run_name, f"/runs/{run_name}/agents/{agent}")
+
+@app.route('/runs', methods=['GET'])
+def list_runs():
+    """Every run that can be replayed, with its participant URL and folder."""
+    rescan()
+    with runs_lock:
+        listed = [{"name": run.name, "participant_url": f"{request.host_url}runs/{run.name}",
+                   "folder": run.folder, "archived": isinstance(run, ArchivedRun)} for run in runs.values()]
+        served = dict(requests_served)
+    return jsonify({"runs": listed, "requests_served": served})
+
+def main():
+    global roots, archives, shaping, runs, rescan_seconds, last_scan
+    parser = argparse.ArgumentParser(description="Replays recorded white agent runs, one participant URL per run")
+    parser.add_argument("--port", type=int, default=6100, help="Port to listen on (default 6100)")
+    parser.add_argument("--root", action="append",
+                        help="Folder to search for *_run folders (repeatable, default: the white_agents folder)")
+    parser.add_argument("--archive", action="append", default=[],
+                        help="Green agent screenshot archive whose complete runs are replayed too (repeatable)")
+    parser.add_argument("--latency-ms", type=float, default=0, help="Delay before answering")
+    parser.add_argument("--jitter-ms", type=float, default=0, help="Random +/- variation of --latency-ms")
+    parser.add_argument("--step-ms", type=float, default=0, help="Delay per step of the run")
+    parser.add_argument("--bandwidth-kbps", type=float, default=0, help="Transfer rate cap per response (0 = none)")
+    parser.add_argument("--rescan-seconds", type=float, default=5,
+                        help="Minimum time between searches for newly recorded runs (default 5)")
+    args = parser.parse_args()
+    roots = [os.path.abspath(root) for root in (args.root or [WHITE_AGENTS_DIR])]
+    archives = [os.path.abspath(archive) for archive in args.archive]
+    shaping = Shaping(args.latency_ms, args.jitter_ms, args.step_ms, args.bandwidth_kbps)
+    rescan_seconds = args.rescan_seconds
+    runs = discover_runs(roots, archives)
+    last_scan = time.monotonic()
+    for run in runs.values():
+        replay_cache.get(run)
+        print(f"  http://127.0.0.1:{args.port}/runs/{run.name}")
+    app.run(port=args.port, threaded=True)
+
+if __name__ == '__main__':
+    main()